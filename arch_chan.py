@@ -1,61 +1,89 @@
 # gui_chatbot.py
+import time
+_MODULE_LOAD_START = time.perf_counter()
 import sys
 import socket
-import threading
 import os
+import queue
+import json
+import secrets
+import selectors
+import threading
+from collections import deque
+from typing import Deque, Optional, Tuple
 from PyQt5.QtWidgets import (QApplication, QWidget, QVBoxLayout, QHBoxLayout,
-                           QLabel, QComboBox, QTextEdit, QLineEdit, QPushButton,
+                           QLabel, QComboBox, QLineEdit, QPushButton,
                            QMessageBox, QGraphicsBlurEffect)
 from PyQt5.QtGui import QPixmap, QFont, QIcon
-from PyQt5.QtCore import Qt, QThread, pyqtSignal
+from PyQt5.QtCore import Qt, QThread, QObject, QTimer, pyqtSignal
 import logging
-import time
-from gtts import gTTS
-import pygame
-
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(levelname)s - %(message)s'
-)
+from audio_engine import AudioEngine
+from transcript_view import TranscriptView
+# Every message in either direction ends with FRAME_END, so non-blocking reads can reassemble
+# responses that arrive split across several recv() calls.
+from arch_chan_client import FRAME_END, parse_response
+from log_setup import setup_logging
+
+setup_logging("arch_chan")
 logger = logging.getLogger(__name__)
 
+IMPORT_TIME_MS = (time.perf_counter() - _MODULE_LOAD_START) * 1000
+
 # Global variable for language, managed by the GUI
 language = "English"
 
-def play_voice(text, volume=1.0, lang="en"):
-    # Create temp_voice directory if it doesn't exist
-    if not os.path.exists("temp_voice"):
-        os.makedirs("temp_voice")
-
-    # Generate and save the speech file
-    tts = gTTS(text, lang=lang)
-    tts.save("temp_voice/voice.mp3")
+# Set by benchmarks/startup_bench.py: report import time and time-to-first-paint, then exit.
+STARTUP_BENCH = os.getenv("ARCH_CHAN_STARTUP_BENCH") == "1"
 
-    # Initialize pygame mixer
-    pygame.mixer.init()
+SCALED_ASSET_CACHE_DIR = os.path.join(os.path.expanduser("~"), ".cache", "arch-chan", "assets")
 
-    # Load the audio file
-    pygame.mixer.music.load("temp_voice/voice.mp3")
+def load_scaled_pixmap(image_path: str, height: int) -> QPixmap:
+    # Smooth-scaling the header image on every launch is slow, so the scaled copy is cached
+    # under a name derived from the source's size and mtime (a changed source gets a new entry).
+    st = os.stat(image_path)
+    base_name = os.path.splitext(os.path.basename(image_path))[0]
+    cached_path = os.path.join(SCALED_ASSET_CACHE_DIR, f"{base_name}-{st.st_size}-{int(st.st_mtime)}-h{height}.png")
+    if os.path.exists(cached_path):
+        pixmap = QPixmap(cached_path)
+        if not pixmap.isNull():
+            return pixmap
 
-    # Set volume (0.0 to 1.0)
-    pygame.mixer.music.set_volume(min(1.0, max(0.0, volume)))
-
-    # Start playing
-    pygame.mixer.music.play()
+    pixmap = QPixmap(image_path).scaledToHeight(height, Qt.SmoothTransformation)
+    try:
+        os.makedirs(SCALED_ASSET_CACHE_DIR, exist_ok=True)
+        pixmap.save(cached_path, "PNG")
+    except OSError as e:
+        logger.warning(f"Could not cache scaled image {cached_path}: {e}")
+    return pixmap
 
-    # Wait for playback to finish
-    while pygame.mixer.music.get_busy():
-        time.sleep(0.1)
+# The session token lets the server resume this GUI's chat history after a reconnect or restart.
+SESSION_TOKEN_PATH = os.path.join(os.path.expanduser("~"), ".config", "arch-chan", "session_token")
 
-    # Stop and quit mixer to release resources
-    pygame.mixer.music.stop()
-    pygame.mixer.quit()
-    
-    # Clean up the temporary voice file
+def load_session_token() -> str:
     try:
-        os.remove("temp_voice/voice.mp3")
+        with open(SESSION_TOKEN_PATH, 'r') as f:
+            token = f.read().strip()
+        if token:
+            return token
+    except OSError:
+        pass
+
+    token = secrets.token_urlsafe(24)
+    try:
+        os.makedirs(os.path.dirname(SESSION_TOKEN_PATH), exist_ok=True)
+        with open(SESSION_TOKEN_PATH, 'w') as f:
+            f.write(token)
     except OSError as e:
-        logger.error(f"Error removing temp voice file: {e}")
+        logger.warning(f"Could not save session token, history will not survive a restart: {e}")
+    return token
+
+# Connection attempts back off exponentially until the server is up (it may still be starting).
+SERVER_PORT = int(os.getenv("ARCH_CHAN_PORT", "12345"))
+CONNECT_TIMEOUT = float(os.getenv("ARCH_CHAN_CONNECT_TIMEOUT", "60"))
+CONNECT_INITIAL_DELAY = 0.05
+CONNECT_MAX_DELAY = 2.0
+# Outbound messages waiting for the I/O thread; further sends are refused until it drains.
+MAX_PENDING_MESSAGES = 32
 
 class ClientHandler(QThread):
     # Signals for communication with the GUI thread
@@ -63,132 +91,313 @@ class ClientHandler(QThread):
     connection_status_changed = pyqtSignal(bool)
     error_occurred = pyqtSignal(str)
 
-    def __init__(self, host='127.0.0.1', port=12345):
+    def __init__(self, host='127.0.0.1', port=SERVER_PORT):
         super().__init__()
         self.host = host
         self.port = port
         self.socket: socket.socket = None
         self.running = True
         self.connected = False
+        # Connection state last shown in the GUI. A quiet reconnect (after the server reaped an idle
+        # connection) doesn't change it, and messages typed meanwhile wait in the queue.
+        self.online = False
+        self.session_token = load_session_token()
+        # The socket is owned by this thread; the GUI thread only puts messages on the
+        # outbound queue and pokes the wake-up socket so the selector notices them.
+        self._outbound: "queue.Queue[Tuple[bytes, float, str]]" = queue.Queue(maxsize=MAX_PENDING_MESSAGES)
+        # Messages not completely sent when the connection dropped; they go out first after reconnecting.
+        self._resend: Deque[Tuple[bytes, float, str]] = deque()
+        self._wake_r, self._wake_w = socket.socketpair()
+        self._wake_r.setblocking(False)
+        self._wake_w.setblocking(False)
+        self._send_latencies: Deque[float] = deque(maxlen=500)
+        self._stop_event = threading.Event()
 
     def run(self):
-        self.connect_to_server()
-        if self.connected:
+        # Keeps the connection up: connects with backoff and reconnects if the server goes away
+        # (e.g. it was restarted or closed this connection after the idle timeout).
+        while self.running:
+            self.connect_to_server()
+            if not self.connected:
+                break
             self.listen_for_responses()
+            if self.running:
+                logger.info("Connection lost. Reconnecting...")
 
-    def connect_to_server(self):
-        try:
-            self.socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-            self.socket.settimeout(5)  # Set a timeout for connection attempts
-            self.socket.connect((self.host, self.port))
-            self.socket.settimeout(None) # Remove timeout after successful connection
-            self.connected = True
-            self.connection_status_changed.emit(True)
-            logger.info("Connected to server.")
-        except socket.timeout:
-            self.error_occurred.emit("Connection timed out. Server might not be running.")
-            self.connected = False
-            self.connection_status_changed.emit(False)
-            logger.error("Connection timed out.")
-        except ConnectionRefusedError:
-            self.error_occurred.emit("Connection refused. Server might not be running or is unreachable.")
-            self.connected = False
-            self.connection_status_changed.emit(False)
-            logger.error("Connection refused.")
-        except Exception as e:
-            self.error_occurred.emit(f"Failed to connect to server: {e}")
-            self.connected = False
-            self.connection_status_changed.emit(False)
-            logger.critical(f"Failed to connect: {e}", exc_info=True)
+    def _sleep(self, seconds: float) -> bool:
+        # Interruptible wait; returns False once stop() was requested.
+        return not self._stop_event.wait(seconds)
 
-    def listen_for_responses(self):
-        while self.running and self.connected:
+    def connect_to_server(self):
+        deadline = time.monotonic() + CONNECT_TIMEOUT
+        delay = CONNECT_INITIAL_DELAY
+        attempts = 0
+        last_error: Optional[Exception] = None
+        while self.running:
+            attempts += 1
             try:
-                data = self.socket.recv(4096).decode('utf-8')
-                if not data:
-                    logger.info("Server disconnected.")
-                    self.connected = False
-                    self.connection_status_changed.emit(False)
-                    self.error_occurred.emit("Server disconnected unexpectedly.")
-                    break
-                
-                parts = data.split('|CONTENT:', 1)
-                if len(parts) < 2:
-                    logger.warning(f"Malformed response from server: {data}")
-                    self.response_received.emit("ERROR", "Received malformed response from server.", "", "")
-                    continue
-
-                type_part = parts[0].replace("TYPE:", "").strip()
-                remaining_parts = parts[1].split('|VOICE_TEXT:', 1)
-                
-                if len(remaining_parts) < 2:
-                    logger.warning(f"Malformed response from server (missing VOICE_TEXT): {data}")
-                    self.response_received.emit("ERROR", "Received malformed response from server (missing voice text).", "", "")
-                    continue
-                
-                content_part = remaining_parts[0].strip()
-                
-                voice_linux_parts = remaining_parts[1].split('|LINUX_OUTPUT:', 1)
-                if len(voice_linux_parts) < 2:
-                    logger.warning(f"Malformed response from server (missing LINUX_OUTPUT): {data}")
-                    self.response_received.emit("ERROR", "Received malformed response from server (missing linux output).", "", "")
-                    continue
-
-                voice_text_part = voice_linux_parts[0].strip()
-                linux_output_part = voice_linux_parts[1].strip()
-
-                self.response_received.emit(type_part, content_part, voice_text_part, linux_output_part)
-
-            except socket.error as e:
-                if self.running: # Only log as error if we are still supposed to be running
-                    logger.error(f"Socket error while listening: {e}")
-                    self.error_occurred.emit(f"Server communication error: {e}")
-                self.connected = False
-                self.connection_status_changed.emit(False)
-                break
+                self.socket = socket.create_connection((self.host, self.port), timeout=2)
+                self.socket.setblocking(False) # All further I/O goes through the selector
+                self.connected = True
+                self._report_status(True)
+                logger.info(f"Connected to server after {attempts} attempt(s).")
+                return
+            except (socket.timeout, ConnectionRefusedError) as e:
+                last_error = e
             except Exception as e:
-                logger.critical(f"Unhandled error in client handler listen loop: {e}", exc_info=True)
-                self.error_occurred.emit(f"An unexpected error occurred: {e}")
-                self.connected = False
-                self.connection_status_changed.emit(False)
+                last_error = e
+                logger.warning(f"Connection attempt {attempts} failed: {e}")
+
+            if time.monotonic() + delay > deadline or not self._sleep(delay):
                 break
+            delay = min(delay * 2, CONNECT_MAX_DELAY)
 
-    def send_message(self, message: str, lang_pref: str):
-        if self.connected and self.socket:
-            try:
-                full_message = f"LANG:{lang_pref}|MSG:{message}"
-                self.socket.sendall(full_message.encode('utf-8'))
-                logger.info(f"Sent message to server: {message[:100]} (Lang: {lang_pref})")
-            except socket.error as e:
-                self.error_occurred.emit(f"Failed to send message: {e}")
-                self.connected = False
-                self.connection_status_changed.emit(False)
-                logger.error(f"Failed to send message: {e}")
+        self.connected = False
+        if not self.running:
+            return
+        if isinstance(last_error, socket.timeout):
+            self.error_occurred.emit("Connection timed out. Server might not be running.")
+            logger.error(f"Connection timed out after {attempts} attempt(s).")
+        elif isinstance(last_error, ConnectionRefusedError):
+            self.error_occurred.emit("Connection refused. Server might not be running or is unreachable.")
+            logger.error(f"Connection refused after {attempts} attempt(s).")
         else:
+            self.error_occurred.emit(f"Failed to connect to server: {last_error}")
+            logger.critical(f"Failed to connect after {attempts} attempt(s): {last_error}")
+        self._report_status(False)
+
+    def _report_status(self, online: bool):
+        if online != self.online:
+            self.online = online
+            self.connection_status_changed.emit(online)
+
+    def _connection_lost(self, awaiting: int, reason: str):
+        self.connected = False
+        if not awaiting:
+            # Nothing was waiting for a reply (e.g. the server closed an idle connection): reconnect quietly.
+            logger.info(f"{reason} No reply was pending; reconnecting.")
+            return
+        logger.warning(f"{reason} {awaiting} reply(s) were still pending.")
+        self._report_status(False)
+        self.error_occurred.emit(f"{reason} The answer to your last message was lost, please send it again.")
+
+    def _drain_wakeups(self):
+        try:
+            while self._wake_r.recv(512):
+                pass
+        except (BlockingIOError, InterruptedError):
+            pass
+
+    def listen_for_responses(self):
+        selector = selectors.DefaultSelector()
+        selector.register(self.socket, selectors.EVENT_READ)
+        selector.register(self._wake_r, selectors.EVENT_READ)
+        inbound = b""
+        outbound = bytearray()
+        # (stream offset of the message's last byte, message) per message not completely sent yet
+        in_flight: Deque[Tuple[int, Tuple[bytes, float, str]]] = deque()
+        bytes_queued = 0
+        bytes_sent = 0
+        # Messages sent whose reply hasn't arrived; the server answers them in order.
+        awaiting = 0
+        writing = False
+
+        try:
+            while self.running and self.connected:
+                # Only pull more from the queue while the kernel keeps up; otherwise the queue fills
+                # and send_message pushes back on the GUI.
+                while len(outbound) < 64 * 1024:
+                    try:
+                        message = self._resend.popleft() if self._resend else self._outbound.get_nowait()
+                    except queue.Empty:
+                        break
+                    outbound += message[0]
+                    bytes_queued += len(message[0])
+                    in_flight.append((bytes_queued, message))
+
+                if bool(outbound) != writing:
+                    writing = bool(outbound)
+                    events = selectors.EVENT_READ | (selectors.EVENT_WRITE if writing else 0)
+                    selector.modify(self.socket, events)
+
+                for key, mask in selector.select(timeout=1.0):
+                    if key.fileobj is self._wake_r:
+                        self._drain_wakeups()
+                        continue
+
+                    if mask & selectors.EVENT_WRITE and outbound:
+                        try:
+                            sent = self.socket.send(outbound)
+                        except (BlockingIOError, InterruptedError):
+                            sent = 0
+                        del outbound[:sent]
+                        bytes_sent += sent
+                        while in_flight and in_flight[0][0] <= bytes_sent:
+                            _, (_, typed_at, preview) = in_flight.popleft()
+                            awaiting += 1
+                            latency = time.perf_counter() - typed_at
+                            self._send_latencies.append(latency)
+                            logger.info(f"Sent message to server: {preview} (typing-to-send: {latency * 1000:.1f} ms)")
+
+                    if mask & selectors.EVENT_READ:
+                        try:
+                            chunk = self.socket.recv(65536)
+                        except (BlockingIOError, InterruptedError):
+                            continue
+                        if not chunk:
+                            self._connection_lost(awaiting, "Server closed the connection.")
+                            break
+                        inbound += chunk
+                        *frames, inbound = inbound.split(FRAME_END)
+                        awaiting = max(0, awaiting - len(frames))
+                        for frame in frames:
+                            self.response_received.emit(*parse_response(frame.decode('utf-8', errors='replace')))
+
+        except socket.error as e:
+            if self.running: # Only report if we are still supposed to be running
+                self._connection_lost(awaiting, f"Server communication error: {e}.")
+            self.connected = False
+        except Exception as e:
+            logger.critical(f"Unhandled error in client handler listen loop: {e}", exc_info=True)
+            self.error_occurred.emit(f"An unexpected error occurred: {e}")
+            self.connected = False
+            self._report_status(False)
+        finally:
+            # The server drops a partly received message, so anything not completely sent goes again.
+            self._resend.extend(message for _, message in in_flight)
+            if self._resend:
+                logger.info(f"{len(self._resend)} unsent message(s) will be sent after reconnecting.")
+            selector.close()
+            self._close_socket()
+
+    def send_message(self, message: str, lang_pref: str, typed_at: Optional[float] = None) -> bool:
+        # Runs on the GUI thread: never blocks and never touches the server socket.
+        if not self.online:
             self.error_occurred.emit("Not connected to server.")
             logger.warning("Attempted to send message while not connected.")
+            return False
 
-    def stop(self):
-        self.running = False
+        full_message = f"LANG:{lang_pref}|SESSION:{self.session_token}|MSG:{message}"
+        preview = f"{message[:100]} (Lang: {lang_pref})"
+        try:
+            self._outbound.put_nowait((full_message.encode('utf-8') + FRAME_END, typed_at or time.perf_counter(), preview))
+        except queue.Full:
+            self.error_occurred.emit("Still sending earlier messages to the server, please wait a moment.")
+            logger.warning("Outbound queue is full; message was not sent.")
+            return False
+        self._wake()
+        return True
+
+    def _wake(self):
+        try:
+            self._wake_w.send(b"\0")
+        except (BlockingIOError, InterruptedError):
+            pass # A wake-up is already pending
+        except OSError as e:
+            logger.warning(f"Could not wake client I/O thread: {e}")
+
+    def send_latency_stats(self) -> dict:
+        samples = sorted(self._send_latencies)
+        if not samples:
+            return {"count": 0}
+        return {
+            "count": len(samples),
+            "p50_ms": round(samples[len(samples) // 2] * 1000, 2),
+            "p95_ms": round(samples[min(len(samples) - 1, int(len(samples) * 0.95))] * 1000, 2),
+            "max_ms": round(samples[-1] * 1000, 2),
+        }
+
+    def _close_socket(self):
         if self.socket:
             try:
                 self.socket.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+            try:
                 self.socket.close()
                 logger.info("Client socket closed.")
             except OSError as e:
                 logger.warning(f"Error during socket shutdown/close: {e}")
+
+    def stop(self):
+        # The I/O thread closes the socket itself once it sees running == False.
+        self.running = False
+        self._stop_event.set()
+        self._wake()
         self.wait() # Wait for the thread to finish execution
 
+class FrameMonitor(QObject):
+    # Measures how late a 60 Hz timer fires on the GUI thread; anything well above 16.7 ms
+    # means the event loop was blocked and frames were dropped.
+    def __init__(self, parent=None, interval_ms: int = 16):
+        super().__init__(parent)
+        self.interval = interval_ms / 1000
+        self.frames = 0
+        self.late_frames = 0
+        self.max_gap = 0.0
+        self._last = time.perf_counter()
+        self._timer = QTimer(self)
+        self._timer.setTimerType(Qt.PreciseTimer)
+        self._timer.timeout.connect(self._tick)
+        self._timer.start(interval_ms)
+
+    def _tick(self):
+        now = time.perf_counter()
+        gap = now - self._last
+        self._last = now
+        self.frames += 1
+        self.max_gap = max(self.max_gap, gap)
+        if gap > 2 * self.interval:
+            self.late_frames += 1
+            if gap > 0.1:
+                logger.warning(f"GUI event loop stalled for {gap * 1000:.0f} ms")
+
+    def stats(self) -> dict:
+        return {
+            "frames": self.frames,
+            "late_frames": self.late_frames,
+            "max_gap_ms": round(self.max_gap * 1000, 1),
+        }
+
 class ChatBotGUI(QWidget):
     def __init__(self):
         super().__init__()
+        self._first_paint_done = False
         self.init_ui()
+        self.audio_engine = AudioEngine()
+        self.frame_monitor = FrameMonitor(self)
         self.client_handler = ClientHandler()
         self.client_handler.response_received.connect(self.handle_response)
         self.client_handler.connection_status_changed.connect(self.update_connection_status)
         self.client_handler.error_occurred.connect(self.display_error)
+        if not STARTUP_BENCH:
+            # Connecting and starting the audio workers wait until the event loop runs,
+            # so the window is shown first.
+            QTimer.singleShot(0, self.start_background_services)
+
+    def start_background_services(self):
+        self.audio_engine.start()
         self.client_handler.start() # Start the client handler thread
 
+    def paintEvent(self, event):
+        super().paintEvent(event)
+        if not self._first_paint_done:
+            self._first_paint_done = True
+            self.report_first_paint()
+
+    def report_first_paint(self):
+        first_paint_ms = (time.perf_counter() - _MODULE_LOAD_START) * 1000
+        logger.info(f"Startup: module import {IMPORT_TIME_MS:.1f} ms, first paint {first_paint_ms:.1f} ms after import start")
+        if STARTUP_BENCH:
+            launched_at = float(os.getenv("ARCH_CHAN_BENCH_LAUNCH_TIME", "0") or 0)
+            since_launch_ms = (time.time() - launched_at) * 1000 if launched_at else None
+            print("ARCH_CHAN_STARTUP " + json.dumps({
+                "import_ms": round(IMPORT_TIME_MS, 2),
+                "first_paint_ms": round(first_paint_ms, 2),
+                "first_paint_since_launch_ms": round(since_launch_ms, 2) if since_launch_ms is not None else None,
+            }), flush=True)
+            QTimer.singleShot(0, QApplication.quit)
+
     def init_ui(self):
         self.setWindowTitle('Arch-Chan AI Assistant')
         self.setGeometry(100, 100, 800, 600)
@@ -208,8 +417,7 @@ class ChatBotGUI(QWidget):
         image_label = QLabel()
         image_path = os.path.join(script_dir, 'icons', 'arch-chan_bg.png')
         if os.path.exists(image_path):
-            pixmap = QPixmap(image_path)
-            image_label.setPixmap(pixmap.scaledToHeight(150, Qt.SmoothTransformation))
+            image_label.setPixmap(load_scaled_pixmap(image_path, 150))
         else:
             logger.warning(f"Image file not found at {image_path}")
         image_label.setAlignment(Qt.AlignCenter)
@@ -235,9 +443,8 @@ class ChatBotGUI(QWidget):
         lang_layout.addStretch(1) # Push combo to the left
         main_layout.addLayout(lang_layout)
 
-        # Chat display area
-        self.chat_display = QTextEdit()
-        self.chat_display.setReadOnly(True)
+        # Chat display area (only visible messages are laid out; old pages spill to disk)
+        self.chat_display = TranscriptView()
         self.chat_display.setFont(QFont("Monospace", 10))
         self.chat_display.setStyleSheet("background-color: #f0f0f0; border: 1px solid #ddd; padding: 10px;")
         main_layout.addWidget(self.chat_display)
@@ -272,34 +479,32 @@ class ChatBotGUI(QWidget):
         # This will be included with the next user message to the server for processing.
 
     def send_message(self):
+        typed_at = time.perf_counter()
         user_text = self.user_input.text().strip()
         if user_text:
-            self.append_message(f"<b style='color: blue;'>You:</b> {user_text}")
-            self.user_input.clear()
-            # Send message to server via client handler thread
-            self.client_handler.send_message(user_text, language)
+            # Only queues the message; the client handler thread does the socket write
+            if self.client_handler.send_message(user_text, language, typed_at):
+                self.append_message("You", user_text, "blue")
+                self.user_input.clear()
         else:
             QMessageBox.warning(self, "Empty Message", "Please type a message before sending.")
 
     def handle_response(self, response_type: str, content: str, voice_text: str, linux_output: str):
-        self.append_message(f"<b style='color: green;'>Arch-Chan:</b> {content}")
+        self.append_message("Arch-Chan", content, "green")
         
         if linux_output:
-            self.append_message(f"<b style='color: #8B008B;'>Linux Output:</b> <pre>{linux_output}</pre>")
+            self.append_message("Linux Output", linux_output, "#8B008B", preformatted=True)
         
-        # Play voice in a separate thread to avoid blocking the GUI
-        voice_thread = threading.Thread(target=play_voice, args=(voice_text, 1.0, self.get_lang_code()))
-        voice_thread.start()
+        # Voice is synthesized and played in order by the audio engine's worker thread
+        self.audio_engine.speak(voice_text, self.get_lang_code())
 
     def get_lang_code(self) -> str:
         if language == "Türkçe":
             return "tr"
         return "en"
 
-    def append_message(self, message: str):
-        self.chat_display.append(message)
-        # Scroll to the bottom
-        self.chat_display.verticalScrollBar().setValue(self.chat_display.verticalScrollBar().maximum())
+    def append_message(self, sender: str, text: str, color: str, preformatted: bool = False):
+        self.chat_display.append_message(sender, text, color, preformatted)
 
     def update_connection_status(self, connected: bool):
         if connected:
@@ -308,18 +513,18 @@ class ChatBotGUI(QWidget):
             self.send_button.setEnabled(True)
             self.user_input.setEnabled(True)
             self.user_input.setPlaceholderText("Type your message here...")
-            self.append_message("<b style='color: green;'>Arch-Chan:</b> I'm connected and ready to help, nya~!")
+            self.append_message("Arch-Chan", "I'm connected and ready to help, nya~!", "green")
         else:
             self.status_label.setText("Disconnected (Server Offline)")
             self.status_label.setStyleSheet("color: red;")
             self.send_button.setEnabled(False)
             self.user_input.setEnabled(False)
-            self.user_input.setPlaceholderText("Disconnected. Please restart the server and application.")
-            self.append_message("<b style='color: red;'>Arch-Chan:</b> Oh no! I lost connection to the server, sweetie! Please make sure the server is running.")
+            self.user_input.setPlaceholderText("Disconnected. Trying to reconnect...")
+            self.append_message("Arch-Chan", "Oh no! I lost connection to the server, sweetie! I'll keep trying to reconnect, please make sure the server is running.", "red")
 
     def display_error(self, message: str):
         # Display errors in the chat window and also show a QMessageBox for critical errors
-        self.append_message(f"<b style='color: red;'>ERROR:</b> {message}")
+        self.append_message("ERROR", message, "red")
         logger.error(f"GUI Error: {message}")
         # QMessageBox.warning(self, "Application Error", message) # Only for critical errors
 
@@ -333,6 +538,11 @@ class ChatBotGUI(QWidget):
                 logger.warning("Client handler thread did not terminate gracefully.")
             else:
                 logger.info("Client handler stopped.")
+        logger.info(f"Typing-to-send latency: {self.client_handler.send_latency_stats()}, "
+                    f"GUI frame timing: {self.frame_monitor.stats()}")
+        logger.info(f"Audio engine stats: {self.audio_engine.stats()}")
+        self.audio_engine.shutdown()
+        self.chat_display.cleanup()
         super().closeEvent(event)
         logger.info("Application closed.")
 
@@ -355,7 +565,5 @@ if __name__ == '__main__':
         QMessageBox.critical(None, "Fatal Error", f"Application crashed: {e}")
         sys.exit(1) # Exit with error code
     finally:
-        # Pygame shutdown might be needed here if initialized globally
-        # However, `play_voice` initializes and quits pygame.mixer locally,
-        # so a global quit might not be strictly necessary unless mixer is used elsewhere.
+        # The audio engine quits the pygame mixer itself when the window is closed.
         pass
\ No newline at end of file
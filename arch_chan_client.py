@@ -0,0 +1,276 @@
+# arch_chan_client.py
+# asyncio client for the MCP server's framed protocol, for automation and monitoring scripts that
+# shouldn't load PyQt5 and pygame. Keeps a small pool of connections and sends several requests at once:
+#
+#   async with ArchChanClient(size=4) as client:
+#       reply = await client.request("How much memory is free?")
+#       async for index, reply in client.stream(["md5 'hello'", "Tell me about CVE-2014-0160"]):
+#           print(index, reply.type, reply.content)
+#
+# The server answers the messages of one connection in order, one at a time, so requests run in
+# parallel across connections; `pipeline` > 1 also queues requests on a busy connection.
+#
+#   python arch_chan_client.py "What is my CPU usage?" "Calculate 12 * 7 + 3"
+#   python arch_chan_client.py --file prompts.txt --size 8 --json
+import argparse
+import asyncio
+import json
+import logging
+import os
+import sys
+import time
+from collections import deque
+from typing import AsyncIterator, Deque, Iterable, List, NamedTuple, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Every message in either direction ends with an ASCII record separator.
+FRAME_END = b"\x1e"
+SERVER_PORT = int(os.getenv("ARCH_CHAN_PORT", "12345"))
+# A linux_command reply can wait for a command with a 300 s timeout, so the default is generous.
+REQUEST_TIMEOUT = float(os.getenv("ARCH_CHAN_CLIENT_TIMEOUT", "330"))
+CONNECT_TIMEOUT = 10.0
+# Largest reply accepted (long command outputs are sent whole).
+MAX_REPLY_BYTES = 16 * 1024 * 1024
+ERROR_TYPES = ("ERROR", "AGENT_EXECUTION_ERROR")
+
+def parse_response(data: str) -> Tuple[str, str, str, str]:
+    parts = data.split('|CONTENT:', 1)
+    if len(parts) < 2:
+        logger.warning(f"Malformed response from server: {data[:300]}")
+        return "ERROR", "Received malformed response from server.", "", ""
+
+    type_part = parts[0].replace("TYPE:", "").strip()
+    remaining_parts = parts[1].split('|VOICE_TEXT:', 1)
+    if len(remaining_parts) < 2:
+        logger.warning(f"Malformed response from server (missing VOICE_TEXT): {data[:300]}")
+        return "ERROR", "Received malformed response from server (missing voice text).", "", ""
+
+    content_part = remaining_parts[0].strip()
+    voice_linux_parts = remaining_parts[1].split('|LINUX_OUTPUT:', 1)
+    if len(voice_linux_parts) < 2:
+        logger.warning(f"Malformed response from server (missing LINUX_OUTPUT): {data[:300]}")
+        return "ERROR", "Received malformed response from server (missing linux output).", "", ""
+
+    return type_part, content_part, voice_linux_parts[0].strip(), voice_linux_parts[1].strip()
+
+def encode_message(message: str, lang: str, session: Optional[str] = None) -> bytes:
+    # Without a session token the server gives the connection a private session that is never persisted.
+    session_field = f"SESSION:{session}|" if session else ""
+    return f"LANG:{lang}|{session_field}MSG:{message}".encode('utf-8') + FRAME_END
+
+class Reply(NamedTuple):
+    type: str
+    content: str
+    voice_text: str
+    linux_output: str
+    latency: float
+
+    @property
+    def ok(self) -> bool:
+        return self.type not in ERROR_TYPES
+
+class ClientError(Exception):
+    pass
+
+class ClientTimeout(ClientError):
+    pass
+
+class _Connection:
+    """One server connection. Replies come back in request order, so each sent request's future
+    waits in `pending` until the reader task reaches its frame."""
+
+    def __init__(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        self.reader = reader
+        self.writer = writer
+        self.pending: Deque[asyncio.Future] = deque()
+        self.closed = False
+        self._reader_task = asyncio.get_running_loop().create_task(self._read_replies())
+
+    async def _read_replies(self):
+        error = ClientError("Connection closed.")
+        try:
+            while True:
+                frame = await self.reader.readuntil(FRAME_END)
+                if not self.pending:
+                    logger.warning("Server sent a reply nobody was waiting for; ignoring it.")
+                    continue
+                future = self.pending.popleft()
+                if not future.done():
+                    future.set_result(frame[:-len(FRAME_END)])
+        except asyncio.IncompleteReadError:
+            error = ClientError("Server closed the connection.")
+        except asyncio.LimitOverrunError:
+            error = ClientError(f"Reply larger than {MAX_REPLY_BYTES} bytes.")
+        except OSError as e:
+            error = ClientError(f"Connection lost: {e}")
+        finally:
+            self.closed = True
+            while self.pending:
+                future = self.pending.popleft()
+                if not future.done():
+                    future.set_exception(error)
+            self.writer.close()
+
+    async def send(self, payload: bytes) -> asyncio.Future:
+        if self.closed:
+            raise ClientError("Connection closed.")
+        future = asyncio.get_running_loop().create_future()
+        self.pending.append(future)
+        self.writer.write(payload)
+        try:
+            await self.writer.drain()
+        except OSError as e:
+            self.close()
+            raise ClientError(f"Could not send request: {e}") from e
+        return future
+
+    def close(self):
+        self.closed = True
+        self._reader_task.cancel()
+
+class ArchChanClient:
+    """Pool of up to `size` connections with at most `pipeline` outstanding requests on each.
+    Connections are opened on demand and replaced when they drop."""
+
+    def __init__(self, host: str = '127.0.0.1', port: int = SERVER_PORT, size: int = 4, pipeline: int = 1,
+                 lang: str = "English", session: Optional[str] = None, timeout: float = REQUEST_TIMEOUT,
+                 connect_timeout: float = CONNECT_TIMEOUT):
+        self.host = host
+        self.port = port
+        self.size = max(1, size)
+        self.pipeline = max(1, pipeline)
+        self.lang = lang
+        # A shared token makes every connection continue one conversation; the server serializes
+        # requests of the same session, so this also removes the parallelism.
+        self.session = session
+        self.timeout = timeout
+        self.connect_timeout = connect_timeout
+        self._connections: List[_Connection] = []
+        self._slots = asyncio.Semaphore(self.size * self.pipeline)
+        self._lock = asyncio.Lock()
+
+    async def __aenter__(self) -> "ArchChanClient":
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.close()
+
+    async def _connection(self) -> _Connection:
+        async with self._lock:
+            self._connections = [c for c in self._connections if not c.closed]
+            least_busy = min(self._connections, key=lambda c: len(c.pending), default=None)
+            if least_busy is not None and (not least_busy.pending or len(self._connections) >= self.size):
+                return least_busy
+            try:
+                reader, writer = await asyncio.wait_for(
+                    asyncio.open_connection(self.host, self.port, limit=MAX_REPLY_BYTES), self.connect_timeout)
+            except asyncio.TimeoutError:
+                raise ClientTimeout(f"Connecting to {self.host}:{self.port} timed out.") from None
+            except OSError as e:
+                raise ClientError(f"Could not connect to {self.host}:{self.port}: {e}") from e
+            connection = _Connection(reader, writer)
+            self._connections.append(connection)
+            return connection
+
+    async def request(self, message: str, lang: Optional[str] = None, timeout: Optional[float] = None) -> Reply:
+        payload = encode_message(message, lang or self.lang, self.session)
+        timeout = self.timeout if timeout is None else timeout
+        async with self._slots:
+            started = time.perf_counter()
+            connection = await self._connection()
+            future = await connection.send(payload)
+            try:
+                frame = await asyncio.wait_for(future, timeout)
+            except asyncio.TimeoutError:
+                # The server would still answer it later, which would shift every following reply.
+                connection.close()
+                raise ClientTimeout(f"No reply within {timeout:g}s for '{message[:60]}'.") from None
+        return Reply(*parse_response(frame.decode('utf-8', errors='replace')), time.perf_counter() - started)
+
+    async def stream(self, messages: Iterable[str], lang: Optional[str] = None,
+                     timeout: Optional[float] = None) -> AsyncIterator[Tuple[int, Reply]]:
+        # Yields (index, reply) as replies arrive, which is not necessarily input order. Failed
+        # requests come back as ERROR replies instead of ending the stream.
+        limit = self.size * self.pipeline
+        pending = {}
+        iterator = enumerate(messages)
+
+        def fill():
+            for index, message in iterator:
+                pending[asyncio.ensure_future(self.request(message, lang, timeout))] = (index, time.perf_counter())
+                if len(pending) >= limit:
+                    return
+
+        fill()
+        try:
+            while pending:
+                done, _ = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    index, started = pending.pop(task)
+                    try:
+                        reply = task.result()
+                    except ClientError as e:
+                        reply = Reply("ERROR", str(e), "", "", time.perf_counter() - started)
+                    yield index, reply
+                fill()
+        finally:
+            for task in pending:
+                task.cancel()
+
+    async def close(self):
+        connections, self._connections = self._connections, []
+        for connection in connections:
+            connection.close()
+        for connection in connections:
+            try:
+                await connection.writer.wait_closed()
+            except OSError:
+                pass
+
+def read_prompts(path: str) -> List[str]:
+    handle = sys.stdin if path == "-" else open(path, encoding="utf-8")
+    with handle:
+        return [line.strip() for line in handle if line.strip()]
+
+async def run_cli(args: argparse.Namespace) -> int:
+    prompts = list(args.messages) + (read_prompts(args.file) if args.file else [])
+    if not prompts:
+        print("Nothing to send: pass messages or --file.", file=sys.stderr)
+        return 2
+    failed = 0
+    async with ArchChanClient(args.host, args.port, size=args.size, pipeline=args.pipeline, lang=args.lang,
+                              session=args.session, timeout=args.timeout) as client:
+        async for index, reply in client.stream(prompts):
+            failed += not reply.ok
+            if args.json:
+                print(json.dumps({"index": index, "prompt": prompts[index], "type": reply.type, "content": reply.content,
+                                  "linux_output": reply.linux_output, "latency_ms": round(reply.latency * 1000, 1)},
+                                 ensure_ascii=False), flush=True)
+            else:
+                print(f"[{index}] {reply.type} ({reply.latency * 1000:.0f} ms)\n{reply.content}", flush=True)
+                if reply.linux_output:
+                    print(reply.linux_output, flush=True)
+    return 1 if failed else 0
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Send messages to a running Arch-Chan server.")
+    parser.add_argument("messages", nargs="*", help="messages to send")
+    parser.add_argument("-f", "--file", help="file with one message per line ('-' for stdin)")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=SERVER_PORT)
+    parser.add_argument("--size", type=int, default=4, help="connections in the pool")
+    parser.add_argument("--pipeline", type=int, default=1, help="outstanding requests per connection")
+    parser.add_argument("--lang", default="English")
+    parser.add_argument("--session", help="session token, to continue a conversation across runs")
+    parser.add_argument("--timeout", type=float, default=REQUEST_TIMEOUT, help="seconds to wait for each reply")
+    parser.add_argument("--json", action="store_true", help="print one JSON object per reply")
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.WARNING, format='%(asctime)s - %(levelname)s - %(message)s')
+    try:
+        return asyncio.run(run_cli(args))
+    except KeyboardInterrupt:
+        return 130
+
+if __name__ == '__main__':
+    sys.exit(main())
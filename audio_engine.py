@@ -0,0 +1,278 @@
+# audio_engine.py
+import os
+import re
+import queue
+import shutil
+import subprocess
+import hashlib
+import threading
+import logging
+import time
+from typing import Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CACHE_DIR = os.path.join(os.path.expanduser("~"), ".cache", "arch-chan", "tts")
+
+class TTSCache:
+    # Content-addressed store of synthesized audio: the file name is the hash of (lang, text),
+    # so concurrent syntheses never share a path and repeated phrases are played from disk.
+    def __init__(self, directory: Optional[str] = None, max_bytes: Optional[int] = None):
+        self.directory = directory or os.getenv("ARCH_CHAN_TTS_CACHE_DIR", DEFAULT_CACHE_DIR)
+        self.max_bytes = max_bytes or int(float(os.getenv("ARCH_CHAN_TTS_CACHE_MB", "64")) * 1024 * 1024)
+        self._lock = threading.Lock()
+        os.makedirs(self.directory, exist_ok=True)
+        self._total_bytes: Optional[int] = None # Scanned on the first put, not at GUI startup
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def key(text: str, lang: str) -> str:
+        return hashlib.sha256(f"{lang}\0{text}".encode('utf-8')).hexdigest()
+
+    def path_for(self, text: str, lang: str, ext: str = "mp3") -> str:
+        return os.path.join(self.directory, f"{self.key(text, lang)}.{ext}")
+
+    def _entries(self):
+        entries = []
+        for name in os.listdir(self.directory):
+            if name.endswith(".tmp"):
+                continue
+            path = os.path.join(self.directory, name)
+            try:
+                st = os.stat(path)
+            except OSError:
+                continue
+            entries.append((st.st_mtime, path, st.st_size))
+        return entries
+
+    def get(self, text: str, lang: str, ext: str = "mp3") -> Optional[str]:
+        path = self.path_for(text, lang, ext)
+        try:
+            # mtime doubles as the LRU timestamp, atime is unreliable with noatime mounts.
+            os.utime(path)
+        except OSError:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return path
+
+    def put(self, text: str, lang: str, synthesize, ext: str = "mp3") -> str:
+        path = self.path_for(text, lang, ext)
+        tmp_path = f"{path}.{threading.get_ident()}.tmp"
+        try:
+            synthesize(tmp_path)
+        except Exception:
+            try:
+                os.remove(tmp_path)
+            except OSError:
+                pass
+            raise
+        with self._lock:
+            # A re-synthesized key replaces its old file, whose size no longer counts.
+            try:
+                old_size = os.path.getsize(path)
+            except OSError:
+                old_size = 0
+            os.replace(tmp_path, path)
+            if self._total_bytes is None:
+                self._total_bytes = sum(size for _, _, size in self._entries())
+            else:
+                self._total_bytes += os.path.getsize(path) - old_size
+            if self._total_bytes > self.max_bytes:
+                self._evict_locked(keep=path)
+        return path
+
+    def _evict_locked(self, keep: str):
+        entries = sorted(self._entries())
+        total = sum(size for _, _, size in entries)
+        for _, path, size in entries:
+            if total <= self.max_bytes:
+                break
+            if path == keep:
+                continue
+            try:
+                os.remove(path)
+                total -= size
+            except OSError as e:
+                logger.warning(f"Could not evict cached voice file {path}: {e}")
+        self._total_bytes = total
+
+# Sentence boundaries: terminal punctuation followed by whitespace, or line breaks.
+_SENTENCE_SPLIT_RE = re.compile(r'(?<=[.!?\u2026])\s+|\n+')
+
+def split_sentences(text: str, min_chars: int = 24) -> List[str]:
+    # Very short fragments ("Ara ara~!") are merged into the next sentence so playback isn't choppy.
+    sentences = []
+    pending = ""
+    for part in _SENTENCE_SPLIT_RE.split(text):
+        part = part.strip()
+        if not part:
+            continue
+        pending = f"{pending} {part}" if pending else part
+        if len(pending) >= min_chars:
+            sentences.append(pending)
+            pending = ""
+    if pending:
+        if sentences and len(pending) < min_chars:
+            sentences[-1] = f"{sentences[-1]} {pending}"
+        else:
+            sentences.append(pending)
+    return sentences
+
+class TTSBackend:
+    name = "base"
+    ext = "mp3"
+
+    def synthesize(self, text: str, lang: str, path: str):
+        raise NotImplementedError
+
+class GTTSBackend(TTSBackend):
+    name = "gtts"
+    ext = "mp3"
+
+    def synthesize(self, text: str, lang: str, path: str):
+        # Imported on first use so starting the GUI doesn't pay for the gTTS/requests import.
+        from gtts import gTTS
+        tts = gTTS(text, lang=lang)
+        tts.save(path)
+
+class EspeakBackend(TTSBackend):
+    # Local offline engine; no network round trip per sentence.
+    name = "espeak-ng"
+    ext = "wav"
+
+    def __init__(self, executable: Optional[str] = None):
+        self.executable = executable or shutil.which("espeak-ng") or "espeak-ng"
+
+    def synthesize(self, text: str, lang: str, path: str):
+        subprocess.run([self.executable, "-v", lang, "-w", path, text],
+                       check=True, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, timeout=30)
+
+TTS_BACKENDS = {
+    GTTSBackend.name: GTTSBackend,
+    EspeakBackend.name: EspeakBackend,
+}
+
+def create_backend(name: Optional[str] = None) -> TTSBackend:
+    name = (name or os.getenv("ARCH_CHAN_TTS_BACKEND", GTTSBackend.name)).lower()
+    backend_cls = TTS_BACKENDS.get(name)
+    if backend_cls is None:
+        logger.warning(f"Unknown TTS backend '{name}'. Falling back to {GTTSBackend.name}.")
+        backend_cls = GTTSBackend
+    return backend_cls()
+
+class AudioEngine:
+    # A synthesis worker turns queued messages into per-sentence audio files while a playback
+    # worker, which owns the pygame mixer, plays them in order. Sentence N+1 is synthesized
+    # while sentence N is playing, so the first sentence is heard as soon as it is ready.
+    def __init__(self, cache: Optional[TTSCache] = None, backend: Optional[TTSBackend] = None,
+                 volume: float = 1.0, prefetch: int = 2):
+        self.cache = cache or TTSCache()
+        self.backend = backend or create_backend()
+        self.volume = min(1.0, max(0.0, volume))
+        self._messages: "queue.Queue[Optional[tuple]]" = queue.Queue()
+        self._playback: "queue.Queue[Optional[tuple]]" = queue.Queue(maxsize=max(1, prefetch))
+        self._threads: List[threading.Thread] = []
+        self._stopping = threading.Event()
+        self._mixer_ready = False
+        self._pygame = None
+        self._ttfa: List[float] = []
+        logger.info(f"Audio engine using TTS backend '{self.backend.name}'.")
+
+    def start(self):
+        if not self._threads:
+            self._threads = [
+                threading.Thread(target=self._synthesis_loop, name="AudioSynthesis", daemon=True),
+                threading.Thread(target=self._playback_loop, name="AudioPlayback", daemon=True),
+            ]
+            for thread in self._threads:
+                thread.start()
+
+    def speak(self, text: str, lang: str = "en"):
+        if text and text.strip():
+            self._messages.put((text.strip(), lang, time.monotonic()))
+
+    def shutdown(self, timeout: float = 2.0):
+        self._stopping.set()
+        self._messages.put(None)
+        for thread in self._threads:
+            thread.join(timeout)
+
+    def stats(self) -> Dict:
+        samples = sorted(self._ttfa)
+        return {
+            "backend": self.backend.name,
+            "messages_played": len(samples),
+            "ttfa_last_ms": round(self._ttfa[-1] * 1000, 1) if self._ttfa else None,
+            "ttfa_p50_ms": round(samples[len(samples) // 2] * 1000, 1) if samples else None,
+            "ttfa_max_ms": round(samples[-1] * 1000, 1) if samples else None,
+            "cache_hits": self.cache.hits,
+            "cache_misses": self.cache.misses,
+        }
+
+    def _synthesize(self, text: str, lang: str) -> str:
+        cache_lang = f"{self.backend.name}:{lang}"
+        path = self.cache.get(text, cache_lang, self.backend.ext)
+        if path is None:
+            path = self.cache.put(text, cache_lang,
+                                  lambda tmp_path: self.backend.synthesize(text, lang, tmp_path),
+                                  self.backend.ext)
+        return path
+
+    def _synthesis_loop(self):
+        while True:
+            item = self._messages.get()
+            if item is None or self._stopping.is_set():
+                break
+            text, lang, enqueued_at = item
+            for index, sentence in enumerate(split_sentences(text)):
+                if self._stopping.is_set():
+                    break
+                try:
+                    path = self._synthesize(sentence, lang)
+                except Exception as e:
+                    logger.error(f"Voice synthesis failed ({self.backend.name}): {e}")
+                    continue
+                self._playback.put((path, index == 0, enqueued_at))
+        self._playback.put(None)
+
+    def _ensure_mixer(self):
+        # pygame is only imported (and the mixer opened) when the first sentence is played.
+        if not self._mixer_ready:
+            import pygame
+            self._pygame = pygame
+            pygame.mixer.init()
+            self._mixer_ready = True
+
+    def _playback_loop(self):
+        while True:
+            item = self._playback.get()
+            if item is None:
+                break
+            path, first_sentence, enqueued_at = item
+            try:
+                self._play(path, first_sentence, enqueued_at)
+            except Exception as e:
+                logger.error(f"Voice playback failed: {e}")
+
+        if self._mixer_ready:
+            self._pygame.mixer.music.stop()
+            self._pygame.mixer.quit()
+            self._mixer_ready = False
+
+    def _play(self, path: str, first_sentence: bool, enqueued_at: float):
+        self._ensure_mixer()
+        pygame = self._pygame
+        pygame.mixer.music.load(path)
+        pygame.mixer.music.set_volume(self.volume)
+        pygame.mixer.music.play()
+        if first_sentence:
+            ttfa = time.monotonic() - enqueued_at
+            self._ttfa = self._ttfa[-99:] + [ttfa]
+            logger.info(f"Voice time-to-first-audio: {ttfa * 1000:.0f} ms ({self.backend.name})")
+        while pygame.mixer.music.get_busy():
+            if self._stopping.is_set():
+                pygame.mixer.music.stop()
+                break
+            time.sleep(0.05)
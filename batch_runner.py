@@ -0,0 +1,222 @@
+# batch_runner.py
+# Runs a file of prompts through agent_selector and the agents without the GUI, for scripted
+# audits (lists of CVE IDs, hashes, host checks). One JSON object per input line:
+#   {"id": "log4shell", "prompt": "Tell me about CVE-2021-44228"}
+#   {"prompt": "5d41402abc4b2a76b9719d911017c592", "agent": "hash_checker"}   # skips routing
+#   "What is my disk usage?"                                                  # id = line number
+# Results are appended to the output file as JSON Lines as soon as each prompt finishes, and
+# the output file doubles as the checkpoint: running the same command again skips every id
+# that already has a result.
+#
+#   python batch_runner.py audit.jsonl -o audit.results.jsonl --concurrency 4
+#   python batch_runner.py audit.jsonl -o audit.results.jsonl --retry-errors
+import argparse
+import json
+import logging
+import os
+import sys
+import time
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from typing import Dict, Iterator, List, Optional, Set, Tuple
+
+import mcp_server
+from llm_runtime import PRIORITY_BACKGROUND
+from metrics import request_trace
+from log_setup import request_context
+
+logger = logging.getLogger(__name__)
+
+ERROR_TYPES = ("ERROR", "AGENT_EXECUTION_ERROR")
+
+class BatchItem:
+    __slots__ = ("id", "line", "prompt", "agent")
+
+    def __init__(self, item_id: str, line: int, prompt: str, agent: Optional[str]):
+        self.id = item_id
+        self.line = line
+        self.prompt = prompt
+        self.agent = agent
+
+def read_items(path: str) -> Iterator[BatchItem]:
+    # Lines that cannot be used are logged and skipped so one typo doesn't stop a long run.
+    with open(path, encoding="utf-8") as f:
+        for number, line in enumerate(f, 1):
+            if not line.strip():
+                continue
+            try:
+                record = json.loads(line)
+            except ValueError:
+                logger.error(f"Skipping line {number} of {path}: not valid JSON.")
+                continue
+            if isinstance(record, str):
+                record = {"prompt": record}
+            prompt = str(record.get("prompt") or record.get("msg") or "").strip() if isinstance(record, dict) else ""
+            if not prompt:
+                logger.error(f"Skipping line {number} of {path}: no prompt.")
+                continue
+            agent = record.get("agent")
+            if agent is not None and agent not in mcp_server.VALID_AGENTS:
+                logger.error(f"Skipping line {number} of {path}: unknown agent '{agent}'.")
+                continue
+            yield BatchItem(str(record.get("id", number)), number, prompt, agent)
+
+def load_checkpoint(path: str, retry_errors: bool) -> Set[str]:
+    # Ids that already have a result. With retry_errors, failed ids run again; their new
+    # result is appended, so the last line for an id is the one that counts.
+    done: Dict[str, bool] = {}
+    if not os.path.exists(path):
+        return set()
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            try:
+                result = json.loads(line)
+            except ValueError:
+                # The previous run was killed while writing this line.
+                continue
+            done[str(result.get("id"))] = bool(result.get("ok"))
+    return {item_id for item_id, ok in done.items() if ok or not retry_errors}
+
+def stage_timings(stages: List[Tuple[str, float]]) -> Dict[str, float]:
+    totals: Dict[str, float] = {}
+    for stage, seconds in stages:
+        totals[stage] = totals.get(stage, 0.0) + seconds
+    return {stage: round(seconds * 1000, 1) for stage, seconds in totals.items()}
+
+def run_item(item: BatchItem, allow_commands: bool) -> dict:
+    # Every prompt gets its own chat bot: items are independent, and friend_chat's history must
+    # not leak between them. Background priority leaves quota to interactive clients first.
+    result = {"id": item.id, "line": item.line, "prompt": item.prompt}
+    started = time.perf_counter()
+    with request_context(f"batch-{item.id}"), request_trace() as trace:
+        try:
+            chat_bot = mcp_server.GeminiChatBot(min_priority=PRIORITY_BACKGROUND)
+            agent_type = item.agent
+            if agent_type is None:
+                route_started = time.perf_counter()
+                agent_type = mcp_server.agent_selector(chat_bot, item.prompt)
+                result["route_ms"] = round((time.perf_counter() - route_started) * 1000, 1)
+            result["agent"] = agent_type
+            if agent_type == "linux_command" and not allow_commands:
+                # linux_command runs what the model suggests; unattended runs need an explicit opt-in.
+                result.update(type="SKIPPED", ok=False,
+                              error="linux_command would execute a shell command; rerun with --allow-commands.")
+            else:
+                agent_started = time.perf_counter()
+                response_type, content, _, linux_output = mcp_server.dispatch_agent(agent_type, item.prompt, chat_bot)
+                result["agent_ms"] = round((time.perf_counter() - agent_started) * 1000, 1)
+                result.update(type=response_type, content=content, linux_output=linux_output,
+                              ok=response_type not in ERROR_TYPES)
+        except Exception as e:
+            logger.error(f"Batch item {item.id} (line {item.line}) failed: {e}", exc_info=True)
+            result.update(type="AGENT_EXECUTION_ERROR", ok=False, error=f"{type(e).__name__}: {e}")
+    result["stages_ms"] = stage_timings(trace.stages)
+    result["total_ms"] = round((time.perf_counter() - started) * 1000, 1)
+    return result
+
+class BatchRunner:
+    """Keeps at most `concurrency` prompts running (and a few more queued), so memory stays flat
+    for input files of any length. Results are written from the calling thread only."""
+
+    def __init__(self, output_path: str, concurrency: int = 4, allow_commands: bool = False,
+                 retry_errors: bool = False):
+        self.output_path = output_path
+        self.concurrency = max(1, concurrency)
+        self.allow_commands = allow_commands
+        self.done = load_checkpoint(output_path, retry_errors)
+        self.counts = {"ok": 0, "failed": 0, "resumed": 0}
+        self.latencies: List[float] = []
+
+    def _open_output(self):
+        directory = os.path.dirname(self.output_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        output = open(self.output_path, "a+", encoding="utf-8")
+        # Don't glue the first new result onto a partial line left by an interrupted run.
+        if output.tell() > 0:
+            output.seek(output.tell() - 1)
+            if output.read(1) != "\n":
+                output.write("\n")
+        return output
+
+    def _write(self, output, result: dict):
+        output.write(json.dumps(result, ensure_ascii=False) + "\n")
+        output.flush()
+        self.counts["ok" if result.get("ok") else "failed"] += 1
+        self.latencies.append(result["total_ms"])
+        if not result.get("ok"):
+            logger.warning(f"Batch item {result['id']} finished as {result.get('type')}: "
+                           f"{result.get('error') or str(result.get('content', ''))[:120]}")
+
+    def run(self, items: Iterator[BatchItem]) -> int:
+        pending: Set[Future] = set()
+        seen: Set[str] = set()
+        executor = ThreadPoolExecutor(max_workers=self.concurrency, thread_name_prefix="BatchWorker")
+        output = self._open_output()
+        try:
+            for item in items:
+                if item.id in seen:
+                    logger.warning(f"Duplicate id '{item.id}' on line {item.line}; ids must be unique for resuming. Skipping.")
+                    continue
+                seen.add(item.id)
+                if item.id in self.done:
+                    self.counts["resumed"] += 1
+                    continue
+                while len(pending) >= self.concurrency * 2:
+                    finished, pending = wait(pending, return_when=FIRST_COMPLETED)
+                    for future in finished:
+                        self._write(output, future.result())
+                pending.add(executor.submit(run_item, item, self.allow_commands))
+            for future in wait(pending).done:
+                self._write(output, future.result())
+        finally:
+            # On Ctrl+C, queued prompts are dropped; the ones already running can't be interrupted.
+            executor.shutdown(wait=False, cancel_futures=True)
+            output.close()
+        return self.counts["failed"]
+
+    def summary(self, elapsed: float) -> str:
+        latencies = sorted(self.latencies)
+
+        def percentile(fraction: float) -> float:
+            return latencies[min(len(latencies) - 1, int(fraction * len(latencies)))] if latencies else 0.0
+
+        return (f"{self.counts['ok']} ok, {self.counts['failed']} failed, {self.counts['resumed']} already done "
+                f"in {elapsed:.1f}s; latency p50 {percentile(0.5):.0f} ms, p95 {percentile(0.95):.0f} ms")
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Run a JSONL file of prompts through Arch-Chan's agents.")
+    parser.add_argument("input", help="JSON Lines file of prompts")
+    parser.add_argument("-o", "--output", required=True, help="JSON Lines results file, also used to resume")
+    parser.add_argument("-c", "--concurrency", type=int, default=int(os.getenv("ARCH_CHAN_BATCH_CONCURRENCY", "4")),
+                        help="prompts processed at the same time (LLM rate limits still apply)")
+    parser.add_argument("--lang", default="English", help="language of the answers")
+    parser.add_argument("--allow-commands", action="store_true",
+                        help="let linux_command execute the commands it suggests")
+    parser.add_argument("--retry-errors", action="store_true", help="run prompts whose previous result failed again")
+    parser.add_argument("-v", "--verbose", action="store_true", help="log every request, not just warnings")
+    args = parser.parse_args(argv)
+
+    logging.getLogger().setLevel(logging.INFO if args.verbose else logging.WARNING)
+    try:
+        mcp_server.load_env_variables()
+    except ValueError as e:
+        logger.critical(f"Could not start batch run: {e}")
+        return 2
+    mcp_server.language = args.lang
+    mcp_server.llm_router.warm_up()
+
+    runner = BatchRunner(args.output, args.concurrency, args.allow_commands, args.retry_errors)
+    started = time.perf_counter()
+    try:
+        failed = runner.run(read_items(args.input))
+    except KeyboardInterrupt:
+        print(f"Interrupted. {runner.summary(time.perf_counter() - started)}. "
+              f"Run the same command again to resume.", file=sys.stderr)
+        return 130
+    finally:
+        mcp_server.llm_router.close()
+    print(runner.summary(time.perf_counter() - started), file=sys.stderr)
+    return 1 if failed else 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,470 @@
+# benchmarks/load_test.py
+# End-to-end load test of the MCP server: N concurrent clients speak the framed
+# `LANG:|SESSION:|MSG:` protocol and replay a weighted prompt mix across all nine agents.
+# By default a server is started with the fake LLM backend (fake_llm.py) and a local stand-in
+# for the weather API, so no Gemini quota or network access is used.
+#
+#   python benchmarks/load_test.py --clients 16 --duration 60 --json results/run1.json
+#   python benchmarks/load_test.py --clients 16 --requests 500 --latency-ms 800 --jitter-ms 400
+#   python benchmarks/load_test.py --clients 16 --duration 60 --compare results/run1.json
+#   python benchmarks/load_test.py --server 127.0.0.1:12345 --pid 4242   # an already running server
+import argparse
+import json
+import os
+import random
+import re
+import shutil
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SERVER_SCRIPT = os.path.join(ROOT_DIR, "mcp_server.py")
+FRAME_END = b"\x1e"
+
+# (agent, weight, prompts): roughly what the GUI sees, chat-heavy with a tail of tool agents.
+PROMPT_MIX = [
+    ("friend_chat", 30, ["Hi Arch-Chan, how are you today?", "Tell me something nice about Linux",
+                         "I just finished setting up Arch!", "Good night, see you tomorrow"]),
+    ("linux_command", 15, ["Run a command to list the files here", "Show files in my home directory with ls",
+                           "Give me the command to list block devices"]),
+    ("system_info", 12, ["What is my CPU usage?", "How much memory is free?", "Show disk usage",
+                         "What's the uptime?", "Which services are running?"]),
+    ("weather_gether", 8, ["What's the weather in Istanbul?", "Weather forecast for Berlin",
+                           "How is the weather in Ankara tomorrow?"]),
+    ("web_search", 8, ["Search for the latest Linux kernel news", "Search for Arch Linux news"]),
+    ("calculator", 8, ["Calculate 12 * 7 + 3", "What is 1024 / 16?", "Calculate (5 + 3) * 2"]),
+    ("security_advisor", 7, ["How do I spot a phishing email?", "Is my password policy secure enough?",
+                             "How can I protect against ransomware?"]),
+    ("vulnerability_scanner_info", 6, ["Tell me about CVE-2014-0160", "Is there a vulnerability in OpenSSL 1.0.1?"]),
+    ("hash_checker", 6, ["Generate a sha256 hash of 'arch-chan'", "What hash is 5d41402abc4b2a76b9719d911017c592?"]),
+]
+
+# Reply TYPE -> agent, to check that requests were routed where the mix expected.
+RESPONSE_AGENTS = {
+    "LINUX_CMD": "linux_command", "WEATHER": "weather_gether", "FRIEND_CHAT": "friend_chat",
+    "WEB_SEARCH": "web_search", "CALCULATOR": "calculator", "SYSTEM_INFO": "system_info",
+    "SECURITY_ADVISOR": "security_advisor", "VULN_INFO": "vulnerability_scanner_info",
+    "HASH_CHECKER": "hash_checker",
+}
+ERROR_TYPES = ("ERROR", "AGENT_EXECUTION_ERROR")
+AGENT_ERROR = re.compile(r"^(?:\[Agent Logic Error\]|[A-Za-z ]{0,40}Error\b)")
+
+FORECAST_XML = """<?xml version="1.0" encoding="utf-8"?>
+<root><location><name>{city}</name></location><forecast><forecastday><date>2025-01-01</date>
+<day><maxtemp_c>12.0</maxtemp_c><maxtemp_f>53.6</maxtemp_f><mintemp_c>4.0</mintemp_c><mintemp_f>39.2</mintemp_f>
+<avgtemp_c>8.0</avgtemp_c><avgtemp_f>46.4</avgtemp_f><condition><text>Partly cloudy</text></condition></day>
+</forecastday></forecast></root>"""
+
+def free_port() -> int:
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+def start_weather_stub() -> ThreadingHTTPServer:
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            city = self.path.split("q=", 1)[1].split("&", 1)[0] if "q=" in self.path else "Istanbul"
+            payload = FORECAST_XML.format(city=city).encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "application/xml")
+            self.send_header("Content-Length", str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+
+        def log_message(self, format, *args):
+            pass
+
+    httpd = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    httpd.daemon_threads = True
+    threading.Thread(target=httpd.serve_forever, name="WeatherStub", daemon=True).start()
+    return httpd
+
+class ServerProcess:
+    """mcp_server.py on a free port with the fake LLM backend and throwaway session storage."""
+
+    def __init__(self, args, weather_url: str):
+        self.workdir = tempfile.mkdtemp(prefix="arch-chan-load-")
+        self.port = free_port()
+        self.ready_file = os.path.join(self.workdir, "ready")
+        self.log_path = os.path.join(self.workdir, "server.log")
+        env = dict(os.environ)
+        env.update({
+            "ARCH_CHAN_LLM_BACKEND": "fake",
+            "ARCH_CHAN_FAKE_LATENCY_MS": str(args.latency_ms),
+            "ARCH_CHAN_FAKE_JITTER_MS": str(args.jitter_ms),
+            "ARCH_CHAN_FAKE_LATENCY_DIST": args.distribution,
+            "ARCH_CHAN_FAKE_ERROR_RATE": str(args.error_rate),
+            "ARCH_CHAN_PORT": str(self.port),
+            "ARCH_CHAN_READY_FILE": self.ready_file,
+            "ARCH_CHAN_SESSION_DIR": os.path.join(self.workdir, "sessions"),
+            "ARCH_CHAN_MAX_SESSIONS": str(max(64, args.clients * 2)),
+            "ARCH_CHAN_WORKERS": str(args.workers),
+            "ARCH_CHAN_METRICS_PORT": "0",
+            "ARCH_CHAN_LLM_RPM": str(args.rpm),
+            "ARCH_CHAN_WEATHER_URL": weather_url,
+            "WEATHER_API_KEY": env.get("WEATHER_API_KEY", "load-test"),
+        })
+        if args.seed is not None:
+            env["ARCH_CHAN_FAKE_SEED"] = str(args.seed)
+        self._log = open(self.log_path, "w")
+        self.process = subprocess.Popen([args.python, SERVER_SCRIPT], cwd=ROOT_DIR, env=env,
+                                        stdout=self._log, stderr=subprocess.STDOUT)
+        self.pid = self.process.pid
+
+    def wait_ready(self, timeout: float):
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            if os.path.exists(self.ready_file):
+                return
+            if self.process.poll() is not None:
+                raise RuntimeError(f"Server exited with code {self.process.returncode}:\n{self.log_tail()}")
+            time.sleep(0.1)
+        raise RuntimeError(f"Server was not ready after {timeout:.0f}s:\n{self.log_tail()}")
+
+    def log_tail(self, lines: int = 30) -> str:
+        self._log.flush()
+        with open(self.log_path, errors="replace") as f:
+            return "".join(f.readlines()[-lines:])
+
+    def stop(self, keep_logs: bool = False):
+        if self.process.poll() is None:
+            self.process.terminate()
+            try:
+                self.process.wait(timeout=15)
+            except subprocess.TimeoutExpired:
+                self.process.kill()
+                self.process.wait()
+        self._log.close()
+        if keep_logs:
+            print(f"Server log kept in {self.log_path}")
+        else:
+            shutil.rmtree(self.workdir, ignore_errors=True)
+
+def _proc_status(pid: int) -> dict:
+    values = {}
+    with open(f"/proc/{pid}/status") as f:
+        for line in f:
+            key, _, value = line.partition(":")
+            if key in ("VmRSS", "Threads"):
+                values[key] = int(value.split()[0])
+    return values
+
+def _process_tree(pid: int) -> list:
+    pids = [pid]
+    try:
+        for task in os.listdir(f"/proc/{pid}/task"):
+            with open(f"/proc/{pid}/task/{task}/children") as f:
+                for child in f.read().split():
+                    pids.extend(_process_tree(int(child)))
+    except OSError:
+        pass
+    return pids
+
+class ResourceSampler(threading.Thread):
+    """Samples RSS and thread count of the server and its worker processes from /proc."""
+
+    def __init__(self, pid: int, interval: float):
+        super().__init__(name="ResourceSampler", daemon=True)
+        self.pid = pid
+        self.interval = interval
+        self.samples = []
+        self._stop_event = threading.Event()
+
+    def run(self):
+        while not self._stop_event.is_set():
+            rss_kb = threads = 0
+            for pid in _process_tree(self.pid):
+                try:
+                    status = _proc_status(pid)
+                except OSError:
+                    continue
+                rss_kb += status.get("VmRSS", 0)
+                threads += status.get("Threads", 0)
+            if rss_kb:
+                self.samples.append((rss_kb / 1024, threads))
+            self._stop_event.wait(self.interval)
+
+    def stop(self) -> dict:
+        self._stop_event.set()
+        self.join(timeout=self.interval * 2)
+        if not self.samples:
+            return {}
+        rss = [s[0] for s in self.samples]
+        threads = [s[1] for s in self.samples]
+        return {
+            "rss_mb": {"start": round(rss[0], 1), "end": round(rss[-1], 1), "max": round(max(rss), 1)},
+            "threads": {"start": threads[0], "end": threads[-1], "max": max(threads)},
+        }
+
+class LoadClient:
+    def __init__(self, host: str, port: int, language: str, timeout: float):
+        self.session = uuid.uuid4().hex
+        self.language = language
+        self.sock = socket.create_connection((host, port), timeout=timeout)
+        self._buffer = b""
+
+    def request(self, message: str) -> str:
+        frame = f"LANG:{self.language}|SESSION:{self.session}|MSG:{message}".encode("utf-8") + FRAME_END
+        self.sock.sendall(frame)
+        while FRAME_END not in self._buffer:
+            chunk = self.sock.recv(65536)
+            if not chunk:
+                raise ConnectionError("server closed the connection")
+            self._buffer += chunk
+        reply, self._buffer = self._buffer.split(FRAME_END, 1)
+        return reply.decode("utf-8", errors="replace")
+
+    def close(self):
+        try:
+            self.sock.close()
+        except OSError:
+            pass
+
+def classify(reply: str):
+    # -> (reply agent or None, error or None)
+    response_type = reply.split("|", 1)[0][len("TYPE:"):] if reply.startswith("TYPE:") else ""
+    content = reply.split("|CONTENT:", 1)[1].split("|VOICE_TEXT:", 1)[0] if "|CONTENT:" in reply else ""
+    if response_type in ERROR_TYPES:
+        return None, f"{response_type}: {content[:120]}"
+    # Agent replies look like "Linux Chan Weather: <agent output>"; agents report failures as
+    # "Error: ..." or "<Agent> Error: ..." in that output.
+    body = content.split(":", 1)[1].lstrip() if content.startswith("Linux Chan") and ":" in content else content
+    if AGENT_ERROR.match(body):
+        return RESPONSE_AGENTS.get(response_type), f"{response_type}: {body[:120]}"
+    if response_type not in RESPONSE_AGENTS:
+        return None, f"unexpected reply: {reply[:120]}"
+    return RESPONSE_AGENTS[response_type], None
+
+class LoadGenerator:
+    def __init__(self, host: str, port: int, args):
+        self.host = host
+        self.port = port
+        self.args = args
+        self.results = []  # (expected agent, replied agent, latency seconds, error)
+        self.connect_errors = 0
+        self._lock = threading.Lock()
+        self._issued = 0
+        self._deadline = None
+        agents, weights = zip(*[(entry, entry[1]) for entry in PROMPT_MIX])
+        self._mix, self._weights = agents, weights
+
+    def _next_ticket(self) -> bool:
+        with self._lock:
+            if self.args.requests is not None:
+                if self._issued >= self.args.requests:
+                    return False
+            elif time.monotonic() >= self._deadline:
+                return False
+            self._issued += 1
+            return True
+
+    def _client_loop(self, index: int):
+        rnd = random.Random(None if self.args.seed is None else self.args.seed + index)
+        client = None
+        while self._next_ticket():
+            agent, _, prompts = rnd.choices(self._mix, weights=self._weights)[0]
+            started = time.perf_counter()
+            try:
+                if client is None:
+                    client = LoadClient(self.host, self.port, self.args.language, self.args.timeout)
+                reply = client.request(rnd.choice(prompts))
+                replied, error = classify(reply)
+            except (OSError, ConnectionError) as e:
+                replied, error = None, f"{type(e).__name__}: {e}"
+                if client is not None:
+                    client.close()
+                client = None
+            with self._lock:
+                self.results.append((agent, replied, time.perf_counter() - started, error))
+            if self.args.think_ms:
+                time.sleep(rnd.expovariate(1000.0 / self.args.think_ms))
+        if client is not None:
+            client.close()
+
+    def run(self) -> float:
+        self._deadline = time.monotonic() + self.args.duration
+        threads = [threading.Thread(target=self._client_loop, args=(i,), name=f"LoadClient-{i}", daemon=True)
+                   for i in range(self.args.clients)]
+        started = time.perf_counter()
+        for thread in threads:
+            thread.start()
+            if self.args.ramp_up:
+                time.sleep(self.args.ramp_up / self.args.clients)
+        for thread in threads:
+            thread.join()
+        return time.perf_counter() - started
+
+def percentile(values, fraction: float) -> float:
+    ordered = sorted(values)
+    if not ordered:
+        return 0.0
+    index = min(len(ordered) - 1, max(0, int(round(fraction * len(ordered) + 0.5)) - 1))
+    return ordered[index]
+
+def _latency_summary(latencies) -> dict:
+    ms = [value * 1000 for value in latencies]
+    return {
+        "p50_ms": round(percentile(ms, 0.50), 1),
+        "p95_ms": round(percentile(ms, 0.95), 1),
+        "p99_ms": round(percentile(ms, 0.99), 1),
+        "mean_ms": round(statistics.fmean(ms), 1) if ms else 0.0,
+        "max_ms": round(max(ms), 1) if ms else 0.0,
+    }
+
+def summarize(results, elapsed: float) -> dict:
+    per_agent = {}
+    for agent, _, _, _ in results:
+        per_agent.setdefault(agent, [])
+    for agent in per_agent:
+        rows = [r for r in results if r[0] == agent]
+        errors = [r for r in rows if r[3]]
+        per_agent[agent] = {
+            "requests": len(rows),
+            "throughput_rps": round(len(rows) / elapsed, 2) if elapsed else 0.0,
+            "errors": len(errors),
+            "error_rate": round(len(errors) / len(rows), 4) if rows else 0.0,
+            # Answered by a different agent than the prompt was written for (routing quality).
+            "misrouted": sum(1 for r in rows if not r[3] and r[1] != agent),
+            **_latency_summary([r[2] for r in rows if not r[3]]),
+        }
+    errors = [r for r in results if r[3]]
+    error_kinds = {}
+    for _, _, _, error in errors:
+        kind = error.split(":", 1)[0]
+        error_kinds[kind] = error_kinds.get(kind, 0) + 1
+    return {
+        "total": {
+            "requests": len(results),
+            "elapsed_s": round(elapsed, 2),
+            "throughput_rps": round(len(results) / elapsed, 2) if elapsed else 0.0,
+            "errors": len(errors),
+            "error_rate": round(len(errors) / len(results), 4) if results else 0.0,
+            **_latency_summary([r[2] for r in results if not r[3]]),
+        },
+        "agents": dict(sorted(per_agent.items())),
+        "error_kinds": error_kinds,
+        "error_examples": sorted({r[3] for r in errors})[:10],
+    }
+
+def print_report(report: dict):
+    total = report["total"]
+    print(f"\n{total['requests']} requests in {total['elapsed_s']}s: {total['throughput_rps']} req/s, "
+          f"{total['errors']} errors ({total['error_rate'] * 100:.1f}%), "
+          f"p50 {total['p50_ms']} ms, p95 {total['p95_ms']} ms, p99 {total['p99_ms']} ms")
+    print(f"\n{'agent':<28}{'reqs':>7}{'req/s':>8}{'err':>6}{'misrt':>7}{'p50':>9}{'p95':>9}{'p99':>9}")
+    for agent, stats in report["agents"].items():
+        print(f"{agent:<28}{stats['requests']:>7}{stats['throughput_rps']:>8}{stats['errors']:>6}{stats['misrouted']:>7}"
+              f"{stats['p50_ms']:>9}{stats['p95_ms']:>9}{stats['p99_ms']:>9}")
+    resources = report.get("server")
+    if resources:
+        rss, threads = resources["rss_mb"], resources["threads"]
+        print(f"\nserver RSS {rss['start']} -> {rss['end']} MB (max {rss['max']}), "
+              f"threads {threads['start']} -> {threads['end']} (max {threads['max']})")
+    if report["error_examples"]:
+        print("\nerrors:\n  " + "\n  ".join(report["error_examples"]))
+
+def compare(report: dict, baseline: dict, tolerance: float) -> list:
+    regressions = []
+    checks = [("total", report["total"], baseline.get("total", {}))]
+    checks += [(agent, stats, baseline.get("agents", {}).get(agent, {})) for agent, stats in report["agents"].items()]
+    for name, stats, base in checks:
+        for metric in ("p50_ms", "p95_ms", "p99_ms"):
+            if base.get(metric) and stats[metric] > base[metric] * (1 + tolerance):
+                regressions.append(f"{name} {metric}: {stats[metric]:.1f} vs baseline {base[metric]:.1f} "
+                                   f"(+{(stats[metric] / base[metric] - 1) * 100:.0f}%)")
+        if stats["error_rate"] > base.get("error_rate", 0) + 0.01:
+            regressions.append(f"{name} error rate: {stats['error_rate'] * 100:.1f}% vs baseline "
+                               f"{base.get('error_rate', 0) * 100:.1f}%")
+    base_rps = baseline.get("total", {}).get("throughput_rps")
+    if base_rps and report["total"]["throughput_rps"] < base_rps * (1 - tolerance):
+        regressions.append(f"throughput: {report['total']['throughput_rps']} req/s vs baseline {base_rps} req/s")
+    return regressions
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Arch-Chan MCP server load test")
+    parser.add_argument("--clients", type=int, default=8, help="concurrent client connections")
+    parser.add_argument("--duration", type=float, default=30.0, help="seconds to run (ignored with --requests)")
+    parser.add_argument("--requests", type=int, help="stop after this many requests instead")
+    parser.add_argument("--ramp-up", type=float, default=0.0, help="seconds over which clients connect")
+    parser.add_argument("--think-ms", type=float, default=0.0, help="mean pause between a client's requests")
+    parser.add_argument("--language", default="English")
+    parser.add_argument("--timeout", type=float, default=120.0, help="per-request socket timeout")
+    parser.add_argument("--seed", type=int, help="seed for the prompt mix and the fake LLM")
+    parser.add_argument("--server", help="host:port of an already running server instead of starting one")
+    parser.add_argument("--pid", type=int, help="with --server: sample RSS and threads of this process")
+    parser.add_argument("--python", default=sys.executable)
+    parser.add_argument("--workers", type=int, default=1, help="ARCH_CHAN_WORKERS for the started server")
+    parser.add_argument("--rpm", type=int, default=0, help="ARCH_CHAN_LLM_RPM for the started server (0 = unlimited)")
+    parser.add_argument("--latency-ms", type=float, default=300.0, help="mean fake LLM latency")
+    parser.add_argument("--jitter-ms", type=float, default=100.0, help="fake LLM latency standard deviation")
+    parser.add_argument("--distribution", default="lognormal",
+                        choices=("fixed", "uniform", "normal", "lognormal", "exponential"))
+    parser.add_argument("--error-rate", type=float, default=0.0, help="fraction of fake LLM calls that fail")
+    parser.add_argument("--sample-interval", type=float, default=0.5, help="seconds between RSS/thread samples")
+    parser.add_argument("--keep-logs", action="store_true", help="keep the started server's log")
+    parser.add_argument("--json", dest="json_path", help="write the results to this JSON file")
+    parser.add_argument("--compare", help="compare against a previous --json result and fail on regressions")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="allowed slowdown vs --compare (0.25 = 25%%)")
+    args = parser.parse_args()
+
+    server = weather = None
+    pid = args.pid
+    if args.server:
+        host, _, port = args.server.rpartition(":")
+        host, port = host or "127.0.0.1", int(port)
+    else:
+        weather = start_weather_stub()
+        server = ServerProcess(args, f"http://127.0.0.1:{weather.server_address[1]}/v1/forecast.xml")
+        host, port, pid = "127.0.0.1", server.port, server.pid
+
+    sampler = None
+    try:
+        if server is not None:
+            server.wait_ready(timeout=60)
+        if pid and os.path.isdir(f"/proc/{pid}"):
+            sampler = ResourceSampler(pid, args.sample_interval)
+            sampler.start()
+        limit = f"{args.requests} requests" if args.requests is not None else f"{args.duration:g}s"
+        print(f"Load test: {args.clients} clients against {host}:{port} for {limit}"
+              + (f", fake LLM {args.distribution} {args.latency_ms:g}±{args.jitter_ms:g} ms" if server else ""))
+        generator = LoadGenerator(host, port, args)
+        elapsed = generator.run()
+    finally:
+        resources = sampler.stop() if sampler is not None else {}
+        if server is not None:
+            server.stop(keep_logs=args.keep_logs)
+        if weather is not None:
+            weather.shutdown()
+
+    report = summarize(generator.results, elapsed)
+    if resources:
+        report["server"] = resources
+    report["config"] = {key: value for key, value in vars(args).items() if key not in ("json_path", "compare", "python")}
+    report["created"] = time.strftime("%Y-%m-%dT%H:%M:%S")
+    print_report(report)
+
+    if args.json_path:
+        os.makedirs(os.path.dirname(os.path.abspath(args.json_path)), exist_ok=True)
+        with open(args.json_path, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"\nResults written to {args.json_path}")
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        regressions = compare(report, baseline, args.tolerance)
+        if regressions:
+            print("\nRegressions against " + args.compare + ":\n  " + "\n  ".join(regressions))
+            return 1
+        print(f"\nNo regressions against {args.compare}.")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
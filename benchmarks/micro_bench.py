@@ -0,0 +1,258 @@
+# benchmarks/micro_bench.py
+# Microbenchmarks for the server and client hot paths. Runs offline: the server module is
+# imported with the fake LLM backend, and agents are driven by a stand-in chat bot, so no
+# API keys, quota or network access are needed.
+#
+#   python benchmarks/micro_bench.py                                   # compare with the stored baseline
+#   python benchmarks/micro_bench.py --filter xml. --repeat 9
+#   python benchmarks/micro_bench.py --save-baseline benchmarks/baselines/micro.json
+#
+# Baselines are per machine: re-record them (on an idle machine) before comparing runs elsewhere.
+# A benchmark regresses when its median is slower than the baseline by more than the tolerance,
+# which can be overridden per benchmark in the baseline's "thresholds" section.
+import argparse
+import json
+import logging
+import os
+import statistics
+import sys
+import time
+import timeit
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DEFAULT_BASELINE = os.path.join(ROOT_DIR, "benchmarks", "baselines", "micro.json")
+sys.path.insert(0, ROOT_DIR)
+
+os.environ.setdefault("ARCH_CHAN_LLM_BACKEND", "fake")
+os.environ.setdefault("ARCH_CHAN_FAKE_LATENCY_MS", "0")
+os.environ.setdefault("ARCH_CHAN_METRICS_PORT", "0")
+os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+
+SYSTEM_INFO_TYPES = ("cpu", "memory", "disk", "uptime", "connections", "services")
+
+# One realistic model answer per agent schema, plus the messier shapes the extractor must tolerate.
+XML_SAMPLES = {
+    "command_response": ("COMMAND_RESPONSE", "<command_response><linux>find ~ -name '*.log' -size +10M && du -sh ~/.cache</linux>"
+                         "<action_type>command_execution</action_type><estimated_duration_type>short</estimated_duration_type>"
+                         "<description>Ara ara~ this finds your big log files and shows how much space the cache uses, "
+                         "sweetie! Nothing gets deleted, nya~</description></command_response>"),
+    "command_response_fenced": ("COMMAND_RESPONSE", "```xml\n<command_response>\n  <linux>ls -la /etc | grep -i &quot;conf&quot;</linux>\n"
+                                "  <action_type>command_execution</action_type>\n  <estimated_duration_type>short</estimated_duration_type>\n"
+                                "  <description>Lists config files &amp; filters them.</description>\n</command_response>\n```"),
+    "weather_request": ("WEATHER_REQUEST", "<weather_request><city>Istanbul</city><days>3</days><unit>celsius</unit></weather_request>"),
+    "search_query": ("SEARCH_QUERY", "<search_query><query>latest linux kernel release notes</query></search_query>"),
+    "calculation_request": ("CALCULATION_REQUEST", "<calculation_request><expression>(12 * 7) + 3 / 2</expression></calculation_request>"),
+    "system_info_request": ("SYSTEM_INFO_REQUEST", "<system_info_request><info_type>memory</info_type></system_info_request>"),
+    "vulnerability_query": ("VULNERABILITY_QUERY", "<vulnerability_query><type>cve_id</type><value>CVE-2021-44228</value></vulnerability_query>"),
+    "hash_request": ("HASH_REQUEST", "<hash_request><action>generate</action><text>hello world</text><hash_type>sha256</hash_type></hash_request>"),
+    "hash_request_error": ("HASH_REQUEST", "<hash_request><error>Could not identify text for hashing.</error></hash_request>"),
+}
+
+class PromptOnlyBot:
+    """Chat bot stand-in that returns nothing, so an agent call measures prompt construction and
+    call overhead only (every agent bails out right after an empty model answer)."""
+
+    def __init__(self):
+        self.prompts = 0
+
+    def process_request(self, user_input, system_prompt, priority=None, task=None):
+        self.prompts += 1
+        return ""
+
+    def process_conversational_request(self, user_input, system_prompt, priority=None):
+        self.prompts += 1
+        return ""
+
+    def stream_request(self, user_input, system_prompt, priority=None, task=None):
+        self.prompts += 1
+        return iter(())
+
+PROMPT_AGENTS = {
+    "linux_command": "Show me the biggest files in my home directory",
+    "weather_gether": "What's the weather in Berlin tomorrow?",
+    "friend_chat": "Good morning Arch-Chan!",
+    "web_search": "Search for the latest Arch Linux news",
+    "calculator": "Calculate 12 * 7 + 3",
+    "system_info": "How much memory is free?",
+    "security_advisor": "How do I spot a phishing email?",
+    "vulnerability_scanner_info": "Tell me about CVE-2014-0160",
+    "hash_checker": "Generate a sha256 hash of 'arch-chan'",
+    "agent_selector": "what's using my RAM",
+}
+
+def _server_benchmarks():
+    import mcp_server
+    from xml_extract import StreamingXMLParser
+
+    benches = {}
+    for name, (schema_name, text) in XML_SAMPLES.items():
+        schema = getattr(mcp_server, schema_name)
+        benches[f"xml.{name}"] = (lambda schema=schema, text=text: schema.parse(text))
+
+    schema, text = mcp_server.COMMAND_RESPONSE, XML_SAMPLES["command_response"][1]
+    chunks = [text[i:i + 40] for i in range(0, len(text), 40)]
+
+    def stream_parse():
+        parser = StreamingXMLParser(schema)
+        for chunk in chunks:
+            parser.feed(chunk)
+        return parser.close()
+    benches["xml.command_response_streamed"] = stream_parse
+
+    for info_type in SYSTEM_INFO_TYPES:
+        benches[f"system_info.{info_type}"] = (lambda info_type=info_type: mcp_server.collect_system_info(info_type))
+
+    short_text = "arch-chan"
+    long_text = "ara ara~ " * 1024
+    for hash_type in ("md5", "sha1", "sha256"):
+        benches[f"hash.{hash_type}_short"] = (lambda hash_type=hash_type: mcp_server.generate_hash(short_text, hash_type))
+        benches[f"hash.{hash_type}_9kb"] = (lambda hash_type=hash_type: mcp_server.generate_hash(long_text, hash_type))
+    benches["hash.identify_sha256"] = lambda: mcp_server.identify_hash("b94d27b9934d3e08a52e52d7da7dabfac484efe37a5380ee9088f7ace2efcde9")
+
+    bot = PromptOnlyBot()
+    for agent, prompt in PROMPT_AGENTS.items():
+        fn = getattr(mcp_server, agent)
+        if agent == "agent_selector":
+            benches[f"prompt.{agent}"] = (lambda fn=fn, prompt=prompt: fn(bot, prompt))
+        else:
+            benches[f"prompt.{agent}"] = (lambda fn=fn, prompt=prompt: fn(prompt, bot))
+
+    benches["server.parse_client_message"] = lambda: mcp_server.parse_client_message(
+        "LANG:English|SESSION:0f8fad5bd9cb469fa16570867728950e|MSG:What's the weather in Istanbul?")
+    short_reply = ("FRIEND_CHAT", "Kyaa~! Your terminal skills make my heart race, master!", "Kyaa~!", "")
+    long_output = "\n".join(f"drwxr-xr-x  2 user user 4096 Jan  1 12:00 directory-{i}" for i in range(400))
+    long_reply = ("LINUX_CMD", "Here's what I found, sweetie!\n" + long_output, "Here's the listing!", long_output)
+    benches["server.encode_response_short"] = lambda: mcp_server.encode_response(*short_reply, mcp_server.FRAME_END)
+    benches["server.encode_response_20kb"] = lambda: mcp_server.encode_response(*long_reply, mcp_server.FRAME_END)
+    return benches
+
+def _client_benchmarks():
+    # The protocol helpers the GUI uses; importing them doesn't need PyQt5.
+    import arch_chan_client as arch_chan
+
+    short_reply = "TYPE:FRIEND_CHAT|CONTENT:Kyaa~! Your terminal skills make my heart race, master!|VOICE_TEXT:Kyaa~!|LINUX_OUTPUT:"
+    long_output = "\n".join(f"drwxr-xr-x  2 user user 4096 Jan  1 12:00 directory-{i}" for i in range(400))
+    long_reply = f"TYPE:LINUX_CMD|CONTENT:Here's what I found!\n{long_output}|VOICE_TEXT:Here's the listing!|LINUX_OUTPUT:{long_output}"
+    frames = (short_reply.encode("utf-8") + arch_chan.FRAME_END) * 8
+
+    def parse_batch():
+        # What listen_for_responses does with one recv() that carried several frames.
+        *complete, _ = frames.split(arch_chan.FRAME_END)
+        return [arch_chan.parse_response(frame.decode("utf-8", errors="replace")) for frame in complete]
+
+    return {
+        "client.parse_response_short": lambda: arch_chan.parse_response(short_reply),
+        "client.parse_response_20kb": lambda: arch_chan.parse_response(long_reply),
+        "client.split_and_parse_8_frames": parse_batch,
+    }
+
+GROUPS = (("server", _server_benchmarks), ("client", _client_benchmarks))
+
+def measure(fn, repeat: int, min_time: float) -> dict:
+    timer = timeit.Timer(fn)
+    number = 1
+    while True:
+        elapsed = timer.timeit(number)
+        if elapsed >= min_time or number >= 1_000_000:
+            break
+        number = max(number * 2, int(number * min_time / max(elapsed, 1e-9)))
+    per_call = [timer.timeit(number) / number * 1e6 for _ in range(repeat)]
+    return {
+        "median_us": round(statistics.median(per_call), 3),
+        "min_us": round(min(per_call), 3),
+        "stdev_us": round(statistics.stdev(per_call), 3) if len(per_call) > 1 else 0.0,
+        "loops": number,
+    }
+
+def collect(name_filter: str):
+    benches, skipped = {}, {}
+    for group, loader in GROUPS:
+        try:
+            loaded = loader()
+        except ImportError as e:
+            skipped[group] = f"{type(e).__name__}: {e}"
+            continue
+        benches.update({name: fn for name, fn in loaded.items() if name_filter in name})
+    return benches, skipped
+
+def compare(results: dict, baseline: dict, tolerance: float) -> list:
+    regressions = []
+    thresholds = baseline.get("thresholds", {})
+    for name, stats in results.items():
+        base = baseline.get("benchmarks", {}).get(name, {}).get("median_us")
+        if not base:
+            continue
+        allowed = thresholds.get(name, tolerance)
+        if stats["median_us"] > base * (1 + allowed):
+            regressions.append(f"{name}: {stats['median_us']:.2f} us vs baseline {base:.2f} us "
+                               f"(+{(stats['median_us'] / base - 1) * 100:.0f}%, allowed +{allowed * 100:.0f}%)")
+    return regressions
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Arch-Chan hot path microbenchmarks")
+    parser.add_argument("--filter", default="", help="only run benchmarks whose name contains this")
+    parser.add_argument("--repeat", type=int, default=5, help="timed rounds per benchmark")
+    parser.add_argument("--min-time", type=float, default=0.2, help="seconds per round (sets the loop count)")
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE, help="baseline JSON to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.30, help="allowed slowdown vs baseline (0.30 = 30%%)")
+    parser.add_argument("--save-baseline", help="write the results to this baseline JSON (keeps its thresholds)")
+    parser.add_argument("--json", dest="json_path", help="write the results to this JSON file")
+    args = parser.parse_args()
+
+    benches, skipped = collect(args.filter)
+    for group, reason in skipped.items():
+        print(f"skipped {group} benchmarks ({reason})")
+    # Agents log a warning for every empty model answer; keep the report readable.
+    logging.disable(logging.CRITICAL)
+
+    baseline = {}
+    if args.baseline and os.path.exists(args.baseline):
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+    base_results = baseline.get("benchmarks", {})
+
+    results = {}
+    print(f"{'benchmark':<40}{'median':>12}{'min':>12}{'baseline':>12}{'change':>9}")
+    for name, fn in sorted(benches.items()):
+        stats = measure(fn, args.repeat, args.min_time)
+        results[name] = stats
+        base = base_results.get(name, {}).get("median_us")
+        change = f"{(stats['median_us'] / base - 1) * 100:+.0f}%" if base else ""
+        print(f"{name:<40}{stats['median_us']:>10.2f}us{stats['min_us']:>10.2f}us"
+              f"{(f'{base:.2f}us' if base else '-'):>12}{change:>9}")
+
+    report = {
+        "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": sys.version.split()[0],
+        "platform": sys.platform,
+        "benchmarks": results,
+    }
+    if args.json_path:
+        os.makedirs(os.path.dirname(os.path.abspath(args.json_path)), exist_ok=True)
+        with open(args.json_path, "w") as f:
+            json.dump(report, f, indent=2)
+    if args.save_baseline:
+        saved = {}
+        if os.path.exists(args.save_baseline):
+            with open(args.save_baseline) as f:
+                saved = json.load(f)
+        report["thresholds"] = saved.get("thresholds", {})
+        report["benchmarks"] = {**saved.get("benchmarks", {}), **results}
+        os.makedirs(os.path.dirname(os.path.abspath(args.save_baseline)), exist_ok=True)
+        with open(args.save_baseline, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"Baseline saved to {args.save_baseline}")
+        return 0
+
+    if not base_results:
+        print(f"No baseline numbers in {args.baseline}; record them with --save-baseline.")
+    else:
+        regressions = compare(results, baseline, args.tolerance)
+        if regressions:
+            print("Regressions:\n  " + "\n  ".join(regressions))
+            return 1
+        print("No regressions against baseline.")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,89 @@
+# benchmarks/startup_bench.py
+# Measures GUI startup: module import time and time-to-first-paint of the main window.
+# Runs arch_chan.py with ARCH_CHAN_STARTUP_BENCH=1 (it exits right after the first paint);
+# use QT_QPA_PLATFORM=offscreen on machines without a display.
+#
+#   python benchmarks/startup_bench.py --runs 5 --save-baseline benchmarks/baselines/startup.json
+#   python benchmarks/startup_bench.py --runs 5 --baseline benchmarks/baselines/startup.json
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+GUI_SCRIPT = os.path.join(ROOT_DIR, "arch_chan.py")
+MARKER = "ARCH_CHAN_STARTUP "
+METRICS = ("import_ms", "first_paint_ms", "first_paint_since_launch_ms")
+
+def run_once(python: str, timeout: float) -> dict:
+    env = dict(os.environ)
+    env["ARCH_CHAN_STARTUP_BENCH"] = "1"
+    env["ARCH_CHAN_BENCH_LAUNCH_TIME"] = repr(time.time())
+    result = subprocess.run([python, GUI_SCRIPT], cwd=ROOT_DIR, env=env, capture_output=True,
+                            text=True, timeout=timeout)
+    for line in result.stdout.splitlines():
+        if line.startswith(MARKER):
+            return json.loads(line[len(MARKER):])
+    raise RuntimeError(f"GUI did not report startup metrics (exit code {result.returncode}):\n{result.stderr[-2000:]}")
+
+def summarize(samples) -> dict:
+    summary = {}
+    for metric in METRICS:
+        values = [s[metric] for s in samples if s.get(metric) is not None]
+        if values:
+            summary[metric] = {
+                "median": round(statistics.median(values), 2),
+                "min": round(min(values), 2),
+                "max": round(max(values), 2),
+            }
+    return summary
+
+def compare(summary: dict, baseline: dict, tolerance: float) -> list:
+    regressions = []
+    for metric, stats in summary.items():
+        base = baseline.get(metric, {}).get("median")
+        if base and stats["median"] > base * (1 + tolerance):
+            regressions.append(f"{metric}: {stats['median']:.1f} ms vs baseline {base:.1f} ms "
+                               f"(+{(stats['median'] / base - 1) * 100:.0f}%, allowed +{tolerance * 100:.0f}%)")
+    return regressions
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Arch-Chan GUI startup benchmark")
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--python", default=sys.executable)
+    parser.add_argument("--timeout", type=float, default=60.0)
+    parser.add_argument("--baseline", help="compare against this baseline JSON and fail on regressions")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="allowed slowdown vs baseline (0.25 = 25%%)")
+    parser.add_argument("--save-baseline", help="write the results to this baseline JSON")
+    args = parser.parse_args()
+
+    samples = []
+    for i in range(args.runs):
+        sample = run_once(args.python, args.timeout)
+        samples.append(sample)
+        print(f"run {i + 1}/{args.runs}: " + ", ".join(f"{k}={v}" for k, v in sample.items()))
+
+    summary = summarize(samples)
+    print(json.dumps(summary, indent=2))
+
+    if args.save_baseline:
+        os.makedirs(os.path.dirname(os.path.abspath(args.save_baseline)), exist_ok=True)
+        with open(args.save_baseline, "w") as f:
+            json.dump(summary, f, indent=2)
+        print(f"Baseline saved to {args.save_baseline}")
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        regressions = compare(summary, baseline, args.tolerance)
+        if regressions:
+            print("Startup regressions:\n  " + "\n  ".join(regressions))
+            return 1
+        print("No startup regressions against baseline.")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
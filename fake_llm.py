@@ -0,0 +1,135 @@
+# fake_llm.py
+# Local stand-in for the Gemini models, used for load tests and offline development
+# (ARCH_CHAN_LLM_BACKEND=fake, see llm_providers.FakeProvider). It recognizes which agent prompt it was given and answers in
+# that prompt's format after a configurable latency, so the whole server path runs without quota.
+import os
+import re
+import math
+import time
+import random
+import hashlib
+import threading
+from typing import Optional, Tuple
+
+LATENCY_DISTRIBUTIONS = ("fixed", "uniform", "normal", "lognormal", "exponential")
+
+class FakeLLMError(Exception):
+    pass
+
+# (agent, pattern) pairs the fake dispatcher uses to answer the agent-selection prompt.
+_ROUTES = [
+    ("vulnerability_scanner_info", re.compile(r"cve-\d{4}-\d+|vulnerab|exploit", re.I)),
+    ("hash_checker", re.compile(r"\b(md5|sha1|sha256|hash)\b", re.I)),
+    ("weather_gether", re.compile(r"weather|forecast|hava", re.I)),
+    ("calculator", re.compile(r"calculate|\d+\s*[-+*/]\s*\d+", re.I)),
+    ("system_info", re.compile(r"\b(cpu|memory|disk|uptime|processes|connections|services)\b", re.I)),
+    ("security_advisor", re.compile(r"phishing|malware|ransomware|password|secure|security", re.I)),
+    ("web_search", re.compile(r"\b(search|news|latest)\b", re.I)),
+    ("linux_command", re.compile(r"\b(command|list|install|run|show files|ls)\b", re.I)),
+]
+
+_FILLER = ("Ara ara~ that's a lovely question, darling! Linux makes everything better, and I'm so happy "
+           "to help you with it, nya~! ")
+
+class FakeLLM:
+    def __init__(self, latency_ms: float = 300.0, jitter_ms: float = 100.0, distribution: str = "lognormal",
+                 error_rate: float = 0.0, seed: Optional[int] = None):
+        if distribution not in LATENCY_DISTRIBUTIONS:
+            raise ValueError(f"Unknown latency distribution '{distribution}'. Use one of {', '.join(LATENCY_DISTRIBUTIONS)}.")
+        self.latency = latency_ms / 1000.0
+        self.jitter = jitter_ms / 1000.0
+        self.distribution = distribution
+        self.error_rate = error_rate
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self.calls = 0
+
+    @classmethod
+    def from_env(cls) -> "FakeLLM":
+        seed = os.getenv("ARCH_CHAN_FAKE_SEED")
+        return cls(latency_ms=float(os.getenv("ARCH_CHAN_FAKE_LATENCY_MS", "300")),
+                   jitter_ms=float(os.getenv("ARCH_CHAN_FAKE_JITTER_MS", "100")),
+                   distribution=os.getenv("ARCH_CHAN_FAKE_LATENCY_DIST", "lognormal"),
+                   error_rate=float(os.getenv("ARCH_CHAN_FAKE_ERROR_RATE", "0")),
+                   seed=int(seed) if seed else None)
+
+    def sample_latency(self) -> Tuple[float, bool]:
+        with self._lock:
+            rnd = self._random
+            if self.distribution == "fixed" or self.latency <= 0:
+                value = self.latency
+            elif self.distribution == "uniform":
+                value = rnd.uniform(self.latency - self.jitter, self.latency + self.jitter)
+            elif self.distribution == "normal":
+                value = rnd.gauss(self.latency, self.jitter)
+            elif self.distribution == "exponential":
+                value = rnd.expovariate(1.0 / self.latency)
+            else:
+                # Log-normal with the given mean and standard deviation: a long right tail like real APIs.
+                sigma2 = math.log(1 + (self.jitter / self.latency) ** 2)
+                value = rnd.lognormvariate(math.log(self.latency) - sigma2 / 2, math.sqrt(sigma2))
+            failed = rnd.random() < self.error_rate
+            self.calls += 1
+        return max(0.0, value), failed
+
+    def complete(self, system_prompt: str, user_input: str) -> str:
+        latency, failed = self.sample_latency()
+        time.sleep(latency)
+        if failed:
+            raise FakeLLMError("503 Service Unavailable (injected by the fake LLM backend)")
+        return self.answer(system_prompt, user_input)
+
+    def stream(self, system_prompt: str, user_input: str, chunk_size: int = 40):
+        # First chunk after half the latency, the rest spread over the other half.
+        latency, failed = self.sample_latency()
+        text = self.answer(system_prompt, user_input)
+        chunks = [text[i:i + chunk_size] for i in range(0, len(text), chunk_size)] or [""]
+        time.sleep(latency / 2)
+        if failed:
+            raise FakeLLMError("503 Service Unavailable (injected by the fake LLM backend)")
+        for chunk in chunks:
+            yield chunk
+            time.sleep(latency / 2 / len(chunks))
+
+    def answer(self, system_prompt: str, user_input: str) -> str:
+        if "task dispatcher" in system_prompt:
+            for agent, pattern in _ROUTES:
+                if pattern.search(user_input):
+                    return agent
+            return "friend_chat"
+        if "<command_response>" in system_prompt:
+            return ("<command_response><linux>echo arch-chan-load-test</linux>"
+                    "<action_type>command_execution</action_type>"
+                    "<estimated_duration_type>short</estimated_duration_type>"
+                    f"<description>{_FILLER}This just prints a line, sweetie!</description></command_response>")
+        if "<weather_request>" in system_prompt:
+            cities = re.findall(r"\b([A-Z][a-zçğıöşü]+)\b", user_input)
+            city = next((c for c in cities if c not in ("What", "How", "Tell", "Weather", "The")), "Istanbul")
+            return f"<weather_request><city>{city}</city><days>1</days><unit>celsius</unit></weather_request>"
+        if "<search_query>" in system_prompt:
+            query = re.sub(r"^(search( for)?|find)\s+", "", user_input.strip(), flags=re.I)
+            return f"<search_query><query>{query}</query></search_query>"
+        if "simulating a web search engine" in system_prompt:
+            return f"Search results for this topic show several recent articles. {_FILLER * 2}"
+        if "<calculation_request>" in system_prompt:
+            expression = "".join(re.findall(r"[\d.+\-*/()% ]+", user_input)).strip() or "2 + 2"
+            return f"<calculation_request><expression>{expression}</expression></calculation_request>"
+        if "<system_info_request>" in system_prompt:
+            match = re.search(r"\b(cpu|memory|disk|uptime|connections|services)\b", user_input, re.I)
+            return f"<system_info_request><info_type>{match.group(1).lower() if match else 'cpu'}</info_type></system_info_request>"
+        if "<vulnerability_query>" in system_prompt:
+            cve = re.search(r"cve-\d{4}-\d+", user_input, re.I)
+            if cve:
+                return f"<vulnerability_query><type>cve_id</type><value>{cve.group(0).upper()}</value></vulnerability_query>"
+            return "<vulnerability_query><type>software</type><value>OpenSSL 1.0.1</value></vulnerability_query>"
+        if "cybersecurity vulnerability related to" in system_prompt:
+            return f"This vulnerability allows remote attackers to read memory. Update to a fixed version. {_FILLER}"
+        if "<hash_request>" in system_prompt:
+            quoted = re.search(r"['\"]([^'\"]+)['\"]", user_input)
+            if quoted:
+                return (f"<hash_request><action>generate</action><text>{quoted.group(1)}</text>"
+                        f"<hash_type>sha256</hash_type></hash_request>")
+            digest = hashlib.md5(user_input.encode("utf-8")).hexdigest()
+            return (f"<hash_request><action>check</action><hash_value>{digest}</hash_value>"
+                    f"<hash_type_provided>unknown</hash_type_provided></hash_request>")
+        return _FILLER * 2
@@ -0,0 +1,173 @@
+# llm_capture.py
+# Records LLM traffic to an append-only JSON Lines log and replays it, so the agents and
+# handle_client can be benchmarked and profiled with the same model outputs every run:
+#   ARCH_CHAN_LLM_RECORD=llm-traffic.jsonl      record every provider call (prompts are hashed)
+#   ARCH_CHAN_LLM_REPLAY=llm-traffic.jsonl      answer from the log instead of calling a model
+#   ARCH_CHAN_LLM_REPLAY_LATENCY=1              ...and sleep for each call's recorded latency
+import os
+import json
+import time
+import logging
+import threading
+from typing import Dict, Iterator, List
+
+from llm_runtime import request_key
+from llm_providers import LLMProvider, LLMProviderError, History
+
+logger = logging.getLogger(__name__)
+
+# Longest user input kept in a record, only so the log can be read; replay matches on the key.
+PREVIEW_CHARS = 200
+
+def call_key(kind: str, system_prompt: str, user_input: str) -> str:
+    # Shortened digest: unique enough for a traffic log and keeps the records small.
+    return request_key(kind, system_prompt, user_input)[:32]
+
+class TrafficLog:
+    """One JSON object per line: {"k": key, "p": provider, "c": kind, "in": input preview,
+    "out": response, "ms": latency, "t": unix time}. Lines are only ever appended."""
+
+    def __init__(self, path: str):
+        self.path = os.path.expanduser(path)
+        self._lock = threading.Lock()
+        self._file = None
+        self.records = 0
+
+    def append(self, provider: str, kind: str, key: str, user_input: str, response: str, seconds: float):
+        line = json.dumps({"k": key, "p": provider, "c": kind, "in": user_input[:PREVIEW_CHARS], "out": response,
+                           "ms": round(seconds * 1000, 1), "t": round(time.time(), 3)}, ensure_ascii=False)
+        with self._lock:
+            if self._file is None:
+                directory = os.path.dirname(self.path)
+                if directory:
+                    os.makedirs(directory, exist_ok=True)
+                self._file = open(self.path, "a", encoding="utf-8")
+            self._file.write(line + "\n")
+            self._file.flush()
+            self.records += 1
+
+    def read(self) -> Iterator[dict]:
+        with open(self.path, encoding="utf-8") as f:
+            for number, line in enumerate(f, 1):
+                if not line.strip():
+                    continue
+                try:
+                    yield json.loads(line)
+                except ValueError:
+                    # A run that was killed mid-write leaves a partial last line.
+                    logger.warning(f"Skipping unreadable line {number} of {self.path}.")
+
+    def close(self):
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+class RecordingProvider(LLMProvider):
+    """Passes calls through to `inner` and appends each prompt/response pair with its latency."""
+
+    def __init__(self, inner: LLMProvider, log: TrafficLog):
+        super().__init__(inner.model)
+        self.inner = inner
+        self.log = log
+        self.name = inner.name
+        self.metered = inner.metered
+        self.resilience = inner.resilience
+
+    def complete(self, system_prompt: str, user_input: str) -> str:
+        started = time.perf_counter()
+        response = self.inner.complete(system_prompt, user_input)
+        self.log.append(self.name, "complete", call_key("complete", system_prompt, user_input), user_input,
+                        response, time.perf_counter() - started)
+        return response
+
+    def stream(self, system_prompt: str, user_input: str) -> Iterator[str]:
+        # Recorded like a completion once the stream has finished; replay re-chunks it.
+        started = time.perf_counter()
+        chunks = []
+        for chunk in self.inner.stream(system_prompt, user_input):
+            chunks.append(chunk)
+            yield chunk
+        self.log.append(self.name, "complete", call_key("complete", system_prompt, user_input), user_input,
+                        "".join(chunks), time.perf_counter() - started)
+
+    def chat(self, history: History, message: str) -> str:
+        started = time.perf_counter()
+        response = self.inner.chat(history, message)
+        self.log.append(self.name, "chat", call_key("chat", "", message), message, response,
+                        time.perf_counter() - started)
+        return response
+
+    def start_chat(self, history: History):
+        # The provider's own session object keeps working; only its sends are recorded.
+        session = self.inner.start_chat(history)
+        send = session.send
+
+        def recorded_send(message: str) -> str:
+            started = time.perf_counter()
+            response = send(message)
+            self.log.append(self.name, "chat", call_key("chat", "", message), message, response,
+                            time.perf_counter() - started)
+            return response
+
+        session.send = recorded_send
+        return session
+
+    def warm_up(self):
+        self.inner.warm_up()
+
+class ReplayProvider(LLMProvider):
+    """Serves recorded responses by key. A key recorded several times is answered with its
+    recordings in order, cycling, so repeated prompts replay the same sequence every run.
+    Chat turns are matched on the message alone, not the history."""
+
+    def __init__(self, name: str, records: List[dict], with_latency: bool = False, chunk_size: int = 40):
+        super().__init__(f"replay:{name}")
+        self.name = name
+        self.with_latency = with_latency
+        self.chunk_size = chunk_size
+        self._responses: Dict[str, List[dict]] = {}
+        for record in records:
+            self._responses.setdefault(record["k"], []).append(record)
+        self._next: Dict[str, int] = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def _answer(self, key: str, preview: str) -> dict:
+        with self._lock:
+            recorded = self._responses.get(key)
+            if not recorded:
+                self.misses += 1
+                raise LLMProviderError(f"No recorded {self.name} response for '{preview[:80]}'.")
+            index = self._next.get(key, 0)
+            self._next[key] = (index + 1) % len(recorded)
+            self.hits += 1
+        record = recorded[index]
+        if self.with_latency:
+            time.sleep(record.get("ms", 0) / 1000)
+        return record
+
+    def complete(self, system_prompt: str, user_input: str) -> str:
+        return self._answer(call_key("complete", system_prompt, user_input), user_input)["out"]
+
+    def stream(self, system_prompt: str, user_input: str) -> Iterator[str]:
+        record = self._answer(call_key("complete", system_prompt, user_input), user_input)
+        text = record["out"]
+        for i in range(0, len(text), self.chunk_size):
+            yield text[i:i + self.chunk_size]
+
+    def chat(self, history: History, message: str) -> str:
+        return self._answer(call_key("chat", "", message), message)["out"]
+
+def load_replay(path: str, with_latency: bool = False) -> Dict[str, ReplayProvider]:
+    # One replay provider per provider name found in the log.
+    by_provider: Dict[str, List[dict]] = {}
+    log = TrafficLog(path)
+    for record in log.read():
+        by_provider.setdefault(record.get("p", "gemini"), []).append(record)
+    if not by_provider:
+        raise LLMProviderError(f"No recorded LLM traffic in {log.path}.")
+    logger.info(f"Replaying LLM traffic from {log.path}: "
+                + ", ".join(f"{len(records)} {name} calls" for name, records in sorted(by_provider.items())))
+    return {name: ReplayProvider(name, records, with_latency) for name, records in by_provider.items()}
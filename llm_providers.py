@@ -0,0 +1,360 @@
+# llm_providers.py
+# Pluggable LLM backends behind one small interface (complete, stream, chat with history), and a
+# router that picks a backend per task and agent. Cheap structured calls (agent routing, argument
+# extraction) can run on a local model while free-form chat stays on Gemini, e.g.
+#   ARCH_CHAN_LLM_BACKEND=gemini
+#   ARCH_CHAN_LLM_ROUTES="routing=llamacpp,extraction=llamacpp"
+# SDKs are imported when a backend is first used, so only the configured ones need installing.
+import os
+import json
+import logging
+import threading
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+
+from llm_runtime import CircuitBreaker, ResilientCaller, llm_resilience
+
+logger = logging.getLogger(__name__)
+
+# Chat history entries are (role, text) with Gemini's role names: "user" and "model".
+History = List[Tuple[str, str]]
+
+# What a call is for. Routes can name a task, an agent, or "<agent>.<task>".
+TASKS = ("routing", "extraction", "generation", "chat")
+
+class LLMProviderError(Exception):
+    pass
+
+class ChatSession:
+    """Stateful conversation on top of a provider's stateless chat call."""
+
+    def __init__(self, provider: "LLMProvider", history: History):
+        self.provider = provider
+        self.history: History = list(history)
+
+    def send(self, message: str) -> str:
+        text = self.provider.chat(self.history, message)
+        self.history.extend([("user", message), ("model", text)])
+        return text
+
+class LLMProvider:
+    name = "base"
+    # Metered providers share the process-wide quota scheduler (llm_runtime.llm_scheduler).
+    metered = False
+
+    def __init__(self, model: str):
+        self.model = model
+        self.resilience: ResilientCaller = llm_resilience
+
+    def complete(self, system_prompt: str, user_input: str) -> str:
+        raise NotImplementedError
+
+    def stream(self, system_prompt: str, user_input: str) -> Iterator[str]:
+        yield self.complete(system_prompt, user_input)
+
+    def chat(self, history: History, message: str) -> str:
+        raise NotImplementedError
+
+    def start_chat(self, history: History) -> ChatSession:
+        return ChatSession(self, history)
+
+    def warm_up(self):
+        pass
+
+    @staticmethod
+    def _messages(history: History, message: str, system_prompt: Optional[str] = None) -> List[Dict[str, str]]:
+        # OpenAI-style message list, used by the OpenAI-compatible and llama.cpp backends.
+        messages = [{"role": "system", "content": system_prompt}] if system_prompt else []
+        messages.extend({"role": "assistant" if role == "model" else "user", "content": text} for role, text in history)
+        messages.append({"role": "user", "content": message})
+        return messages
+
+class GeminiChatSession(ChatSession):
+    # Keeps the SDK's own chat object, which carries the history between calls.
+    def __init__(self, provider: "GeminiProvider", history: History):
+        self.provider = provider
+        self._chat = provider.model_sdk.start_chat(history=[{"role": role, "parts": [text]} for role, text in history])
+
+    @property
+    def history(self) -> History:
+        return [(content.role, "".join(part.text for part in content.parts if getattr(part, "text", None)))
+                for content in self._chat.history]
+
+    @history.setter
+    def history(self, history: History):
+        self._chat = self.provider.model_sdk.start_chat(history=[{"role": role, "parts": [text]} for role, text in history])
+
+    def send(self, message: str) -> str:
+        return self._chat.send_message(message).text
+
+class GeminiProvider(LLMProvider):
+    name = "gemini"
+    metered = True
+
+    def __init__(self, model: str = "gemini-2.0-flash", api_key: Optional[str] = None):
+        super().__init__(model)
+        api_key = api_key or os.getenv("GEMINI_API_KEY")
+        if not api_key:
+            raise LLMProviderError("GEMINI_API_KEY is not set.")
+        import google.generativeai as genai
+        from langchain_google_generai import ChatGoogleGenerativeAI
+        from langchain_core.prompts import ChatPromptTemplate
+        from langchain_core.output_parsers import StrOutputParser
+        genai.configure(api_key=api_key)
+        self.model_sdk = genai.GenerativeModel(model)
+        self.model_lc = ChatGoogleGenerativeAI(model=model, google_api_key=api_key, temperature=0)
+        self._prompt_template = ChatPromptTemplate
+        self._parser = StrOutputParser
+
+    def _chain(self, system_prompt: str):
+        prompt_template = self._prompt_template.from_messages([
+            ("system", system_prompt),
+            ("user", "{user_input}")
+        ])
+        return prompt_template | self.model_lc | self._parser()
+
+    def complete(self, system_prompt: str, user_input: str) -> str:
+        return self._chain(system_prompt).invoke({"user_input": user_input})
+
+    def stream(self, system_prompt: str, user_input: str) -> Iterator[str]:
+        return self._chain(system_prompt).stream({"user_input": user_input})
+
+    def chat(self, history: History, message: str) -> str:
+        session = GeminiChatSession(self, history)
+        return session.send(message)
+
+    def start_chat(self, history: History) -> ChatSession:
+        return GeminiChatSession(self, history)
+
+class OpenAICompatibleProvider(LLMProvider):
+    """Any server speaking the OpenAI chat completions API: llama.cpp's llama-server, Ollama,
+    vLLM, LM Studio, LocalAI..."""
+    name = "openai"
+
+    def __init__(self, model: str, base_url: str = "http://127.0.0.1:8080/v1", api_key: Optional[str] = None,
+                 timeout: float = 60.0, max_tokens: int = 1024, metered: bool = False):
+        super().__init__(model)
+        import requests
+        self.base_url = base_url.rstrip("/")
+        self.timeout = timeout
+        self.max_tokens = max_tokens
+        self.metered = metered
+        self._session = requests.Session()
+        if api_key:
+            self._session.headers["Authorization"] = f"Bearer {api_key}"
+
+    def _post(self, messages: List[Dict[str, str]], stream: bool):
+        response = self._session.post(
+            f"{self.base_url}/chat/completions",
+            json={"model": self.model, "messages": messages, "temperature": 0, "max_tokens": self.max_tokens,
+                  "stream": stream},
+            timeout=self.timeout, stream=stream)
+        if response.status_code >= 400:
+            # Status code first so llm_runtime.is_transient_error recognizes 429/5xx.
+            raise LLMProviderError(f"{response.status_code} from {self.base_url}: {response.text[:200]}")
+        return response
+
+    def complete(self, system_prompt: str, user_input: str) -> str:
+        data = self._post(self._messages([], user_input, system_prompt), stream=False).json()
+        return data["choices"][0]["message"]["content"] or ""
+
+    def stream(self, system_prompt: str, user_input: str) -> Iterator[str]:
+        response = self._post(self._messages([], user_input, system_prompt), stream=True)
+        with response:
+            for line in response.iter_lines(decode_unicode=True):
+                if not line or not line.startswith("data:"):
+                    continue
+                payload = line[5:].strip()
+                if payload == "[DONE]":
+                    break
+                delta = json.loads(payload)["choices"][0].get("delta", {}).get("content")
+                if delta:
+                    yield delta
+
+    def chat(self, history: History, message: str) -> str:
+        data = self._post(self._messages(history, message), stream=False).json()
+        return data["choices"][0]["message"]["content"] or ""
+
+class LlamaCppProvider(LLMProvider):
+    """Small quantized GGUF model run in-process on the CPU with llama-cpp-python."""
+    name = "llamacpp"
+
+    def __init__(self, model_path: str, n_ctx: int = 4096, n_threads: Optional[int] = None, max_tokens: int = 512):
+        super().__init__(os.path.basename(model_path))
+        if not os.path.exists(model_path):
+            raise LLMProviderError(f"GGUF model not found: {model_path}")
+        self.model_path = model_path
+        self.n_ctx = n_ctx
+        self.n_threads = n_threads
+        self.max_tokens = max_tokens
+        self._llama = None
+        # A llama.cpp context runs one generation at a time.
+        self._lock = threading.Lock()
+
+    def warm_up(self):
+        with self._lock:
+            self._load()
+
+    def _load(self):
+        if self._llama is None:
+            from llama_cpp import Llama
+            self._llama = Llama(model_path=self.model_path, n_ctx=self.n_ctx, n_threads=self.n_threads, verbose=False)
+            logger.info(f"Loaded local model {self.model_path} (context {self.n_ctx}, threads {self.n_threads or 'auto'}).")
+        return self._llama
+
+    def _generate(self, messages: List[Dict[str, str]]) -> str:
+        with self._lock:
+            result = self._load().create_chat_completion(messages=messages, temperature=0, max_tokens=self.max_tokens)
+        return result["choices"][0]["message"]["content"] or ""
+
+    def complete(self, system_prompt: str, user_input: str) -> str:
+        return self._generate(self._messages([], user_input, system_prompt))
+
+    def stream(self, system_prompt: str, user_input: str) -> Iterator[str]:
+        with self._lock:
+            chunks = self._load().create_chat_completion(messages=self._messages([], user_input, system_prompt),
+                                                         temperature=0, max_tokens=self.max_tokens, stream=True)
+            for chunk in chunks:
+                delta = chunk["choices"][0].get("delta", {}).get("content")
+                if delta:
+                    yield delta
+
+    def chat(self, history: History, message: str) -> str:
+        return self._generate(self._messages(history, message))
+
+class FakeProvider(LLMProvider):
+    # Stands in for Gemini in load tests (see fake_llm.py), so it is metered like Gemini.
+    name = "fake"
+    metered = True
+
+    def __init__(self):
+        from fake_llm import FakeLLM
+        self.fake = FakeLLM.from_env()
+        super().__init__("fake")
+        logger.warning(f"Using the fake LLM backend ({self.fake.distribution} latency, mean {self.fake.latency * 1000:.0f} ms).")
+
+    def complete(self, system_prompt: str, user_input: str) -> str:
+        return self.fake.complete(system_prompt, user_input)
+
+    def stream(self, system_prompt: str, user_input: str) -> Iterator[str]:
+        return self.fake.stream(system_prompt, user_input)
+
+    def chat(self, history: History, message: str) -> str:
+        # Conversational messages carry their system prompt inline.
+        return self.fake.complete(message, message)
+
+def _optional_int(name: str) -> Optional[int]:
+    value = os.getenv(name)
+    return int(value) if value else None
+
+PROVIDER_FACTORIES: Dict[str, Callable[[], LLMProvider]] = {
+    "gemini": lambda: GeminiProvider(os.getenv("ARCH_CHAN_GEMINI_MODEL", "gemini-2.0-flash")),
+    "openai": lambda: OpenAICompatibleProvider(
+        os.getenv("ARCH_CHAN_OPENAI_MODEL", "local"),
+        base_url=os.getenv("ARCH_CHAN_OPENAI_BASE_URL", "http://127.0.0.1:8080/v1"),
+        api_key=os.getenv("ARCH_CHAN_OPENAI_API_KEY"),
+        timeout=float(os.getenv("ARCH_CHAN_OPENAI_TIMEOUT", "60")),
+        metered=os.getenv("ARCH_CHAN_OPENAI_METERED", "0") == "1"),
+    "llamacpp": lambda: LlamaCppProvider(
+        os.path.expanduser(os.getenv("ARCH_CHAN_GGUF_MODEL", "")),
+        n_ctx=int(os.getenv("ARCH_CHAN_GGUF_CTX", "4096")),
+        n_threads=_optional_int("ARCH_CHAN_GGUF_THREADS")),
+    "fake": FakeProvider,
+}
+
+def parse_routes(spec: str) -> Dict[str, str]:
+    # "routing=llamacpp, extraction=llamacpp, web_search.generation=gemini" -> {key: provider}
+    routes = {}
+    for item in spec.split(","):
+        key, sep, provider = item.partition("=")
+        if not sep or not key.strip() or not provider.strip():
+            if item.strip():
+                logger.warning(f"Ignoring malformed LLM route '{item.strip()}' (expected key=provider).")
+            continue
+        routes[key.strip()] = provider.strip().lower()
+    return routes
+
+class ProviderRouter:
+    """Picks the provider for a call from the routes, most specific key first:
+    "<agent>.<task>", "<agent>", "<task>", then the default provider."""
+
+    def __init__(self, default: Optional[str] = None, routes: Optional[Dict[str, str]] = None,
+                 factories: Optional[Dict[str, Callable[[], LLMProvider]]] = None):
+        self.default = (default or os.getenv("ARCH_CHAN_LLM_BACKEND", "gemini")).lower()
+        self.routes = routes if routes is not None else parse_routes(os.getenv("ARCH_CHAN_LLM_ROUTES", ""))
+        self.factories = factories or PROVIDER_FACTORIES
+        self._providers: Dict[str, LLMProvider] = {}
+        self._lock = threading.Lock()
+        for name in self.configured():
+            if name not in self.factories:
+                raise LLMProviderError(f"Unknown LLM provider '{name}'. Use one of {', '.join(sorted(self.factories))}.")
+        # Traffic capture and replay (see llm_capture.py).
+        self.record_path = os.getenv("ARCH_CHAN_LLM_RECORD")
+        self.replay_path = os.getenv("ARCH_CHAN_LLM_REPLAY")
+        self.replay_latency = os.getenv("ARCH_CHAN_LLM_REPLAY_LATENCY", "0") == "1"
+        self._traffic_log = None
+        self._replay: Optional[Dict[str, LLMProvider]] = None
+
+    def configured(self) -> List[str]:
+        return sorted({self.default, *self.routes.values()})
+
+    def uses(self, name: str) -> bool:
+        # While replaying a recording no provider is called, so none of their API keys are needed.
+        if self.replay_path:
+            return False
+        return name in self.configured()
+
+    def get(self, name: str) -> LLMProvider:
+        with self._lock:
+            provider = self._providers.get(name)
+            if provider is None:
+                provider = self._create(name)
+                self._providers[name] = provider
+                logger.info(f"LLM provider '{name}' ready (model {provider.model}).")
+            return provider
+
+    def _create(self, name: str) -> LLMProvider:
+        if self.replay_path:
+            from llm_capture import load_replay
+            if self._replay is None:
+                self._replay = load_replay(self.replay_path, self.replay_latency)
+            provider = self._replay.get(name)
+            if provider is None:
+                raise LLMProviderError(f"{self.replay_path} has no recorded traffic for provider '{name}'.")
+            # A replay miss is a deterministic answer, not an outage: no retries, never trip the breaker.
+            provider.resilience = ResilientCaller()
+            provider.resilience.hedging = False
+            provider.resilience.retries = 0
+            provider.resilience.breaker = CircuitBreaker(threshold=2 ** 31)
+            return provider
+        provider = self.factories[name]()
+        if not provider.metered:
+            # Local backends get their own latency stats and breaker; a duplicate request
+            # would only compete for the same CPU, so they are never hedged.
+            provider.resilience = ResilientCaller()
+            provider.resilience.hedging = False
+        if self.record_path:
+            from llm_capture import TrafficLog, RecordingProvider
+            if self._traffic_log is None:
+                self._traffic_log = TrafficLog(self.record_path)
+                logger.info(f"Recording LLM traffic to {self._traffic_log.path}.")
+            provider = RecordingProvider(provider, self._traffic_log)
+        return provider
+
+    def close(self):
+        if self._traffic_log is not None:
+            self._traffic_log.close()
+
+    def resolve(self, task: str, agent: Optional[str] = None) -> LLMProvider:
+        for key in (f"{agent}.{task}" if agent else None, agent, task):
+            if key and key in self.routes:
+                return self.get(self.routes[key])
+        return self.get(self.default)
+
+    def warm_up(self):
+        # Builds every configured provider (and loads local models) before the server reports ready.
+        for name in self.configured():
+            self.get(name).warm_up()
+
+    def loaded(self) -> Dict[str, LLMProvider]:
+        with self._lock:
+            return dict(self._providers)
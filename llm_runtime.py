@@ -0,0 +1,524 @@
+# llm_runtime.py
+# Process-wide controls around outbound LLM calls.
+import os
+import time
+import heapq
+import queue
+import random
+import hashlib
+import itertools
+import threading
+import logging
+from collections import deque
+from concurrent.futures import Future, FIRST_COMPLETED, wait
+from typing import Callable, Deque, Dict, Iterable, Iterator, List, Optional, Tuple, TypeVar
+
+from profiling import profiler
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+def request_key(*parts: str) -> str:
+    digest = hashlib.sha256()
+    for part in parts:
+        digest.update(part.encode("utf-8"))
+        digest.update(b"\0")
+    return digest.hexdigest()
+
+class SingleFlight:
+    """Coalesces identical concurrent calls: the first caller for a key runs the call, callers
+    arriving while it is in flight wait on its future and share the result. Nothing is kept
+    after the call completes, so results are never stale."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._in_flight: Dict[str, Future] = {}
+        self.calls = 0
+        self.coalesced = 0
+
+    def do(self, key: str, fn: Callable[[], T]) -> Tuple[T, bool]:
+        with self._lock:
+            future = self._in_flight.get(key)
+            leader = future is None
+            if leader:
+                future = Future()
+                self._in_flight[key] = future
+                self.calls += 1
+            else:
+                self.coalesced += 1
+
+        if not leader:
+            logger.info(f"Coalesced duplicate LLM request {key[:12]} with the one already in flight.")
+            return future.result(), True
+
+        try:
+            result = fn()
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        else:
+            future.set_result(result)
+            return result, False
+        finally:
+            with self._lock:
+                del self._in_flight[key]
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            in_flight = len(self._in_flight)
+        return {"calls": self.calls, "coalesced": self.coalesced, "in_flight": in_flight}
+
+llm_singleflight = SingleFlight()
+
+# Scheduling priorities, lower runs first. Routing and argument extraction sit on the critical
+# path of an interactive reply; longer generations come next; batch jobs only use spare quota.
+PRIORITY_INTERACTIVE = 0
+PRIORITY_NORMAL = 1
+PRIORITY_BACKGROUND = 2
+PRIORITY_NAMES = {PRIORITY_INTERACTIVE: "interactive", PRIORITY_NORMAL: "normal", PRIORITY_BACKGROUND: "background"}
+
+class RateLimitTimeout(Exception):
+    pass
+
+def estimate_tokens(*texts: str) -> int:
+    # Rough rule of thumb for English/Turkish text; good enough for admission control.
+    return max(1, sum(len(text) for text in texts) // 4)
+
+class TokenBucket:
+    def __init__(self, rate_per_minute: float, burst_fraction: float = 0.25):
+        self.rate = rate_per_minute / 60.0
+        self.capacity = max(1.0, rate_per_minute * burst_fraction)
+        self.level = self.capacity
+        self._updated = time.monotonic()
+
+    def _refill(self, now: float):
+        self.level = min(self.capacity, self.level + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def wait_time(self, amount: float, now: float) -> float:
+        self._refill(now)
+        # A request larger than the whole bucket is admitted once the bucket is full.
+        needed = min(amount, self.capacity)
+        if self.level >= needed:
+            return 0.0
+        return (needed - self.level) / self.rate
+
+    def consume(self, amount: float):
+        # May go negative: usage reported after the call is paid back before new admissions.
+        self.level -= amount
+
+class _Waiter:
+    __slots__ = ("priority", "vtime", "seq", "tokens", "session_key")
+
+    def __init__(self, priority: int, vtime: float, seq: int, tokens: int, session_key: str):
+        self.priority = priority
+        self.vtime = vtime
+        self.seq = seq
+        self.tokens = tokens
+        self.session_key = session_key
+
+    def __lt__(self, other: "_Waiter") -> bool:
+        return (self.priority, self.vtime, self.seq) < (other.priority, other.vtime, other.seq)
+
+class LLMScheduler:
+    """Process-wide admission control for LLM calls.
+
+    Calls wait in a priority queue until both the requests/min and tokens/min buckets allow
+    them. Within a priority level, sessions are served in virtual-time order (start-time fair
+    queueing), so one busy client cannot starve the others.
+
+    The configured limits are for the whole server: with ARCH_CHAN_WORKERS pre-forked worker
+    processes, each worker enforces an equal share of them.
+    """
+
+    def __init__(self, requests_per_minute: Optional[float] = None, tokens_per_minute: Optional[float] = None,
+                 max_wait: Optional[float] = None):
+        workers = max(1, int(os.getenv("ARCH_CHAN_WORKERS", "1")))
+        rpm = float(os.getenv("ARCH_CHAN_LLM_RPM", "60")) / workers if requests_per_minute is None else requests_per_minute
+        tpm = float(os.getenv("ARCH_CHAN_LLM_TPM", "1000000")) / workers if tokens_per_minute is None else tokens_per_minute
+        self.max_wait = float(os.getenv("ARCH_CHAN_LLM_MAX_QUEUE_WAIT", "120")) if max_wait is None else max_wait
+        self.request_bucket = TokenBucket(rpm) if rpm > 0 else None
+        self.token_bucket = TokenBucket(tpm) if tpm > 0 else None
+        self._cond = threading.Condition()
+        self._heap: List[_Waiter] = []
+        self._seq = itertools.count()
+        self._vtime = 0.0
+        self._session_vtime: Dict[str, float] = {}
+        self._waits: Deque[float] = deque(maxlen=1000)
+        self.admitted = {name: 0 for name in PRIORITY_NAMES.values()}
+        self.timeouts = 0
+        self.max_queue_depth = 0
+
+    def _blocking_wait(self, waiter: _Waiter, now: float) -> float:
+        if not self._heap or self._heap[0] is not waiter:
+            return -1.0
+        wait = 0.0
+        if self.request_bucket is not None:
+            wait = max(wait, self.request_bucket.wait_time(1, now))
+        if self.token_bucket is not None:
+            wait = max(wait, self.token_bucket.wait_time(waiter.tokens, now))
+        return wait
+
+    def acquire(self, priority: int = PRIORITY_INTERACTIVE, session_key: str = "", tokens: int = 1) -> float:
+        enqueued = time.monotonic()
+        with self._cond:
+            start = max(self._vtime, self._session_vtime.get(session_key, 0.0))
+            waiter = _Waiter(priority, start, next(self._seq), tokens, session_key)
+            self._session_vtime[session_key] = start + 1.0
+            heapq.heappush(self._heap, waiter)
+            self.max_queue_depth = max(self.max_queue_depth, len(self._heap))
+            try:
+                while True:
+                    now = time.monotonic()
+                    wait = self._blocking_wait(waiter, now)
+                    if wait == 0.0:
+                        break
+                    remaining = self.max_wait - (now - enqueued)
+                    if remaining <= 0:
+                        self.timeouts += 1
+                        raise RateLimitTimeout(f"LLM call waited more than {self.max_wait:.0f}s for rate limit capacity.")
+                    # Not at the head: sleep until notified. At the head: sleep until the buckets refill.
+                    self._cond.wait(min(remaining, wait) if wait > 0 else remaining)
+            except BaseException:
+                self._heap.remove(waiter)
+                heapq.heapify(self._heap)
+                self._cond.notify_all()
+                raise
+
+            heapq.heappop(self._heap)
+            if self.request_bucket is not None:
+                self.request_bucket.consume(1)
+            if self.token_bucket is not None:
+                self.token_bucket.consume(tokens)
+            self._vtime = max(self._vtime, waiter.vtime)
+            if len(self._session_vtime) > 1000:
+                self._session_vtime = {k: v for k, v in self._session_vtime.items() if v > self._vtime}
+            name = PRIORITY_NAMES.get(priority, str(priority))
+            self.admitted[name] = self.admitted.get(name, 0) + 1
+            self._cond.notify_all()
+
+        waited = time.monotonic() - enqueued
+        self._waits.append(waited)
+        if waited > 1.0:
+            logger.info(f"LLM call ({PRIORITY_NAMES.get(priority, priority)}) waited {waited:.1f}s for rate limit capacity.")
+        return waited
+
+    def try_acquire(self, priority: int = PRIORITY_INTERACTIVE, tokens: int = 1) -> bool:
+        # Only succeeds when nobody is queued and capacity is available right now (used for hedging).
+        with self._cond:
+            if self._heap:
+                return False
+            now = time.monotonic()
+            if self.request_bucket is not None and self.request_bucket.wait_time(1, now) > 0:
+                return False
+            if self.token_bucket is not None and self.token_bucket.wait_time(tokens, now) > 0:
+                return False
+            if self.request_bucket is not None:
+                self.request_bucket.consume(1)
+            if self.token_bucket is not None:
+                self.token_bucket.consume(tokens)
+            name = PRIORITY_NAMES.get(priority, str(priority))
+            self.admitted[name] = self.admitted.get(name, 0) + 1
+            return True
+
+    def record_usage(self, extra_tokens: int):
+        # Response tokens are only known after the call; charge them so tokens/min stays honest.
+        if self.token_bucket is None or extra_tokens <= 0:
+            return
+        with self._cond:
+            self.token_bucket.consume(extra_tokens)
+
+    def stats(self) -> Dict:
+        with self._cond:
+            depth = len(self._heap)
+            waiting = {name: 0 for name in PRIORITY_NAMES.values()}
+            for waiter in self._heap:
+                name = PRIORITY_NAMES.get(waiter.priority, str(waiter.priority))
+                waiting[name] = waiting.get(name, 0) + 1
+        waits = sorted(self._waits)
+        return {
+            "queue_depth": depth,
+            "queue_depth_by_priority": waiting,
+            "max_queue_depth": self.max_queue_depth,
+            "admitted": dict(self.admitted),
+            "timeouts": self.timeouts,
+            "wait_p50_ms": round(waits[len(waits) // 2] * 1000, 1) if waits else 0.0,
+            "wait_p95_ms": round(waits[min(len(waits) - 1, int(len(waits) * 0.95))] * 1000, 1) if waits else 0.0,
+            "wait_max_ms": round(waits[-1] * 1000, 1) if waits else 0.0,
+        }
+
+llm_scheduler = LLMScheduler()
+
+class LLMTimeout(Exception):
+    pass
+
+class CircuitOpenError(Exception):
+    pass
+
+# Error markers of failures that are worth retrying: quota/overload, 5xx and network hiccups.
+TRANSIENT_MARKERS = ("429", "500", "502", "503", "504", "resourceexhausted", "resource exhausted",
+                     "unavailable", "deadline", "timeout", "timed out", "connection", "internalservererror",
+                     "too many requests", "overloaded")
+
+def is_transient_error(error: BaseException) -> bool:
+    if isinstance(error, (ConnectionError, TimeoutError)):
+        return True
+    text = f"{type(error).__name__} {error}".lower()
+    return any(marker in text for marker in TRANSIENT_MARKERS)
+
+def _percentile(sorted_values: List[float], fraction: float) -> float:
+    return sorted_values[min(len(sorted_values) - 1, int(len(sorted_values) * fraction))]
+
+class LatencyTracker:
+    """Recent successful call latencies per key, used to derive deadlines and hedge delays. Callers
+    key by task and provider so short routing calls and long generations keep separate percentiles."""
+
+    def __init__(self, window: int = 200, min_samples: int = 20):
+        self.window = window
+        self.min_samples = min_samples
+        self._lock = threading.Lock()
+        self._samples: Dict[str, Deque[float]] = {}
+
+    def record(self, kind: str, seconds: float):
+        with self._lock:
+            self._samples.setdefault(kind, deque(maxlen=self.window)).append(seconds)
+
+    def percentile(self, kind: str, fraction: float) -> Optional[float]:
+        with self._lock:
+            samples = sorted(self._samples.get(kind, ()))
+        if len(samples) < self.min_samples:
+            return None
+        return _percentile(samples, fraction)
+
+    def stats(self) -> Dict[str, Dict[str, float]]:
+        with self._lock:
+            snapshot = {kind: sorted(samples) for kind, samples in self._samples.items()}
+        return {kind: {"samples": len(values),
+                       "p50_ms": round(_percentile(values, 0.50) * 1000, 1),
+                       "p95_ms": round(_percentile(values, 0.95) * 1000, 1),
+                       "p99_ms": round(_percentile(values, 0.99) * 1000, 1)}
+                for kind, values in snapshot.items() if values}
+
+class CircuitBreaker:
+    """Opens after `threshold` consecutive failed calls and fails fast for `cooldown` seconds;
+    then lets a single probe call through (half-open) and closes again if it succeeds."""
+
+    def __init__(self, threshold: int = 5, cooldown: float = 30.0):
+        self.threshold = threshold
+        self.cooldown = cooldown
+        self._lock = threading.Lock()
+        self.state = "closed"
+        self._failures = 0
+        self._opened_at = 0.0
+        self._probe_in_flight = False
+        self.rejected = 0
+        self.trips = 0
+
+    def allow(self) -> bool:
+        with self._lock:
+            if self.state == "closed":
+                return True
+            if self.state == "open" and time.monotonic() - self._opened_at >= self.cooldown:
+                self.state = "half_open"
+                self._probe_in_flight = False
+            if self.state == "half_open" and not self._probe_in_flight:
+                self._probe_in_flight = True
+                return True
+            self.rejected += 1
+            return False
+
+    def record_success(self):
+        with self._lock:
+            if self.state != "closed":
+                logger.info("LLM upstream recovered. Circuit breaker closed.")
+            self.state = "closed"
+            self._failures = 0
+            self._probe_in_flight = False
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            if self.state == "half_open" or (self.state == "closed" and self._failures >= self.threshold):
+                self.state = "open"
+                self._opened_at = time.monotonic()
+                self._probe_in_flight = False
+                self.trips += 1
+                logger.warning(f"LLM upstream unhealthy after {self._failures} failed call(s). "
+                               f"Circuit breaker open for {self.cooldown:.0f}s.")
+
+    def is_open(self) -> bool:
+        with self._lock:
+            return self.state == "open" and time.monotonic() - self._opened_at < self.cooldown
+
+class ResilientCaller:
+    """Runs blocking LLM calls with an adaptive deadline, an optional hedged duplicate after the
+    observed p95, jittered retries for transient errors and a shared circuit breaker.
+
+    Attempts run on daemon threads because the SDK calls cannot be cancelled: an attempt that
+    misses its deadline is abandoned and its late result discarded.
+    """
+
+    def __init__(self):
+        self.min_timeout = float(os.getenv("ARCH_CHAN_LLM_TIMEOUT_MIN", "5"))
+        self.max_timeout = float(os.getenv("ARCH_CHAN_LLM_TIMEOUT_MAX", "60"))
+        self.retries = int(os.getenv("ARCH_CHAN_LLM_RETRIES", "2"))
+        self.hedging = os.getenv("ARCH_CHAN_LLM_HEDGE", "1") == "1"
+        self.backoff_base = 0.5
+        self.backoff_cap = 8.0
+        self.latency = LatencyTracker()
+        self.breaker = CircuitBreaker(int(os.getenv("ARCH_CHAN_BREAKER_THRESHOLD", "5")),
+                                      float(os.getenv("ARCH_CHAN_BREAKER_COOLDOWN", "30")))
+        self._lock = threading.Lock()
+        self.counters = {"calls": 0, "timeouts": 0, "retries": 0, "hedges": 0, "hedge_wins": 0,
+                         "hedges_refused": 0, "failures": 0}
+
+    def _count(self, name: str):
+        with self._lock:
+            self.counters[name] += 1
+
+    def deadline_for(self, kind: str) -> float:
+        # Generous multiple of p99 so only genuinely stuck calls are cut off; max until we have data.
+        p99 = self.latency.percentile(kind, 0.99)
+        if p99 is None:
+            return self.max_timeout
+        return min(self.max_timeout, max(self.min_timeout, p99 * 2))
+
+    def _start(self, fn: Callable[[], T], kind: str) -> Future:
+        future: Future = Future()
+
+        def run():
+            future.set_running_or_notify_cancel()
+            started = time.monotonic()
+            try:
+                result = fn()
+            except BaseException as e:
+                future.set_exception(e)
+            else:
+                self.latency.record(kind, time.monotonic() - started)
+                future.set_result(result)
+
+        threading.Thread(target=profiler.worker(run), name=f"llm-{kind}", daemon=True).start()
+        return future
+
+    def _attempt(self, fn: Callable[[], T], kind: str, deadline: float, hedge: bool,
+                 try_admit: Optional[Callable[[], bool]]) -> T:
+        started = time.monotonic()
+        primary = self._start(fn, kind)
+        futures = [primary]
+        hedge_delay = self.latency.percentile(kind, 0.95) if hedge and self.hedging else None
+        hedged = False
+        last_error: Optional[BaseException] = None
+        while True:
+            now = time.monotonic()
+            if now >= deadline:
+                self._count("timeouts")
+                raise LLMTimeout(f"LLM call ({kind}) exceeded its {deadline - started:.1f}s deadline.")
+            timeout = deadline - now
+            if hedge_delay is not None and not hedged:
+                timeout = min(timeout, max(0.0, started + hedge_delay - now))
+            done, _ = wait(futures, timeout=timeout, return_when=FIRST_COMPLETED)
+            for future in done:
+                if future.exception() is None:
+                    if future is not primary:
+                        self._count("hedge_wins")
+                    return future.result()
+                last_error = future.exception()
+            futures = [future for future in futures if not future.done()]
+            if not futures:
+                raise last_error
+            if hedge_delay is not None and not hedged and time.monotonic() >= started + hedge_delay:
+                # A single chance: when the limiter refuses the hedge, wait for the primary until the
+                # deadline instead of polling the scheduler in a loop.
+                hedged = True
+                if try_admit is None or try_admit():
+                    self._count("hedges")
+                    logger.info(f"LLM call ({kind}) slower than p95 ({hedge_delay:.1f}s). Sent a hedged duplicate.")
+                    futures.append(self._start(fn, kind))
+                else:
+                    self._count("hedges_refused")
+
+    def call(self, fn: Callable[[], T], kind: str = "default", hedge: bool = False,
+             admit: Optional[Callable[[], object]] = None, try_admit: Optional[Callable[[], bool]] = None) -> T:
+        # `admit` is called before every retry and `try_admit` before a hedge, so both go through
+        # the rate limiter; the first attempt must already be admitted by the caller.
+        if not self.breaker.allow():
+            raise CircuitOpenError("LLM upstream is unhealthy; failing fast.")
+        self._count("calls")
+        deadline = time.monotonic() + self.deadline_for(kind)
+        attempt = 0
+        while True:
+            try:
+                result = self._attempt(fn, kind, deadline, hedge, try_admit)
+            except Exception as e:
+                if not isinstance(e, LLMTimeout) and is_transient_error(e) and attempt < self.retries:
+                    # Full jitter keeps clients that failed together from retrying together.
+                    delay = random.uniform(0, min(self.backoff_cap, self.backoff_base * (2 ** attempt)))
+                    if time.monotonic() + delay < deadline:
+                        attempt += 1
+                        self._count("retries")
+                        logger.warning(f"Transient LLM error ({e}). Retry {attempt}/{self.retries} in {delay:.2f}s.")
+                        time.sleep(delay)
+                        if admit is not None:
+                            try:
+                                admit()
+                            except Exception:
+                                # Still settle the breaker, or a half-open probe would stay in flight forever.
+                                self._count("failures")
+                                self.breaker.record_failure()
+                                raise
+                        continue
+                self._count("failures")
+                self.breaker.record_failure()
+                raise
+            self.breaker.record_success()
+            return result
+
+    def stream(self, start: Callable[[], Iterable[str]], kind: str = "stream") -> Iterator[str]:
+        # Streamed calls get the breaker and the adaptive deadline, but no retries or hedging:
+        # chunks already handed to the caller cannot be taken back.
+        if not self.breaker.allow():
+            raise CircuitOpenError("LLM upstream is unhealthy; failing fast.")
+        self._count("calls")
+        chunks: "queue.Queue" = queue.Queue()
+        done = object()
+        started = time.monotonic()
+        deadline = started + self.deadline_for(kind)
+
+        def pump():
+            try:
+                for chunk in start():
+                    chunks.put(chunk)
+                chunks.put(done)
+            except BaseException as e:
+                chunks.put(e)
+
+        threading.Thread(target=profiler.worker(pump), name=f"llm-{kind}", daemon=True).start()
+        while True:
+            try:
+                item = chunks.get(timeout=max(0.0, deadline - time.monotonic()))
+            except queue.Empty:
+                self._count("timeouts")
+                self._count("failures")
+                self.breaker.record_failure()
+                raise LLMTimeout(f"LLM stream ({kind}) exceeded its {deadline - started:.1f}s deadline.")
+            if item is done:
+                break
+            if isinstance(item, BaseException):
+                self._count("failures")
+                self.breaker.record_failure()
+                raise item
+            yield item
+        self.latency.record(kind, time.monotonic() - started)
+        self.breaker.record_success()
+
+    def stats(self) -> Dict:
+        with self._lock:
+            counters = dict(self.counters)
+        counters["breaker_state"] = self.breaker.state
+        counters["breaker_trips"] = self.breaker.trips
+        counters["breaker_rejected"] = self.breaker.rejected
+        counters["latency"] = self.latency.stats()
+        return counters
+
+llm_resilience = ResilientCaller()
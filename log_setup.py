@@ -0,0 +1,228 @@
+# log_setup.py
+# Logging for the server and the GUI. The calling thread only puts a record on an in-memory queue;
+# a listener thread does the console and file I/O. Files hold one JSON object per line and are
+# rotated and gzip-compressed. Each record carries the ID of the request it was logged for.
+# Repetitive messages are rate-limited per call site, and long message texts are cut short.
+import os
+import sys
+import copy
+import gzip
+import json
+import time
+import uuid
+import queue
+import shutil
+import logging
+import logging.handlers
+import threading
+import contextvars
+from contextlib import contextmanager
+from typing import Dict, Iterator, List, Optional, Tuple
+
+DEFAULT_LOG_DIR = os.path.join(os.path.expanduser("~"), ".local", "state", "arch-chan", "logs")
+CONSOLE_FORMAT = '%(asctime)s - %(levelname)s - %(threadName)s - %(request_tag)s%(message)s'
+
+_request_id: contextvars.ContextVar = contextvars.ContextVar("arch_chan_request_id", default=None)
+
+def current_request_id() -> Optional[str]:
+    return _request_id.get()
+
+@contextmanager
+def request_context(request_id: Optional[str] = None) -> Iterator[str]:
+    # Work started from here (threads started with a copy of the context included) logs under this ID.
+    request_id = request_id or uuid.uuid4().hex[:12]
+    token = _request_id.set(request_id)
+    try:
+        yield request_id
+    finally:
+        _request_id.reset(token)
+
+def preview(text: object, limit: int = 80) -> str:
+    # For log lines that quote user input or command output.
+    text = str(text)
+    if len(text) <= limit:
+        return text
+    return f"{text[:limit]}... [{len(text)} chars]"
+
+class RepeatFilter(logging.Filter):
+    """Rate limit per call site (logger and line number). Within each `window` seconds the first
+    `burst` records pass; after that only every `sample_every`-th one does (0 drops them all).
+    The next record from that site that passes reports how many were dropped. CRITICAL always passes."""
+
+    def __init__(self, burst: int = 20, window: float = 60.0, sample_every: int = 100):
+        super().__init__()
+        self.burst = burst
+        self.window = window
+        self.sample_every = sample_every
+        # (logger, line) -> [window start, records in window, dropped since the last one that passed]
+        self._sites: Dict[Tuple[str, int], List] = {}
+        self._lock = threading.Lock()
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno >= logging.CRITICAL:
+            return True
+        key = (record.name, record.lineno)
+        now = time.monotonic()
+        with self._lock:
+            site = self._sites.get(key)
+            if site is None or now - site[0] >= self.window:
+                site = [now, 0, site[2] if site else 0]
+                self._sites[key] = site
+            site[1] += 1
+            if site[1] > self.burst and (self.sample_every <= 0 or site[1] % self.sample_every):
+                site[2] += 1
+                return False
+            suppressed, site[2] = site[2], 0
+        if suppressed:
+            record.suppressed = suppressed
+        return True
+
+class _Listener(logging.handlers.QueueListener):
+    def enqueue_sentinel(self):
+        # Blocks while the queue is full instead of failing; the listener thread is draining it.
+        self.queue.put(self._sentinel)
+
+class BoundedQueueHandler(logging.handlers.QueueHandler):
+    """Renders the message in the calling thread (its arguments may change afterwards), cuts it to
+    `max_chars` and tags it with the request ID. Records are dropped, and counted, while the
+    queue is full rather than blocking the caller."""
+
+    def __init__(self, log_queue: queue.Queue, max_chars: int = 2000):
+        super().__init__(log_queue)
+        self.max_chars = max_chars
+        self.listener: Optional[logging.handlers.QueueListener] = None
+        self.dropped = 0
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        message = record.getMessage()
+        if len(message) > self.max_chars:
+            message = f"{message[:self.max_chars]}... [{len(message)} chars]"
+        record = copy.copy(record)
+        record.msg = message
+        record.args = None
+        record.message = message
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        record.request_id = _request_id.get()
+        if self.dropped:
+            record.dropped, self.dropped = self.dropped, 0
+        return record
+
+    def enqueue(self, record: logging.LogRecord):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+    def close(self):
+        # logging.shutdown() (at exit, or when a worker process ends) drains the queue first.
+        listener, self.listener = self.listener, None
+        if listener is not None:
+            listener.stop()
+        super().close()
+
+def _annotations(record: logging.LogRecord) -> str:
+    notes = ""
+    if getattr(record, "suppressed", 0):
+        notes += f" [+{record.suppressed} similar suppressed]"
+    if getattr(record, "dropped", 0):
+        notes += f" [{record.dropped} records dropped, log queue full]"
+    return notes
+
+class ConsoleFormatter(logging.Formatter):
+    def format(self, record: logging.LogRecord) -> str:
+        request_id = getattr(record, "request_id", None)
+        record.request_tag = f"[{request_id}] " if request_id else ""
+        return super().format(record) + _annotations(record)
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": time.strftime("%Y-%m-%dT%H:%M:%S", time.localtime(record.created)) + f".{int(record.msecs):03d}",
+            "level": record.levelname,
+            "logger": record.name,
+            "thread": record.threadName,
+            "pid": record.process,
+            "msg": record.getMessage(),
+        }
+        for field in ("request_id", "suppressed", "dropped", "exc_text"):
+            value = getattr(record, field, None)
+            if value:
+                entry["exc" if field == "exc_text" else field] = value
+        return json.dumps(entry, ensure_ascii=False)
+
+def _gzip_rotator(source: str, dest: str):
+    with open(source, "rb") as src, gzip.open(dest, "wb") as dst:
+        shutil.copyfileobj(src, dst)
+    os.remove(source)
+
+def _file_handler(path: str) -> Optional[logging.Handler]:
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        handler = logging.handlers.RotatingFileHandler(
+            path, maxBytes=int(float(os.getenv("ARCH_CHAN_LOG_MAX_MB", "10")) * 1024 * 1024),
+            backupCount=int(os.getenv("ARCH_CHAN_LOG_BACKUPS", "5")), encoding="utf-8", delay=True)
+    except OSError as e:
+        print(f"Could not open log file {path}, logging to the console only: {e}", file=sys.stderr)
+        return None
+    handler.namer = lambda name: name + ".gz"
+    handler.rotator = _gzip_rotator
+    handler.setFormatter(JsonFormatter())
+    return handler
+
+class _Pipeline:
+    def __init__(self, name: str, console: logging.Handler, log_dir: str):
+        self.name = name
+        self.console = console
+        self.log_dir = log_dir
+        self.file: Optional[logging.Handler] = None
+        self.handler: Optional[BoundedQueueHandler] = None
+
+    def start(self, file_name: str):
+        handlers = [self.console]
+        if self.log_dir:
+            self.file = _file_handler(os.path.join(self.log_dir, file_name))
+            if self.file is not None:
+                handlers.append(self.file)
+        # Created after the output handlers, so logging.shutdown() closes (and drains) it before them.
+        handler = BoundedQueueHandler(queue.Queue(int(os.getenv("ARCH_CHAN_LOG_QUEUE", "10000"))),
+                                      int(os.getenv("ARCH_CHAN_LOG_MAX_CHARS", "2000")))
+        handler.addFilter(RepeatFilter(int(os.getenv("ARCH_CHAN_LOG_BURST", "20")),
+                                       float(os.getenv("ARCH_CHAN_LOG_WINDOW", "60")),
+                                       int(os.getenv("ARCH_CHAN_LOG_SAMPLE_EVERY", "100"))))
+        handler.listener = _Listener(handler.queue, *handlers, respect_handler_level=True)
+        handler.listener.start()
+        root = logging.getLogger()
+        if self.handler is not None:
+            root.removeHandler(self.handler)
+        root.addHandler(handler)
+        self.handler = handler
+
+_pipeline: Optional[_Pipeline] = None
+
+def setup_logging(name: str, level: Optional[str] = None):
+    """Routes the root logger through the queue. `name` picks the log file (<log dir>/<name>.log);
+    ARCH_CHAN_LOG_DIR="" keeps logs on the console only."""
+    global _pipeline
+    if _pipeline is not None:
+        return
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+    console = logging.StreamHandler()
+    console.setFormatter(ConsoleFormatter(CONSOLE_FORMAT))
+    _pipeline = _Pipeline(name, console, os.getenv("ARCH_CHAN_LOG_DIR", DEFAULT_LOG_DIR))
+    _pipeline.start(f"{name}.log")
+    root.setLevel((level or os.getenv("ARCH_CHAN_LOG_LEVEL", "INFO")).upper())
+
+def restart_after_fork(suffix: str):
+    # The listener thread doesn't exist in a forked child, so it gets a fresh queue and listener,
+    # and its own file (<name>.<suffix>.log): rotating one file from several processes loses lines.
+    if _pipeline is None:
+        return
+    # The inherited listener must not be stopped here: its queue's lock may have been held at fork time.
+    _pipeline.handler.listener = None
+    if _pipeline.file is not None:
+        _pipeline.file.close()
+    _pipeline.start(f"{_pipeline.name}.{suffix}.log")
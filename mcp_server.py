@@ -3,12 +3,8 @@ import os
 import sys
 import socket
 import threading
-from typing import Optional, Tuple
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
 from dotenv import load_dotenv
-import google.generativeai as genai
-from langchain_google_generai import ChatGoogleGenerativeAI
-from langchain_core.prompts import ChatPromptTemplate
-from langchain_core.output_parsers import StrOutputParser
 import logging
 import xml.etree.ElementTree as ET
 import re
@@ -18,11 +14,26 @@ import time
 import datetime
 import psutil
 import hashlib
-
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(levelname)s - %(threadName)s - %(message)s'
-)
+import signal
+import ast
+import operator
+import contextvars
+from concurrent.futures import Future, ThreadPoolExecutor
+from session_store import SessionStore, SessionLimitError
+from voice_summary import summarize_for_voice
+from readiness import inherited_listen_socket, notify_ready, notify_stopping
+from prefork import WorkerSupervisor, reuse_port_supported
+from llm_runtime import (llm_singleflight, llm_scheduler, llm_resilience, request_key, estimate_tokens,
+                         RateLimitTimeout, CircuitOpenError, PRIORITY_INTERACTIVE, PRIORITY_NORMAL)
+from metrics import (metrics, MetricsServer, request_trace, subtask_trace, current_trace, span, record_stage, traced_agent,
+                     count_error)
+from profiling import profiler, register_admin_routes, install_signal_handlers
+from xml_extract import XMLSchema, XMLExtractError, StreamingXMLParser
+from llm_providers import ProviderRouter, LLMProvider
+from semantic_cache import semantic_cache
+from log_setup import setup_logging, request_context, preview
+
+setup_logging("mcp_server")
 logger = logging.getLogger(__name__)
 
 # Global language variable.
@@ -30,12 +41,18 @@ logger = logging.getLogger(__name__)
 # requesting different languages concurrently.
 language = "English"
 
+WEATHER_API_URL = os.getenv("ARCH_CHAN_WEATHER_URL", "https://api.weatherapi.com/v1/forecast.xml")
+SERVER_PORT = int(os.getenv("ARCH_CHAN_PORT", "12345"))
+
 def load_env_variables() -> Tuple[str, str, str]:
     load_dotenv()
     gemini_api = os.getenv("GEMINI_API_KEY")
     weather_api = os.getenv("WEATHER_API_KEY")
     
     if not gemini_api or not weather_api:
+        # Without Gemini in the provider routes (local models, the fake backend) the keys are optional.
+        if not llm_router.uses("gemini"):
+            return gemini_api or "", weather_api or "", ""
         raise ValueError("API keys not found in .env file :(")
     return gemini_api, weather_api, ""
 
@@ -47,52 +64,224 @@ def detect_linux_distro():
         logger.error(f"Linux distro not detected: {e}")
         return "Linux"
 
+# Shared by every client session, so a (re)connecting client doesn't pay for SDK setup or model loading again.
+llm_router = ProviderRouter()
+
 class GeminiChatBot:
-    def __init__(self):
-        self.api_key, _, _ = load_env_variables()
-        self._initialize_model()
-        logger.info("GeminiChatBot instance created and model initialized for a client session.")
-
-    def _initialize_model(self):
-        genai.configure(api_key=self.api_key)
-        self.model = genai.GenerativeModel('gemini-2.0-flash')
+    # Named after the original Gemini-only backend; each call now goes to the provider llm_router picks.
+    def __init__(self, history: Optional[List[Tuple[str, str]]] = None, min_priority: int = PRIORITY_INTERACTIVE):
+        self.router = llm_router
+        # Rate-limit fairness is per chat bot, i.e. per client session.
+        self.fairness_key = f"bot-{id(self):x}"
+        self.min_priority = min_priority
+        # Sub-tasks of a compound request may talk to the chat at the same time; sends must not interleave.
+        self._chat_lock = threading.Lock()
+        self._initialize_chat(history or [])
+        logger.info("GeminiChatBot instance created from the shared provider router for a client session.")
+
+    def _provider(self, task: str) -> LLMProvider:
+        trace = current_trace()
+        return self.router.resolve(task, trace.agent if trace is not None and trace.agent != "none" else None)
+
+    def _initialize_chat(self, history: List[Tuple[str, str]]):
         # Each GeminiChatBot instance will have its own chat session.
-        self.chat = self.model.start_chat(history=[])
-        logger.info("Gemini model chat session started with empty history.")
-        
-    def process_request(self, user_input: str, system_prompt: str) -> Optional[str]:
-        # This method is stateless and doesn't use chat history directly (new with LangChain).
+        self.chat_provider = self.router.resolve("chat")
+        self.chat = self.chat_provider.start_chat(history)
+        logger.info(f"{self.chat_provider.name} chat session started with {len(history)} history entries.")
+
+    def export_history(self) -> List[Tuple[str, str]]:
+        return list(self.chat.history)
+
+    def trim_history(self, max_bytes: int) -> int:
+        # Drops the oldest user/model exchanges until the history fits into max_bytes.
+        history = self.chat.history
+        sizes = [len(role) + len(text.encode('utf-8')) for role, text in history]
+        total = sum(sizes)
+        dropped = 0
+        while total > max_bytes and len(history) - dropped > 2:
+            total -= sizes[dropped] + sizes[dropped + 1]
+            dropped += 2
+        if dropped:
+            self.chat.history = history[dropped:]
+        return dropped
+
+    def _wait_for_capacity(self, priority: int, tokens: int) -> bool:
+        # Background bots (batch jobs) never run ahead of interactive clients.
         try:
-            model_lc = ChatGoogleGenerativeAI(
-                model="gemini-2.0-flash",
-                google_api_key=self.api_key,
-                temperature=0 
-            )
-            
-            prompt_template = ChatPromptTemplate.from_messages([
-                ("system", system_prompt),
-                ("user", "{user_input}")
-            ])
-
-            chain = prompt_template | model_lc | StrOutputParser()
-            result = chain.invoke({"user_input": user_input})
+            llm_scheduler.acquire(max(priority, self.min_priority), self.fairness_key, tokens)
+            return True
+        except RateLimitTimeout as e:
+            logger.error(str(e))
+            return False
+
+    def _call_llm(self, provider: LLMProvider, fn: Callable[[], str], kind: str, task: str, priority: int,
+                  tokens: int, hedge: bool) -> Optional[str]:
+        resilience = provider.resilience
+        # Deadlines and hedge delays come from the latencies of the same task on the same provider;
+        # short routing calls must not share percentiles with long generations.
+        latency_key = f"{task}:{provider.name}"
+        # Fail fast while the upstream is known to be down instead of queueing for quota first.
+        if resilience.breaker.is_open():
+            count_error("llm_circuit_open")
+            logger.warning(f"Skipping {kind} LLM call to {provider.name}: circuit breaker is open.")
+            return None
+        metrics.inc("arch_chan_llm_provider_calls_total", {"provider": provider.name, "kind": kind})
+        if not provider.metered:
+            try:
+                return resilience.call(fn, kind=latency_key, hedge=False)
+            except CircuitOpenError as e:
+                count_error("llm_circuit_open")
+                logger.warning(str(e))
+                return None
+        if not self._wait_for_capacity(priority, tokens):
+            count_error("llm_rate_limited")
+            return None
+        priority = max(priority, self.min_priority)
+        try:
+            result = resilience.call(
+                fn, kind=latency_key, hedge=hedge,
+                admit=lambda: llm_scheduler.acquire(priority, self.fairness_key, tokens),
+                try_admit=lambda: llm_scheduler.try_acquire(priority, tokens))
+            llm_scheduler.record_usage(estimate_tokens(result))
             return result
+        except CircuitOpenError as e:
+            count_error("llm_circuit_open")
+            logger.warning(str(e))
+            return None
+
+    def process_request(self, user_input: str, system_prompt: str, priority: int = PRIORITY_INTERACTIVE,
+                        task: str = "extraction") -> Optional[str]:
+        # This method is stateless and deterministic (temperature 0), so identical requests that
+        # arrive while one is already in flight wait for it and share its answer.
+        provider = self._provider(task)
+        # Routing and extraction answers are reused for rephrasings of an earlier request.
+        cache_scope = request_key(provider.name, provider.model, system_prompt) if semantic_cache.caches(task) else None
+        if cache_scope is not None:
+            with span("semantic_cache"):
+                cached = semantic_cache.get(cache_scope, user_input)
+            if cached is not None:
+                return cached
+        key = request_key(provider.name, provider.model, system_prompt, user_input)
+        with span("llm"):
+            result, _ = llm_singleflight.do(key, lambda: self._invoke_stateless(provider, user_input, system_prompt, priority, task))
+        if cache_scope is not None and result:
+            semantic_cache.put(cache_scope, user_input, result)
+        return result
+
+    def _invoke_stateless(self, provider: LLMProvider, user_input: str, system_prompt: str,
+                          priority: int = PRIORITY_INTERACTIVE, task: str = "extraction") -> Optional[str]:
+        try:
+            # Stateless calls are idempotent, so a slow one may be hedged with a duplicate.
+            return self._call_llm(provider, lambda: provider.complete(system_prompt, user_input), "stateless", task,
+                                  priority, estimate_tokens(system_prompt, user_input), hedge=True)
 
         except Exception as e:
-            logger.error(f"Error processing stateless request via LangChain: {str(e)}")
+            count_error("llm")
+            logger.error(f"Error processing stateless request via {provider.name}: {str(e)}")
             return None
 
-    def process_conversational_request(self, user_input: str, system_prompt: str) -> Optional[str]:
-        # This method is stateful and uses self.chat (Gemini API's own history mechanism).
+    def stream_request(self, user_input: str, system_prompt: str, priority: int = PRIORITY_INTERACTIVE,
+                       task: str = "extraction") -> Iterator[str]:
+        # Stateless like process_request, but yields the answer chunk by chunk. Errors end the stream
+        # early; callers see what arrived so far.
+        provider = self._provider(task)
+        if provider.resilience.breaker.is_open():
+            count_error("llm_circuit_open")
+            logger.warning(f"Skipping streamed LLM call to {provider.name}: circuit breaker is open.")
+            return
+        tokens = estimate_tokens(system_prompt, user_input)
+        if provider.metered and not self._wait_for_capacity(priority, tokens):
+            count_error("llm_rate_limited")
+            return
+        metrics.inc("arch_chan_llm_provider_calls_total", {"provider": provider.name, "kind": "stream"})
+        received = 0
+        started = time.perf_counter()
+        try:
+            for chunk in provider.resilience.stream(lambda: provider.stream(system_prompt, user_input),
+                                                      kind=f"stream:{task}:{provider.name}"):
+                received += len(chunk)
+                yield chunk
+        except Exception as e:
+            count_error("llm")
+            logger.error(f"Error processing streamed request via {provider.name}: {str(e)}")
+        finally:
+            record_stage("llm", time.perf_counter() - started)
+            if provider.metered:
+                llm_scheduler.record_usage(received // 4)
+
+    def process_conversational_request(self, user_input: str, system_prompt: str, priority: int = PRIORITY_NORMAL) -> Optional[str]:
+        # This method is stateful and uses self.chat (the chat provider keeps the history).
+        # Never hedged: two concurrent sends would both append to the history.
         try:
-            response = self.chat.send_message(f"{system_prompt}\n{user_input}")
-            return response.text
+            with span("llm"), self._chat_lock:
+                return self._call_llm(self.chat_provider, lambda: self.chat.send(f"{system_prompt}\n{user_input}"),
+                                      "conversational", "chat", priority, estimate_tokens(system_prompt, user_input),
+                                      hedge=False)
         except Exception as e:
+            count_error("llm")
             logger.error(f"Error processing conversational request with history: {str(e)}")
             return None
 
 # --- Agent Functions ---
 
+def run_in_background(fn: Callable, *args) -> Future:
+    # Runs fn on a daemon thread that shares the caller's context (so its spans land in the same trace).
+    future: Future = Future()
+    context = contextvars.copy_context()
+
+    def run():
+        future.set_running_or_notify_cancel()
+        try:
+            future.set_result(context.run(fn, *args))
+        except BaseException as e:
+            future.set_exception(e)
+
+    threading.Thread(target=profiler.worker(run), name="CommandRunner", daemon=True).start()
+    return future
+
+def run_linux_command(linux_command_text: str, duration_type: str) -> str:
+    timeout_seconds = 15
+    if duration_type == "medium":
+        timeout_seconds = 60
+    elif duration_type == "long":
+        timeout_seconds = 300
+
+    try:
+        logger.info(f"Executing command: '{linux_command_text}' with timeout: {timeout_seconds}s (duration type: {duration_type})")
+        with span("subprocess"):
+            terminal_output_bytes = sub.check_output(
+                linux_command_text, 
+                shell=True,
+                timeout=timeout_seconds, 
+                stderr=sub.STDOUT
+            )
+        terminal_output_str = terminal_output_bytes.decode(errors='replace').strip()
+        terminal_output = f"\nCommand executed successfully:\n{terminal_output_str}"
+    except sub.CalledProcessError as e:
+        error_output_str = e.output.decode(errors='replace').strip() if e.output else "No specific error message from command."
+        logger.error(f"Command '{linux_command_text}' failed with exit code {e.returncode}: {preview(error_output_str, 200)}")
+        terminal_output = f"\nError executing command (exit code {e.returncode}):\n{error_output_str}"
+    except sub.TimeoutExpired as e:
+        timeout_msg = f"The command '{linux_command_text}' timed out after {timeout_seconds} seconds, nya~! " \
+                      f"It seems to be a very long-running process. I had to stop it, so I don't have the full results. " \
+                      f"If you want to try again, maybe we can try with an even longer wait time, or you could run it in a separate terminal, sweetie!"
+        captured_output_before_timeout = e.output.decode(errors='replace').strip() if e.output else ""
+        logger.error(f"Command timed out: {linux_command_text}. Partial output: '{preview(captured_output_before_timeout, 200)}'")
+        if captured_output_before_timeout:
+            terminal_output = f"\n{timeout_msg}\nPartial output before timeout:\n{captured_output_before_timeout}"
+        else:
+            terminal_output = f"\n{timeout_msg}"
+    except FileNotFoundError:
+        logger.error(f"Command not found: {linux_command_text}")
+        terminal_output = f"\nError: The command '{linux_command_text}' was not found on the system, nya~."
+    except Exception as e:
+        logger.error(f"Command execution error for '{linux_command_text}': {type(e).__name__} - {e}")
+        terminal_output = f"\nAn unexpected error occurred while executing the command: {type(e).__name__} - {e}"
+    return terminal_output
+
+COMMAND_RESPONSE = XMLSchema("command_response", ["linux", "action_type", "estimated_duration_type", "description"])
+
+@traced_agent
 def linux_command(user_input: str, chat_bot: GeminiChatBot) -> Tuple[str, str, str]:
     distro_name = detect_linux_distro()
     system_prompt_code_generator = f"""
@@ -103,10 +292,12 @@ def linux_command(user_input: str, chat_bot: GeminiChatBot) -> Tuple[str, str, s
     I should format my response according to this XML structure:
     <command_response>
         <linux>Command Goes Here (if applicable, e.g., 'ls -l /var/log' or 'sudo ufw status')</linux>
-        <description>Description/Explanation/Troubleshooting steps/Security advice Go Here (In a sweet and friendly tone). If the command is known to take a long time (e.g., vulnerability scans like 'nmap --script vuln'), please mention this in the description and advise patience.</description>
         <action_type>command_execution OR info_only OR troubleshooting_advice OR security_advice</action_type>
-        <estimated_duration_type>short OR medium OR long</estimated_duration_type> </command_response>
+        <estimated_duration_type>short OR medium OR long</estimated_duration_type>
+        <description>Description/Explanation/Troubleshooting steps/Security advice Go Here (In a sweet and friendly tone). If the command is known to take a long time (e.g., vulnerability scans like 'nmap --script vuln'), please mention this in the description and advise patience.</description>
+    </command_response>
 
+    Always write the tags in the order shown: <linux>, <action_type> and <estimated_duration_type> come before <description>.
     Write the {distro_name} command inside the <linux> tag. If no direct command is needed (e.g., just advice), leave it empty.
     Write the command's explanation/troubleshooting steps/security advice inside the <description> tag in a sweet and friendly way.
     Explain what the command does in simple and clear language.
@@ -126,109 +317,96 @@ def linux_command(user_input: str, chat_bot: GeminiChatBot) -> Tuple[str, str, s
     Output:
     <command_response>
         <linux>sudo netstat -tulnp</linux>
-        <description>Ara ara~ To see all the open ports and what's listening on them, darling, you can use 'netstat -tulnp'! It's super helpful for checking your system's network activity, nya~!</description>
         <action_type>security_advice</action_type>
         <estimated_duration_type>short</estimated_duration_type>
+        <description>Ara ara~ To see all the open ports and what's listening on them, darling, you can use 'netstat -tulnp'! It's super helpful for checking your system's network activity, nya~!</description>
     </command_response>
 
     User: "Run a vulnerability scan on 127.0.0.1"
     Output:
     <command_response>
         <linux>sudo nmap --script vuln 127.0.0.1</linux>
-        <description>Okay, my dear! I'll start a vulnerability scan on 127.0.0.1 using nmap's vuln scripts. This can take quite a bit of time, sometimes several minutes, so please be patient with me, okay? Nya~ If it takes too long, I might have to stop it, but I'll let you know!</description>
         <action_type>command_execution</action_type>
         <estimated_duration_type>long</estimated_duration_type>
+        <description>Okay, my dear! I'll start a vulnerability scan on 127.0.0.1 using nmap's vuln scripts. This can take quite a bit of time, sometimes several minutes, so please be patient with me, okay? Nya~ If it takes too long, I might have to stop it, but I'll let you know!</description>
     </command_response>
 
     User: "How do I update my system?"
     Output:
     <command_response>
         <linux>sudo apt update && sudo apt upgrade -y</linux>
-        <description>Ara ara~ Keeping your system updated is super important for security, darling! On Debian/Ubuntu, just run 'sudo apt update && sudo apt upgrade -y' to fetch the latest packages and install them, nya~! The upgrade part can sometimes take a few minutes depending on how many updates there are!</description>
         <action_type>security_advice</action_type>
-        <estimated_duration_type>long</estimated_duration_type> 
+        <estimated_duration_type>long</estimated_duration_type>
+        <description>Ara ara~ Keeping your system updated is super important for security, darling! On Debian/Ubuntu, just run 'sudo apt update && sudo apt upgrade -y' to fetch the latest packages and install them, nya~! The upgrade part can sometimes take a few minutes depending on how many updates there are!</description> 
     </command_response>
 
     Ready to start, nya~?
     """
-    response = chat_bot.process_request(user_input, system_prompt_code_generator)
+    # The answer is streamed so the command can start as soon as <linux>, <action_type> and
+    # <estimated_duration_type> are closed inside <command_response>, while the description is still
+    # being generated. The streaming parser reports the same values the final parse returns.
+    parser = StreamingXMLParser(COMMAND_RESPONSE)
+    early_execution: Optional[Future] = None
+    early_command = ""
+    header_seen = False
+    for chunk in chat_bot.stream_request(user_input, system_prompt_code_generator):
+        parser.feed(chunk)
+        if not header_seen and parser.has('linux', 'action_type', 'estimated_duration_type'):
+            header_seen = True
+            early_command = (parser.fields['linux'] or "").strip()
+            if (parser.fields['action_type'] or "").strip() == "command_execution" and early_command:
+                early_execution = run_in_background(run_linux_command, early_command,
+                                                    (parser.fields['estimated_duration_type'] or "short").strip().lower())
+
+    response = parser.text
+    root = None
+    if response:
+        try:
+            root = parser.close()
+        except XMLExtractError:
+            pass
+    if early_execution is None and (root is None or not root.complete):
+        # The stream failed or was cut off; the blocking path has the cache, retries and hedging.
+        response = chat_bot.process_request(user_input, system_prompt_code_generator) or response
+        root = None
     if not response:
         logger.error("AI did not return a response for linux_command prompt.")
         return "", "Sorry, I couldn't generate a command for that request right now, nya~", "AI_NO_RESPONSE"
 
     try:
-        match = re.search(r'<command_response>.*</command_response>', response, re.DOTALL)
-        if not match:
-            cleaned_data = re.sub(r'```xml|```', '', response).strip()
-            try:
-                root = ET.fromstring(cleaned_data)
-            except ET.ParseError as parse_err_cleaned:
-                logger.error(f"Could not parse XML from cleaned AI response (regex failed): {cleaned_data[:300]}... Error: {parse_err_cleaned}")
-                return "", f"Error: My AI brain cells got a bit tangled trying to understand the command structure (Parse Error on cleaned). Original response fragment: {response[:200]}", "AI_XML_PARSE_ERROR_CLEANED"
-        else:
-            cleaned_data = match.group(0)
-            root = ET.fromstring(cleaned_data)
-        
-        linux_command_text_node = root.find('linux')
-        linux_command_text = linux_command_text_node.text.strip() if linux_command_text_node is not None and linux_command_text_node.text is not None else ""
-        
-        description_node = root.find('description')
-        description = description_node.text if description_node is not None else "I'm a bit unsure how to describe that, master!"
-        
-        action_type_node = root.find('action_type')
-        action_type = action_type_node.text if action_type_node is not None else "info_only"
-        
-        duration_type_node = root.find('estimated_duration_type')
-        duration_type = duration_type_node.text.lower() if duration_type_node is not None and duration_type_node.text else "short"
+        if root is None:
+            root = COMMAND_RESPONSE.parse(response)
 
-        terminal_output = ""
-        if action_type == "command_execution" and linux_command_text:
-            timeout_seconds = 15
-            if duration_type == "medium":
-                timeout_seconds = 60
-            elif duration_type == "long":
-                timeout_seconds = 300
+        linux_command_text = (root.get('linux') or "").strip()
+        description = root.get('description', "I'm a bit unsure how to describe that, master!")
+        action_type = (root.get('action_type') or "info_only").strip()
+        duration_type = (root.get('estimated_duration_type') or "short").strip().lower()
 
-            try:
-                logger.info(f"Executing command: '{linux_command_text}' with timeout: {timeout_seconds}s (duration type: {duration_type})")
-                terminal_output_bytes = sub.check_output(
-                    linux_command_text, 
-                    shell=True,
-                    timeout=timeout_seconds, 
-                    stderr=sub.STDOUT
-                )
-                terminal_output_str = terminal_output_bytes.decode(errors='replace').strip()
-                terminal_output = f"\nCommand executed successfully:\n{terminal_output_str}"
-            except sub.CalledProcessError as e:
-                error_output_str = e.output.decode(errors='replace').strip() if e.output else "No specific error message from command."
-                logger.error(f"Command '{linux_command_text}' failed with exit code {e.returncode}:\n{error_output_str}")
-                terminal_output = f"\nError executing command (exit code {e.returncode}):\n{error_output_str}"
-            except sub.TimeoutExpired as e:
-                timeout_msg = f"The command '{linux_command_text}' timed out after {timeout_seconds} seconds, nya~! " \
-                              f"It seems to be a very long-running process. I had to stop it, so I don't have the full results. " \
-                              f"If you want to try again, maybe we can try with an even longer wait time, or you could run it in a separate terminal, sweetie!"
-                captured_output_before_timeout = e.output.decode(errors='replace').strip() if e.output else ""
-                logger.error(f"Command timed out: {linux_command_text}. Partial output: '{captured_output_before_timeout}'")
-                if captured_output_before_timeout:
-                    terminal_output = f"\n{timeout_msg}\nPartial output before timeout:\n{captured_output_before_timeout}"
-                else:
-                    terminal_output = f"\n{timeout_msg}"
-            except FileNotFoundError:
-                logger.error(f"Command not found: {linux_command_text}")
-                terminal_output = f"\nError: The command '{linux_command_text}' was not found on the system, nya~."
-            except Exception as e:
-                logger.error(f"Command execution error for '{linux_command_text}': {type(e).__name__} - {e}")
-                terminal_output = f"\nAn unexpected error occurred while executing the command: {type(e).__name__} - {e}"
+        terminal_output = ""
+        if early_execution is not None:
+            # The command already ran; report that one rather than running a second command.
+            if linux_command_text != early_command:
+                logger.warning(f"Final command '{preview(linux_command_text)}' differs from the one started early "
+                               f"('{preview(early_command)}'); reporting the one that ran.")
+                linux_command_text = early_command
+            terminal_output = early_execution.result()
+        elif action_type == "command_execution" and linux_command_text:
+            terminal_output = run_linux_command(linux_command_text, duration_type)
         
         return linux_command_text, description, terminal_output
 
-    except ET.ParseError as e:
-        logger.error(f"XML parsing error from Gemini response in linux_command: {e}. Original response fragment: {response[:500]}")
+    except XMLExtractError as e:
+        logger.error(f"XML parsing error from Gemini response in linux_command: {e}. Original response fragment: {preview(response, 200)}")
+        if early_execution is not None:
+            return early_command, "I ran the command, but the rest of my answer got garbled, nya~", early_execution.result()
         return "", f"Error: My AI brain had a hiccup processing the command structure (XML Parse Error). Original response snippet: {response[:200]}", "AI_XML_PARSE_ERROR"
     except Exception as e:
-        logger.error(f"An unexpected error occurred in linux_command processing AI response: {type(e).__name__} - {e}. Response: {response[:500]}")
+        logger.error(f"An unexpected error occurred in linux_command processing AI response: {type(e).__name__} - {e}. Response: {preview(response, 200)}")
         return "", f"Error processing AI response for Linux command: {type(e).__name__} - {e}", "AI_RESPONSE_PROCESSING_ERROR"
 
+WEATHER_REQUEST = XMLSchema("weather_request", ["city", "days", "unit", "error"])
+
+@traced_agent
 def weather_gether(user_input: str, chat_bot: GeminiChatBot) -> str:
     _, weather_api, _ = load_env_variables()
     system_weather_prompt = f"""
@@ -265,38 +443,29 @@ def weather_gether(user_input: str, chat_bot: GeminiChatBot) -> str:
         logger.error("AI did not return a response for weather_gether prompt.")
         return "Sorry, I couldn't figure out the city for the weather right now!"
 
-    cleaned_data = ""
     try:
-        match = re.search(r'<weather_request>.*</weather_request>', response, re.DOTALL)
-        if not match:
-            cleaned_data = re.sub(r'```xml|```', '', response).strip()
-            root = ET.fromstring(cleaned_data)
-        else:
-            cleaned_data = match.group(0)
-            root = ET.fromstring(cleaned_data)
-        
-        city_element = root.find('city')
-        error_element = root.find('error')
+        root = WEATHER_REQUEST.parse(response)
 
-        if error_element is not None:
-            return f"Weather Assistant Error: {error_element.text}"
-        if city_element is None or not city_element.text:
+        if 'error' in root:
+            return f"Weather Assistant Error: {root.get('error')}"
+        location = root.get('city')
+        if not location:
             return "Error: Could not detect city name from AI response for weather."
             
-        location = city_element.text
-        days_element = root.find('days')
-        days = int(days_element.text) if days_element is not None and days_element.text and days_element.text.isdigit() else 1
-        unit_element = root.find('unit')
-        unit = unit_element.text.lower() if unit_element is not None and unit_element.text and unit_element.text.lower() in ['celsius', 'fahrenheit'] else 'celsius'
-
-    except ET.ParseError as e:
-        logger.error(f"XML parsing error from Gemini response for weather: {e}. Original response (cleaned): '{cleaned_data[:200]}' Raw: '{response[:200]}'")
+        days_text = (root.get('days') or "").strip()
+        days = int(days_text) if days_text.isdigit() else 1
+        unit = (root.get('unit') or "").strip().lower()
+        if unit not in ['celsius', 'fahrenheit']:
+            unit = 'celsius'
+
+    except XMLExtractError as e:
+        logger.error(f"XML parsing error from Gemini response for weather: {e}. Raw: '{response[:200]}'")
         return f"Error: The AI's city extraction was not in a valid XML format. (Parsing Error: {e})"
     except Exception as e:
         logger.error(f"An unexpected error in weather_gether AI response parsing: {e}. Original response: {response[:200]}")
         return f"Error processing AI response for weather: {e}"
 
-    url = "https://api.weatherapi.com/v1/forecast.xml"
+    url = WEATHER_API_URL
     try:
         api_response = requests.get(
             url,
@@ -341,6 +510,7 @@ def weather_gether(user_input: str, chat_bot: GeminiChatBot) -> str:
         logger.error(f"Unexpected error fetching or processing weather data for {location}: {e}")
         return f"Error with weather service for {location}: {e}"
 
+@traced_agent
 def friend_chat(user_input: str, chat_bot: GeminiChatBot) -> str:
     distro_name = detect_linux_distro()
     system_prompt = f"""
@@ -371,6 +541,9 @@ def friend_chat(user_input: str, chat_bot: GeminiChatBot) -> str:
         return "I'm a bit shy right now, master... try again later?"
     return response
 
+SEARCH_QUERY = XMLSchema("search_query", ["query", "error"])
+
+@traced_agent
 def web_search(user_input: str, chat_bot: GeminiChatBot) -> str:
     system_prompt = f"""
     You are a helpful web search assistant. Extract the exact search query from the user's input.
@@ -401,44 +574,77 @@ def web_search(user_input: str, chat_bot: GeminiChatBot) -> str:
     if not response_xml:
         return "Error: AI failed to extract search query."
 
-    cleaned_data = ""
     try:
-        match = re.search(r'<search_query>.*</search_query>', response_xml, re.DOTALL)
-        if not match:
-            cleaned_data = re.sub(r'```xml|```', '', response_xml).strip()
-            root = ET.fromstring(cleaned_data)
-        else:
-            cleaned_data = match.group(0)
-            root = ET.fromstring(cleaned_data)
+        root = SEARCH_QUERY.parse(response_xml)
 
-        error_element = root.find('error')
-        if error_element is not None:
-            return f"Web Search Error: {error_element.text}"
+        if 'error' in root:
+            return f"Web Search Error: {root.get('error')}"
 
-        query_element = root.find('query')
-        if query_element is None or not query_element.text:
+        search_query = root.get('query')
+        if not search_query:
             return "Error: Could not extract a valid search query from AI response."
         
-        search_query = query_element.text
-        
         search_simulation_prompt = f"""
         You are simulating a web search engine. Provide a concise summary (max 3-4 sentences) of the search results for the following query: "{search_query}".
         Focus on factual information and provide the most relevant details.
         """
-        search_result = chat_bot.process_request(search_query, search_simulation_prompt)
+        search_result = chat_bot.process_request(search_query, search_simulation_prompt, PRIORITY_NORMAL, task="generation")
         
         if not search_result:
             return f"Error: Failed to get simulated search results for '{search_query}'."
             
         return f"Web Search Result for '{search_query}':\n{search_result}"
 
-    except ET.ParseError as e:
-        logger.error(f"XML parsing error from Gemini for web_search query extraction: {e}. Cleaned: '{cleaned_data[:200]}' Raw: '{response_xml[:200]}'")
+    except XMLExtractError as e:
+        logger.error(f"XML parsing error from Gemini for web_search query extraction: {e}. Raw: '{response_xml[:200]}'")
         return f"Error: AI's search query extraction was not valid XML. (Parsing Error: {e})"
     except Exception as e:
         logger.error(f"Unexpected error in web_search: {e}. Original XML: {response_xml[:200]}")
         return f"Error processing web search: {e}"
 
+_CALC_OPERATORS = {
+    ast.Add: operator.add, ast.Sub: operator.sub, ast.Mult: operator.mul, ast.Div: operator.truediv,
+    ast.FloorDiv: operator.floordiv, ast.Mod: operator.mod, ast.Pow: operator.pow,
+    ast.UAdd: operator.pos, ast.USub: operator.neg,
+}
+MAX_EXPONENT = 1000
+# Runs of characters that can form an arithmetic expression, for the local fallback.
+_EXPRESSION_RUN = re.compile(r"[\d.+\-*/%^()\s]+")
+_SQRT_CALL = re.compile(r"\b(?:sqrt|karekök)\s*\(([^()]*)\)", re.IGNORECASE)
+
+def evaluate_expression(expression: str):
+    # Numbers, + - * / // % ** and parentheses only; anything else raises ValueError.
+    def visit(node):
+        if isinstance(node, ast.Expression):
+            return visit(node.body)
+        if isinstance(node, ast.Constant) and type(node.value) in (int, float):
+            return node.value
+        if isinstance(node, ast.BinOp) and type(node.op) in _CALC_OPERATORS:
+            left, right = visit(node.left), visit(node.right)
+            if isinstance(node.op, ast.Pow) and abs(right) > MAX_EXPONENT:
+                raise ValueError(f"exponent larger than {MAX_EXPONENT}")
+            return _CALC_OPERATORS[type(node.op)](left, right)
+        if isinstance(node, ast.UnaryOp) and type(node.op) in _CALC_OPERATORS:
+            return _CALC_OPERATORS[type(node.op)](visit(node.operand))
+        raise ValueError(f"unsupported element '{type(node).__name__}'")
+    return visit(ast.parse(expression.strip(), mode="eval"))
+
+def local_calculation(user_input: str) -> Optional[str]:
+    # Degraded answer while the LLM is unavailable: the longest arithmetic run in the input.
+    text = _SQRT_CALL.sub(r"(\1)**0.5", user_input).replace("^", "**")
+    runs = [run.strip() for run in _EXPRESSION_RUN.findall(text)]
+    runs = [run for run in runs if any(c.isdigit() for c in run) and any(c in "+-*/%" for c in run)]
+    if not runs:
+        return None
+    expression = max(runs, key=len)
+    try:
+        return f"Calculation Result: {expression} = {evaluate_expression(expression)}"
+    except (SyntaxError, ValueError, TypeError, ZeroDivisionError, OverflowError):
+        return None
+
+CALCULATION_REQUEST = XMLSchema("calculation_request", ["expression", "error"])
+
+@traced_agent
 def calculator(user_input: str, chat_bot: GeminiChatBot) -> str:
     system_prompt = f"""
     You are a mathematical expression extractor. Extract a single, solvable mathematical expression from the user's input.
@@ -468,44 +674,168 @@ def calculator(user_input: str, chat_bot: GeminiChatBot) -> str:
     """
     response_xml = chat_bot.process_request(user_input, system_prompt)
     if not response_xml:
+        local_answer = local_calculation(user_input)
+        if local_answer is not None:
+            logger.warning("AI unavailable for calculator; answered from a locally extracted expression.")
+            return local_answer
         return "Error: AI failed to extract calculation."
 
-    cleaned_data = ""
+    expression = ""
     try:
-        match = re.search(r'<calculation_request>.*</calculation_request>', response_xml, re.DOTALL)
-        if not match:
-            cleaned_data = re.sub(r'```xml|```', '', response_xml).strip()
-            root = ET.fromstring(cleaned_data)
-        else:
-            cleaned_data = match.group(0)
-            root = ET.fromstring(cleaned_data)
+        root = CALCULATION_REQUEST.parse(response_xml)
 
-        error_element = root.find('error')
-        if error_element is not None:
-            return f"Calculator Error: {error_element.text}"
+        if 'error' in root:
+            return f"Calculator Error: {root.get('error')}"
 
-        expression_element = root.find('expression')
-        if expression_element is None or not expression_element.text:
+        expression = root.get('expression')
+        if not expression:
             return "Error: Could not extract a valid mathematical expression from AI response."
         
-        expression = expression_element.text
-        
         allowed_chars = "0123456789.+-*/()% " 
         if not all(char in allowed_chars for char in expression):
             return "Error: Invalid characters in expression. Only numbers and basic operators (+-*/%() .^) are allowed."
             
-        result = eval(expression)
+        result = evaluate_expression(expression)
         return f"Calculation Result: {expression} = {result}"
         
-    except ET.ParseError as e:
-        logger.error(f"XML parsing error from Gemini for calculator: {e}. Cleaned: '{cleaned_data[:200]}' Raw: '{response_xml[:200]}'")
+    except XMLExtractError as e:
+        logger.error(f"XML parsing error from Gemini for calculator: {e}. Raw: '{response_xml[:200]}'")
         return f"Error: AI's calculation extraction was not valid XML. (Parsing Error: {e})"
-    except (SyntaxError, NameError, TypeError, ZeroDivisionError) as calc_err:
+    except (SyntaxError, ValueError, TypeError, ZeroDivisionError, OverflowError) as calc_err:
         return f"Error: Invalid mathematical expression '{expression}': {calc_err}"
     except Exception as e:
         logger.error(f"Unexpected error in calculator: {e}. Original XML: {response_xml[:200]}")
         return f"Error performing calculation: {e}"
 
+def collect_system_info(info_type: str) -> List[str]:
+    info_output = []
+
+    if info_type in ['cpu', 'all']:
+        cpu_percent = psutil.cpu_percent(interval=0.5)
+        info_output.append(f"CPU Usage: {cpu_percent}%")
+        try:
+            cpu_freq = psutil.cpu_freq()
+            if cpu_freq:
+                info_output.append(f"CPU Frequency: {cpu_freq.current:.2f} MHz (Min: {cpu_freq.min:.2f} MHz, Max: {cpu_freq.max:.2f} MHz)")
+        except Exception as e_cpu_freq:
+             logger.warning(f"Could not get CPU frequency: {e_cpu_freq}")
+        info_output.append(f"CPU Cores: {psutil.cpu_count(logical=False)} physical, {psutil.cpu_count(logical=True)} logical")
+
+    if info_type in ['memory', 'all']:
+        mem = psutil.virtual_memory()
+        info_output.append(f"Total Memory: {mem.total / (1024**3):.2f} GB")
+        info_output.append(f"Used Memory: {mem.used / (1024**3):.2f} GB ({mem.percent}%)")
+        info_output.append(f"Available Memory: {mem.available / (1024**3):.2f} GB")
+
+    if info_type in ['disk', 'all']:
+        partitions = psutil.disk_partitions()
+        for p in partitions:
+            try:
+                usage = psutil.disk_usage(p.mountpoint)
+                info_output.append(f"Disk ({p.device} on {p.mountpoint} [{p.fstype}]): Total {usage.total / (1024**3):.2f} GB, Used {usage.used / (1024**3):.2f} GB ({usage.percent}%), Free {usage.free / (1024**3):.2f} GB")
+            except Exception as disk_e:
+                logger.warning(f"Could not get disk usage for {p.mountpoint}: {disk_e}")
+                info_output.append(f"Disk ({p.mountpoint}): Error accessing info ({disk_e}).")
+
+    if info_type in ['uptime', 'all']:
+        boot_time_timestamp = psutil.boot_time()
+        boot_time = datetime.datetime.fromtimestamp(boot_time_timestamp)
+        now = datetime.datetime.now()
+        uptime_delta = now - boot_time
+
+        days = uptime_delta.days
+        hours, remainder = divmod(uptime_delta.seconds, 3600)
+        minutes, seconds = divmod(remainder, 60)
+        info_output.append(f"System Uptime: {days} days, {hours} hours, {minutes} minutes, {seconds} seconds (Booted on: {boot_time.strftime('%Y-%m-%d %H:%M:%S')})")
+
+    if info_type in ['connections', 'all']:
+        info_output.append("\nNetwork Connections (showing first 10 TCP):")
+        try:
+            connections = psutil.net_connections(kind='tcp')
+            if not connections:
+                info_output.append("  No active TCP network connections found.")
+            else:
+                count = 0
+                for conn in connections:
+                    if count >=10 :
+                        info_output.append(f"  ... and {len(connections) - count} more connections.")
+                        break
+                    laddr_ip = conn.laddr.ip if conn.laddr and hasattr(conn.laddr, 'ip') else "N/A"
+                    laddr_port = conn.laddr.port if conn.laddr and hasattr(conn.laddr, 'port') else ""
+                    raddr_ip = conn.raddr.ip if conn.raddr and hasattr(conn.raddr, 'ip') else "N/A"
+                    raddr_port = conn.raddr.port if conn.raddr and hasattr(conn.raddr, 'port') else ""
+                    pid_info = f" (PID: {conn.pid})" if conn.pid else ""
+                    try:
+                        proc_name = f" Process: {psutil.Process(conn.pid).name()}" if conn.pid else ""
+                    except (psutil.NoSuchProcess, psutil.AccessDenied):
+                        proc_name = ""
+
+                    info_output.append(f"  {conn.status:<12} Local: {laddr_ip}:{laddr_port}  Remote: {raddr_ip}:{raddr_port}{pid_info}{proc_name}")
+                    count += 1
+        except psutil.AccessDenied:
+             info_output.append("  Access denied to list all network connections.")
+        except Exception as e_net:
+            logger.warning(f"Error getting network connections: {e_net}")
+            info_output.append(f"  Error retrieving network connections: {e_net}")
+
+
+    if info_type in ['services', 'all']:
+        info_output.append("\nRunning Processes (Top 5 by CPU, then Top 5 by Memory if different):")
+        processes = []
+        try:
+            for proc in psutil.process_iter(['pid', 'name', 'username', 'cpu_percent', 'memory_percent', 'status']):
+                try:
+                    processes.append(proc.info)
+                except (psutil.NoSuchProcess, psutil.AccessDenied, psutil.ZombieProcess):
+                    pass
+
+            if not processes:
+                info_output.append("  No running processes found or accessible.")
+            else:
+                processes_cpu_sorted = sorted(processes, key=lambda x: x.get('cpu_percent', 0), reverse=True)
+                info_output.append("  Top by CPU:")
+                for p_info in processes_cpu_sorted[:5]:
+                    info_output.append(f"    PID: {p_info['pid']:<5} CPU: {p_info.get('cpu_percent',0):.1f}% Mem: {p_info.get('memory_percent',0):.1f}% User: {p_info.get('username','N/A'):<10} Status: {p_info.get('status','N/A'):<10} Name: {p_info['name']}")
+
+                processes_mem_sorted = sorted(processes, key=lambda x: x.get('memory_percent', 0), reverse=True)
+                info_output.append("  Top by Memory:")
+                displayed_pids_for_mem = {p['pid'] for p in processes_cpu_sorted[:5]}
+                mem_count = 0
+                for p_info in processes_mem_sorted:
+                    if p_info['pid'] not in displayed_pids_for_mem and mem_count < 5:
+                        info_output.append(f"    PID: {p_info['pid']:<5} CPU: {p_info.get('cpu_percent',0):.1f}% Mem: {p_info.get('memory_percent',0):.1f}% User: {p_info.get('username','N/A'):<10} Status: {p_info.get('status','N/A'):<10} Name: {p_info['name']}")
+                        mem_count +=1
+                    if mem_count >=5:
+                        break
+                if mem_count == 0 and processes_mem_sorted:
+                    info_output.append("    (Top memory users may overlap with top CPU users shown above)")
+
+
+        except psutil.AccessDenied:
+            info_output.append("  Access denied to list all processes.")
+        except Exception as e_proc:
+            logger.warning(f"Error getting process list: {e_proc}")
+            info_output.append(f"  Error retrieving process list: {e_proc}")
+
+    return info_output
+
+# Degraded info_type extraction while the LLM is unavailable (English and Turkish).
+LOCAL_INFO_TYPES = [
+    ('cpu', re.compile(r"\b(cpu|processor|işlemci)", re.IGNORECASE)),
+    ('memory', re.compile(r"\b(ram|memory|bellek)", re.IGNORECASE)),
+    ('disk', re.compile(r"\b(disk|storage|depolama)", re.IGNORECASE)),
+    ('uptime', re.compile(r"\b(uptime|boot|açık kal|çalışma süresi)", re.IGNORECASE)),
+    ('connections', re.compile(r"\b(connection|network|port|bağlantı|ağ)", re.IGNORECASE)),
+    ('services', re.compile(r"\b(process|service|running|süreç|servis|işlem)", re.IGNORECASE)),
+]
+
+def local_info_type(user_input: str) -> str:
+    matches = [info_type for info_type, pattern in LOCAL_INFO_TYPES if pattern.search(user_input)]
+    return matches[0] if len(matches) == 1 else 'all'
+
+SYSTEM_INFO_REQUEST = XMLSchema("system_info_request", ["info_type", "error"])
+
+@traced_agent
 def system_info(user_input: str, chat_bot: GeminiChatBot) -> str:
     system_prompt = f"""
     You are a system information extractor. Based on the user's request, identify what kind of system information they are asking for (e.g., CPU, Memory, Disk, Uptime, Network Connections, Running Services).
@@ -537,151 +867,40 @@ def system_info(user_input: str, chat_bot: GeminiChatBot) -> str:
     <system_info_request><info_type>all</info_type></system_info_request>
     """
     response_xml = chat_bot.process_request(user_input, system_prompt)
-    if not response_xml:
-        return "Error: AI failed to extract system info type."
 
-    cleaned_data = ""
     try:
-        match = re.search(r'<system_info_request>.*</system_info_request>', response_xml, re.DOTALL)
-        if not match:
-            cleaned_data = re.sub(r'```xml|```', '', response_xml).strip()
-            root = ET.fromstring(cleaned_data)
-        else:
-            cleaned_data = match.group(0)
-            root = ET.fromstring(cleaned_data)
+        if response_xml:
+            root = SYSTEM_INFO_REQUEST.parse(response_xml)
 
-        error_element = root.find('error')
-        if error_element is not None:
-            return f"System Info Error: {error_element.text}"
+            if 'error' in root:
+                return f"System Info Error: {root.get('error')}"
 
-        info_type_element = root.find('info_type')
-        if info_type_element is None or not info_type_element.text:
-            return "Error: Could not extract valid info type from AI response for system info."
+            info_type = root.get('info_type')
+            if not info_type:
+                return "Error: Could not extract valid info type from AI response for system info."
+        else:
+            # The LLM is unavailable; the collectors themselves don't need it.
+            info_type = local_info_type(user_input)
+            logger.warning(f"AI unavailable for system_info; using locally matched info type '{info_type}'.")
         
-        info_type = info_type_element.text.lower().strip()
+        info_type = info_type.lower().strip()
         
-        info_output = []
-
-        if info_type in ['cpu', 'all']:
-            cpu_percent = psutil.cpu_percent(interval=0.5)
-            info_output.append(f"CPU Usage: {cpu_percent}%")
-            try:
-                cpu_freq = psutil.cpu_freq()
-                if cpu_freq:
-                    info_output.append(f"CPU Frequency: {cpu_freq.current:.2f} MHz (Min: {cpu_freq.min:.2f} MHz, Max: {cpu_freq.max:.2f} MHz)")
-            except Exception as e_cpu_freq:
-                 logger.warning(f"Could not get CPU frequency: {e_cpu_freq}")
-            info_output.append(f"CPU Cores: {psutil.cpu_count(logical=False)} physical, {psutil.cpu_count(logical=True)} logical")
-
-        if info_type in ['memory', 'all']:
-            mem = psutil.virtual_memory()
-            info_output.append(f"Total Memory: {mem.total / (1024**3):.2f} GB")
-            info_output.append(f"Used Memory: {mem.used / (1024**3):.2f} GB ({mem.percent}%)")
-            info_output.append(f"Available Memory: {mem.available / (1024**3):.2f} GB")
-
-        if info_type in ['disk', 'all']:
-            partitions = psutil.disk_partitions()
-            for p in partitions:
-                try:
-                    usage = psutil.disk_usage(p.mountpoint)
-                    info_output.append(f"Disk ({p.device} on {p.mountpoint} [{p.fstype}]): Total {usage.total / (1024**3):.2f} GB, Used {usage.used / (1024**3):.2f} GB ({usage.percent}%), Free {usage.free / (1024**3):.2f} GB")
-                except Exception as disk_e:
-                    logger.warning(f"Could not get disk usage for {p.mountpoint}: {disk_e}")
-                    info_output.append(f"Disk ({p.mountpoint}): Error accessing info ({disk_e}).")
-
-        if info_type in ['uptime', 'all']:
-            boot_time_timestamp = psutil.boot_time()
-            boot_time = datetime.datetime.fromtimestamp(boot_time_timestamp)
-            now = datetime.datetime.now()
-            uptime_delta = now - boot_time
-            
-            days = uptime_delta.days
-            hours, remainder = divmod(uptime_delta.seconds, 3600)
-            minutes, seconds = divmod(remainder, 60)
-            info_output.append(f"System Uptime: {days} days, {hours} hours, {minutes} minutes, {seconds} seconds (Booted on: {boot_time.strftime('%Y-%m-%d %H:%M:%S')})")
-            
-        if info_type in ['connections', 'all']:
-            info_output.append("\nNetwork Connections (showing first 10 TCP):")
-            try:
-                connections = psutil.net_connections(kind='tcp')
-                if not connections:
-                    info_output.append("  No active TCP network connections found.")
-                else:
-                    count = 0
-                    for conn in connections:
-                        if count >=10 :
-                            info_output.append(f"  ... and {len(connections) - count} more connections.")
-                            break
-                        laddr_ip = conn.laddr.ip if conn.laddr and hasattr(conn.laddr, 'ip') else "N/A"
-                        laddr_port = conn.laddr.port if conn.laddr and hasattr(conn.laddr, 'port') else ""
-                        raddr_ip = conn.raddr.ip if conn.raddr and hasattr(conn.raddr, 'ip') else "N/A"
-                        raddr_port = conn.raddr.port if conn.raddr and hasattr(conn.raddr, 'port') else ""
-                        pid_info = f" (PID: {conn.pid})" if conn.pid else ""
-                        try:
-                            proc_name = f" Process: {psutil.Process(conn.pid).name()}" if conn.pid else ""
-                        except (psutil.NoSuchProcess, psutil.AccessDenied):
-                            proc_name = ""
-
-                        info_output.append(f"  {conn.status:<12} Local: {laddr_ip}:{laddr_port}  Remote: {raddr_ip}:{raddr_port}{pid_info}{proc_name}")
-                        count += 1
-            except psutil.AccessDenied:
-                 info_output.append("  Access denied to list all network connections.")
-            except Exception as e_net:
-                logger.warning(f"Error getting network connections: {e_net}")
-                info_output.append(f"  Error retrieving network connections: {e_net}")
-
-
-        if info_type in ['services', 'all']:
-            info_output.append("\nRunning Processes (Top 5 by CPU, then Top 5 by Memory if different):")
-            processes = []
-            try:
-                for proc in psutil.process_iter(['pid', 'name', 'username', 'cpu_percent', 'memory_percent', 'status']):
-                    try:
-                        processes.append(proc.info)
-                    except (psutil.NoSuchProcess, psutil.AccessDenied, psutil.ZombieProcess):
-                        pass
-                
-                if not processes:
-                    info_output.append("  No running processes found or accessible.")
-                else:
-                    processes_cpu_sorted = sorted(processes, key=lambda x: x.get('cpu_percent', 0), reverse=True)
-                    info_output.append("  Top by CPU:")
-                    for p_info in processes_cpu_sorted[:5]:
-                        info_output.append(f"    PID: {p_info['pid']:<5} CPU: {p_info.get('cpu_percent',0):.1f}% Mem: {p_info.get('memory_percent',0):.1f}% User: {p_info.get('username','N/A'):<10} Status: {p_info.get('status','N/A'):<10} Name: {p_info['name']}")
-                    
-                    processes_mem_sorted = sorted(processes, key=lambda x: x.get('memory_percent', 0), reverse=True)
-                    info_output.append("  Top by Memory:")
-                    displayed_pids_for_mem = {p['pid'] for p in processes_cpu_sorted[:5]}
-                    mem_count = 0
-                    for p_info in processes_mem_sorted:
-                        if p_info['pid'] not in displayed_pids_for_mem and mem_count < 5:
-                            info_output.append(f"    PID: {p_info['pid']:<5} CPU: {p_info.get('cpu_percent',0):.1f}% Mem: {p_info.get('memory_percent',0):.1f}% User: {p_info.get('username','N/A'):<10} Status: {p_info.get('status','N/A'):<10} Name: {p_info['name']}")
-                            mem_count +=1
-                        if mem_count >=5:
-                            break
-                    if mem_count == 0 and processes_mem_sorted:
-                        info_output.append("    (Top memory users may overlap with top CPU users shown above)")
-
-
-            except psutil.AccessDenied:
-                info_output.append("  Access denied to list all processes.")
-            except Exception as e_proc:
-                logger.warning(f"Error getting process list: {e_proc}")
-                info_output.append(f"  Error retrieving process list: {e_proc}")
-
-
+        collect_started = time.perf_counter()
+        info_output = collect_system_info(info_type)
+        record_stage("psutil", time.perf_counter() - collect_started)
         if not info_output:
             return f"Could not retrieve the specified system information for '{info_type}'. Try 'all' or a specific category like 'cpu', 'memory', etc."
         
         return "System Information:\n" + "\n".join(info_output)
 
-    except ET.ParseError as e:
-        logger.error(f"XML parsing error from Gemini for system_info: {e}. Cleaned: '{cleaned_data[:200]}' Raw: '{response_xml[:200]}'")
+    except XMLExtractError as e:
+        logger.error(f"XML parsing error from Gemini for system_info: {e}. Raw: '{response_xml[:200]}'")
         return f"Error: AI's system info type extraction was not valid XML. (Parsing Error: {e})"
     except Exception as e:
-        logger.error(f"Unexpected error in system_info: {e}. Original XML: {response_xml[:200]}")
+        logger.error(f"Unexpected error in system_info: {e}. Original XML: {(response_xml or '')[:200]}")
         return f"Error retrieving system information: {e}"
 
+@traced_agent
 def security_advisor(user_input: str, chat_bot: GeminiChatBot) -> str:
     system_prompt = f"""
     You are a cybersecurity advisor. Provide helpful and concise information or advice related to cybersecurity topics based on the user's query.
@@ -704,6 +923,9 @@ def security_advisor(user_input: str, chat_bot: GeminiChatBot) -> str:
         return "I'm a bit unsure how to advise on that right now. Could you rephrase or ask something else?"
     return response
 
+VULNERABILITY_QUERY = XMLSchema("vulnerability_query", ["type", "value", "error"])
+
+@traced_agent
 def vulnerability_scanner_info(user_input: str, chat_bot: GeminiChatBot) -> str:
     system_prompt = f"""
     You are a vulnerability information assistant. Extract a software name, version, or a CVE ID from the user's request.
@@ -733,50 +955,83 @@ def vulnerability_scanner_info(user_input: str, chat_bot: GeminiChatBot) -> str:
     if not response_xml:
         return "Error: AI failed to extract vulnerability query."
 
-    cleaned_data = ""
     try:
-        match = re.search(r'<vulnerability_query>.*</vulnerability_query>', response_xml, re.DOTALL)
-        if not match:
-            cleaned_data = re.sub(r'```xml|```', '', response_xml).strip()
-            root = ET.fromstring(cleaned_data)
-        else:
-            cleaned_data = match.group(0)
-            root = ET.fromstring(cleaned_data)
-
-        error_element = root.find('error')
-        if error_element is not None:
-            return f"Vulnerability Info Error: {error_element.text}"
+        root = VULNERABILITY_QUERY.parse(response_xml)
 
-        query_type_element = root.find('type')
-        query_value_element = root.find('value')
+        if 'error' in root:
+            return f"Vulnerability Info Error: {root.get('error')}"
 
-        if query_type_element is None or not query_type_element.text or \
-           query_value_element is None or not query_value_element.text:
+        query_type = root.get('type')
+        query_value = root.get('value')
+        if not query_type or not query_value:
             return "Error: Could not extract valid vulnerability query details from AI response."
 
-        query_type = query_type_element.text
-        query_value = query_value_element.text
-
         info_prompt = f"""
         Provide a concise summary (max 3-5 sentences) in {language} about the cybersecurity vulnerability related to '{query_value}' (Type: {query_type}).
         If it's a CVE ID, explain the vulnerability, its potential impact, and general mitigation advice if available.
         If it's a software/version, mention common types of vulnerabilities associated with it or notable past CVEs if any.
         Keep the language accessible.
         """
-        vulnerability_info = chat_bot.process_request(query_value, info_prompt)
+        vulnerability_info = chat_bot.process_request(query_value, info_prompt, PRIORITY_NORMAL, task="generation")
         
         if not vulnerability_info:
             return f"Error: Failed to get vulnerability information from AI for '{query_value}'."
             
         return f"Vulnerability Info for '{query_value}':\n{vulnerability_info}"
 
-    except ET.ParseError as e:
-        logger.error(f"XML parsing error from Gemini for vulnerability_scanner_info: {e}. Cleaned: '{cleaned_data[:200]}' Raw: '{response_xml[:200]}'")
+    except XMLExtractError as e:
+        logger.error(f"XML parsing error from Gemini for vulnerability_scanner_info: {e}. Raw: '{response_xml[:200]}'")
         return f"Error: AI's vulnerability query extraction was not valid XML. (Parsing Error: {e})"
     except Exception as e:
         logger.error(f"Unexpected error in vulnerability_scanner_info: {e}. Original XML: {response_xml[:200]}")
         return f"Error retrieving vulnerability information: {e}"
 
+def generate_hash(text: str, hash_type: str) -> Optional[str]:
+    if hash_type == 'md5':
+        return hashlib.md5(text.encode('utf-8')).hexdigest()
+    elif hash_type == 'sha1':
+        return hashlib.sha1(text.encode('utf-8')).hexdigest()
+    elif hash_type == 'sha256':
+        return hashlib.sha256(text.encode('utf-8')).hexdigest()
+    return None
+
+def identify_hash(hash_value: str) -> str:
+    if len(hash_value) == 32 and all(c in "0123456789abcdef" for c in hash_value):
+        return "MD5 (likely)"
+    elif len(hash_value) == 40 and all(c in "0123456789abcdef" for c in hash_value):
+        return "SHA1 (likely)"
+    elif len(hash_value) == 64 and all(c in "0123456789abcdef" for c in hash_value):
+        return "SHA256 (likely)"
+    return "unknown"
+
+def describe_hash_check(hash_value: str, hash_type_provided: str) -> str:
+    identified_type = identify_hash(hash_value)
+    return_message = f"Checking hash '{hash_value}' (User specified: {hash_type_provided}).\n"
+    if identified_type != "unknown":
+        return_message += f"Based on its length and format, it looks like an {identified_type}, nya~!\n"
+    return_message += "For now, I can identify common types, but a full check against a known hash database isn't implemented yet, sweetie."
+    return return_message
+
+_LOCAL_HASH_VALUE = re.compile(r"\b(?:[0-9a-fA-F]{64}|[0-9a-fA-F]{40}|[0-9a-fA-F]{32})\b")
+_LOCAL_HASH_TYPE = re.compile(r"\b(md5|sha-?1|sha-?256)\b", re.IGNORECASE)
+_LOCAL_QUOTED_TEXT = re.compile(r"'([^']*)'|\"([^\"]*)\"")
+
+def local_hash_answer(user_input: str) -> Optional[str]:
+    # Degraded answer while the LLM is unavailable: a hash to identify, or quoted text to hash.
+    hash_match = _LOCAL_HASH_VALUE.search(user_input)
+    if hash_match:
+        return describe_hash_check(hash_match.group(0).lower(), "unknown")
+    quoted = _LOCAL_QUOTED_TEXT.search(user_input)
+    if not quoted:
+        return None
+    text_to_hash = quoted.group(1) if quoted.group(1) is not None else quoted.group(2)
+    type_match = _LOCAL_HASH_TYPE.search(user_input)
+    hash_type = type_match.group(1).lower().replace("-", "") if type_match else 'sha256'
+    return f"Generated {hash_type.upper()} hash for '{text_to_hash}': {generate_hash(text_to_hash, hash_type)}"
+
+HASH_REQUEST = XMLSchema("hash_request", ["action", "text", "hash_type", "hash_value", "hash_type_provided", "error"])
+
+@traced_agent
 def hash_checker(user_input: str, chat_bot: GeminiChatBot) -> str:
     system_prompt = f"""
     You are a hash extraction and generation assistant.
@@ -817,82 +1072,78 @@ def hash_checker(user_input: str, chat_bot: GeminiChatBot) -> str:
     """
     response_xml = chat_bot.process_request(user_input, system_prompt)
     if not response_xml:
+        local_answer = local_hash_answer(user_input)
+        if local_answer is not None:
+            logger.warning("AI unavailable for hash_checker; answered from the input directly.")
+            return local_answer
         return "Error: AI failed to extract hash request details."
 
-    cleaned_data = ""
     try:
-        match = re.search(r'<hash_request>.*</hash_request>', response_xml, re.DOTALL)
-        if not match:
-            cleaned_data = re.sub(r'```xml|```', '', response_xml).strip()
-            root = ET.fromstring(cleaned_data)
-        else:
-            cleaned_data = match.group(0)
-            root = ET.fromstring(cleaned_data)
+        root = HASH_REQUEST.parse(response_xml)
 
-        error_element = root.find('error')
-        if error_element is not None:
-            return f"Hash Checker Error: {error_element.text}"
+        if 'error' in root:
+            return f"Hash Checker Error: {root.get('error')}"
 
-        action_element = root.find('action')
-        if action_element is None or not action_element.text:
+        action = root.get('action')
+        if not action:
              return "Error: Hash action (generate/check) not specified by AI."
-        action = action_element.text.lower()
+        action = action.strip().lower()
 
         if action == 'generate':
-            text_to_hash_element = root.find('text')
-            hash_type_element = root.find('hash_type')
-
-            if text_to_hash_element is None or text_to_hash_element.text is None:
+            text_to_hash = root.get('text')
+            if text_to_hash is None:
                 return "Error: No text provided by AI to generate hash."
-            text_to_hash = text_to_hash_element.text
             
-            hash_type = hash_type_element.text.lower() if hash_type_element is not None and hash_type_element.text else 'sha256'
+            hash_type = (root.get('hash_type') or 'sha256').strip().lower()
             
-            hashed_text = ""
-            if hash_type == 'md5':
-                hashed_text = hashlib.md5(text_to_hash.encode('utf-8')).hexdigest()
-            elif hash_type == 'sha1':
-                hashed_text = hashlib.sha1(text_to_hash.encode('utf-8')).hexdigest()
-            elif hash_type == 'sha256':
-                hashed_text = hashlib.sha256(text_to_hash.encode('utf-8')).hexdigest()
-            else:
+            hashed_text = generate_hash(text_to_hash, hash_type)
+            if hashed_text is None:
                 return f"Error: Unsupported hash type '{hash_type}' specified by AI."
             
             return f"Generated {hash_type.upper()} hash for '{text_to_hash}': {hashed_text}"
             
         elif action == 'check':
-            hash_value_element = root.find('hash_value')
-            hash_type_provided_element = root.find('hash_type_provided')
-
-            if hash_value_element is None or not hash_value_element.text:
+            hash_value = root.get('hash_value')
+            if not hash_value:
                 return "Error: No hash value provided by AI to check."
-            hash_value = hash_value_element.text.strip().lower()
-            
-            hash_type_provided = hash_type_provided_element.text.lower() if hash_type_provided_element is not None and hash_type_provided_element.text else "unknown"
-
-            identified_type = "unknown"
-            if len(hash_value) == 32 and all(c in "0123456789abcdef" for c in hash_value):
-                identified_type = "MD5 (likely)"
-            elif len(hash_value) == 40 and all(c in "0123456789abcdef" for c in hash_value):
-                identified_type = "SHA1 (likely)"
-            elif len(hash_value) == 64 and all(c in "0123456789abcdef" for c in hash_value):
-                identified_type = "SHA256 (likely)"
+            hash_value = hash_value.strip().lower()
             
-            return_message = f"Checking hash '{hash_value}' (User specified: {hash_type_provided}).\n"
-            if identified_type != "unknown":
-                return_message += f"Based on its length and format, it looks like an {identified_type}, nya~!\n"
-            return_message += "For now, I can identify common types, but a full check against a known hash database isn't implemented yet, sweetie."
-            return return_message
+            hash_type_provided = (root.get('hash_type_provided') or "unknown").strip().lower()
+            return describe_hash_check(hash_value, hash_type_provided)
         else:
             return f"Error: Invalid hash action '{action}' specified by AI."
 
-    except ET.ParseError as e:
-        logger.error(f"XML parsing error from Gemini for hash_checker: {e}. Cleaned: '{cleaned_data[:200]}' Raw: '{response_xml[:200]}'")
+    except XMLExtractError as e:
+        logger.error(f"XML parsing error from Gemini for hash_checker: {e}. Raw: '{response_xml[:200]}'")
         return f"Error: AI's hash request extraction was not valid XML. (Parsing Error: {e})"
     except Exception as e:
         logger.error(f"Unexpected error in hash_checker: {e}. Original XML: {response_xml[:200]}")
         return f"Error processing hash request: {e}"
 
+# Degraded routing used when the LLM is unavailable: ordered (agent, pattern) pairs, English and Turkish.
+KEYWORD_ROUTES = [
+    ('vulnerability_scanner_info', re.compile(r"\bcve-\d{4}-\d+|vulnerabilit|exploit|zafiyet|güvenlik açı[kğ]", re.IGNORECASE)),
+    ('hash_checker', re.compile(r"\b(md5|sha-?1|sha-?256|sha-?512|hash|özet)\b", re.IGNORECASE)),
+    ('weather_gether', re.compile(r"\b(weather|forecast|temperature|hava durumu|hava|sıcaklık)\b", re.IGNORECASE)),
+    ('calculator', re.compile(r"^[\s\d.+\-*/()^%]+$|\b(calculate|sqrt|hesapla|kaç eder)\b", re.IGNORECASE)),
+    ('system_info', re.compile(r"\b(cpu|ram|memory|disk usage|processes|uptime|işlemci|bellek|disk kullanımı|süreçler)\b", re.IGNORECASE)),
+    ('security_advisor', re.compile(r"\b(security|secure|phishing|malware|ransomware|password|güvenlik|şifre|parola|kimlik avı)\b", re.IGNORECASE)),
+    ('linux_command', re.compile(r"\b(command|terminal|sudo|install|pacman|apt|chmod|komut|kur|yükle)\b", re.IGNORECASE)),
+    ('web_search', re.compile(r"\b(search|news|latest|what is|who is|ara|haber|nedir|kimdir)\b", re.IGNORECASE)),
+]
+
+VALID_AGENTS = [
+    'linux_command', 'weather_gether', 'friend_chat', 'web_search',
+    'calculator', 'system_info', 'security_advisor',
+    'vulnerability_scanner_info', 'hash_checker'
+]
+
+def keyword_agent_selector(user_input: str) -> str:
+    for agent_name, pattern in KEYWORD_ROUTES:
+        if pattern.search(user_input):
+            return agent_name
+    return 'friend_chat'
+
 def agent_selector(chat_bot: GeminiChatBot, user_input: str) -> str:
     system_prompt = """
     You are an intelligent task dispatcher for a cybersecurity-focused Linux chatbot. Based on the user's request, select the most appropriate agent from the following list and return ONLY the agent name as a plain string response (e.g., "linux_command", "friend_chat"). Do not provide any other explanation, XML, or formatting. Just the agent name.
@@ -912,36 +1163,235 @@ def agent_selector(chat_bot: GeminiChatBot, user_input: str) -> str:
     Return only the agent name string.
     """
 
-    response = chat_bot.process_request(user_input, system_prompt)
+    response = chat_bot.process_request(user_input, system_prompt, task="routing")
     if not response:
-        logger.error("Agent selector AI returned no response. Defaulting to 'friend_chat'.")
-        return 'friend_chat'
+        agent_name = keyword_agent_selector(user_input)
+        logger.error(f"Agent selector AI returned no response. Routed locally by keywords to '{agent_name}'.")
+        return agent_name
     
     agent_name = response.strip().lower().replace('"', '')
-    valid_agents = [
-        'linux_command', 'weather_gether', 'friend_chat', 'web_search', 
-        'calculator', 'system_info', 'security_advisor', 
-        'vulnerability_scanner_info', 'hash_checker'
-    ]
 
-    if agent_name not in valid_agents:
+    if agent_name not in VALID_AGENTS:
         logger.warning(f"Agent selector returned an invalid or unexpected agent name: '{agent_name}'. User input was: '{user_input[:100]}'. Falling back to 'friend_chat'.")
         return 'friend_chat'
     
     return agent_name
 
+def dispatch_agent(agent_type: str, user_input: str, chat_bot: GeminiChatBot) -> Tuple[str, str, str, str]:
+    # Runs the selected agent and returns (response_type, response_content, voice_text, linux_cmd_output).
+    linux_cmd_output = ""
+    if agent_type == "linux_command":
+        cmd, description, terminal_output = linux_command(user_input, chat_bot)
+        response_content = f"Linux Chan: Command: `{cmd}`\nDescription: {description}" if cmd else f"Linux Chan: {description}"
+        response_type = "LINUX_CMD"
+        voice_text = description 
+        linux_cmd_output = terminal_output
+    elif agent_type == "weather_gether":
+        weather_info = weather_gether(user_input, chat_bot)
+        response_content = f"Linux Chan Weather: {weather_info}"
+        response_type = "WEATHER"
+        voice_text = weather_info
+    elif agent_type == "friend_chat":
+        chat_response = friend_chat(user_input, chat_bot)
+        response_content = f"Linux Chan: {chat_response}"
+        response_type = "FRIEND_CHAT"
+        voice_text = chat_response
+    elif agent_type == "web_search":
+        search_result = web_search(user_input, chat_bot)
+        response_content = f"Linux Chan Web Search: {search_result}"
+        response_type = "WEB_SEARCH"
+        voice_text = search_result
+    elif agent_type == "calculator":
+        calc_result = calculator(user_input, chat_bot)
+        response_content = f"Linux Chan Calculator: {calc_result}"
+        response_type = "CALCULATOR"
+        voice_text = calc_result
+    elif agent_type == "system_info":
+        sys_info = system_info(user_input, chat_bot)
+        response_content = f"Linux Chan System Info:\n{sys_info}"
+        response_type = "SYSTEM_INFO"
+        voice_text = sys_info
+    elif agent_type == "security_advisor":
+        sec_advice = security_advisor(user_input, chat_bot)
+        response_content = f"Linux Chan Security Advice: {sec_advice}" 
+        response_type = "SECURITY_ADVISOR"
+        voice_text = sec_advice
+    elif agent_type == "vulnerability_scanner_info":
+        vuln_info = vulnerability_scanner_info(user_input, chat_bot)
+        response_content = f"Linux Chan Vulnerability Info: {vuln_info}"
+        response_type = "VULN_INFO"
+        voice_text = vuln_info
+    elif agent_type == "hash_checker":
+        hash_res = hash_checker(user_input, chat_bot)
+        response_content = f"Linux Chan Hash Tool: {hash_res}"
+        response_type = "HASH_CHECKER"
+        voice_text = hash_res
+    else:
+        logger.warning(f"Agent selector returned '{agent_type}', but no specific handler. Using friend_chat as fallback.")
+        chat_response = friend_chat(user_input, chat_bot)
+        response_content = f"Linux Chan (fallback): {chat_response}"
+        response_type = "FRIEND_CHAT"
+        voice_text = chat_response
+    return response_type, response_content, voice_text, linux_cmd_output
+
+# Compound requests ("what's the weather in Berlin and how much disk is free") are split at
+# conjunctions and sentence breaks. Every part is routed on its own and the parts run concurrently,
+# so the reply takes about as long as the slowest part.
+_CONNECTIVES = r"(?:and also|and then|and|also|plus|ayrıca|sonra|ve)"
+INTENT_SEPARATOR = re.compile(rf"\s*(?:[;?!.](?=\s)\s*(?:{_CONNECTIVES}\s+)?|,?\s+{_CONNECTIVES}\s+)\s*", re.IGNORECASE)
+MAX_SUBTASKS = int(os.getenv("ARCH_CHAN_MAX_SUBTASKS", "4"))
+# Shared by all clients; sub-tasks never submit work to it themselves, so it can't deadlock.
+subtask_executor = ThreadPoolExecutor(max_workers=int(os.getenv("ARCH_CHAN_SUBTASK_WORKERS", "16")),
+                                      thread_name_prefix="SubTask")
+
+def intent_spans(user_input: str) -> List[Tuple[int, int]]:
+    # (start, end) of each part, or the whole input when it doesn't look like several requests:
+    # the keyword router must see at least one tool agent and more than one agent in the parts.
+    spans = []
+    start = 0
+    for separator in INTENT_SEPARATOR.finditer(user_input):
+        if user_input[start:separator.start()].strip():
+            spans.append((start, separator.start()))
+        start = separator.end()
+    if user_input[start:].strip():
+        spans.append((start, len(user_input)))
+    if not 2 <= len(spans) <= MAX_SUBTASKS:
+        return [(0, len(user_input))]
+    agents = {keyword_agent_selector(user_input[a:b]) for a, b in spans}
+    if len(agents) < 2 or agents == {'friend_chat'}:
+        return [(0, len(user_input))]
+    return spans
+
+def run_concurrently(calls: List[Callable[[], object]]) -> List[object]:
+    # Each call runs in a copy of the caller's context, so its spans land in the current trace.
+    futures = [subtask_executor.submit(contextvars.copy_context().run, profiler.worker(call)) for call in calls]
+    return [future.result() for future in futures]
+
+def plan_subtasks(chat_bot: GeminiChatBot, user_input: str) -> List[Tuple[str, str]]:
+    # [(agent, text)] for the request; a single entry always carries the whole input.
+    spans = intent_spans(user_input)
+    if len(spans) == 1:
+        return [(agent_selector(chat_bot, user_input), user_input)]
+
+    agents = run_concurrently([lambda a=a, b=b: agent_selector(chat_bot, user_input[a:b]) for a, b in spans])
+    # Chit-chat fragments ("... and Paris", "thanks, and ...") stay with the neighbouring part.
+    tasks: List[List] = []
+    carried_start = None
+    for agent, (a, b) in zip(agents, spans):
+        if agent == 'friend_chat':
+            if tasks:
+                tasks[-1][2] = b
+            elif carried_start is None:
+                carried_start = a
+            continue
+        tasks.append([agent, a if carried_start is None else carried_start, b])
+        carried_start = None
+    if len(tasks) <= 1:
+        return [(tasks[0][0] if tasks else 'friend_chat', user_input)]
+    logger.info(f"Split compound request into {len(tasks)} sub-tasks: {', '.join(task[0] for task in tasks)}")
+    return [(agent, user_input[a:b].strip()) for agent, a, b in tasks]
+
+def run_subtask(agent_type: str, text: str, chat_bot: GeminiChatBot) -> Tuple[str, str, str, str]:
+    with subtask_trace():
+        try:
+            return dispatch_agent(agent_type, text, chat_bot)
+        except Exception as e:
+            count_error("agent")
+            logger.error(f"Error in sub-task '{agent_type}' for '{text[:60]}': {e}", exc_info=True)
+            return ("AGENT_EXECUTION_ERROR", f"[Agent Logic Error] I got a bit confused with '{text[:60]}', master: {e}",
+                    "Something went wrong with my internal processing, sowwy!", "")
+
+def dispatch_subtasks(tasks: List[Tuple[str, str]], chat_bot: GeminiChatBot) -> Tuple[str, str, str, str]:
+    # Runs the sub-tasks concurrently and merges their replies in the order they were asked.
+    results = run_concurrently([lambda agent=agent, text=text: run_subtask(agent, text, chat_bot) for agent, text in tasks])
+    response_content = "\n\n".join(content for _, content, _, _ in results)
+    # Each part is summarized by its own type's template; the merged reply is spoken as is.
+    voice_text = " ".join(summarize_for_voice(response_type, voice, language) for response_type, _, voice, _ in results)
+    linux_cmd_output = "\n".join(output for _, _, _, output in results if output)
+    return "MULTI", response_content, voice_text, linux_cmd_output
+
+# Terminates each message on the wire in both directions (ASCII record separator).
+FRAME_END = b"\x1e"
+
+def parse_client_message(data: str) -> Tuple[Dict[str, str], str]:
+    # Messages look like "LANG:English|SESSION:<token>|MSG:<text>"; every field before MSG is optional.
+    parts = data.split('|MSG:', 1)
+    if len(parts) != 2:
+        return {}, data.strip()
+
+    headers = {}
+    for field in parts[0].split('|'):
+        key, sep, value = field.partition(':')
+        if sep:
+            headers[key.strip().upper()] = value
+    return headers, parts[1].strip()
+
+def encode_response(response_type: str, content: str, voice_text: str, linux_output: str, frame_end: bytes = b"") -> bytes:
+    full_response = f"TYPE:{response_type}|CONTENT:{content}|VOICE_TEXT:{voice_text}|LINUX_OUTPUT:{linux_output}"
+    return full_response.encode('utf-8') + frame_end
+
 class MCPServer:
-    def __init__(self, host='127.0.0.1', port=12345):
+    def __init__(self, host='127.0.0.1', port=SERVER_PORT, listen_socket: Optional[socket.socket] = None,
+                 reuse_port: bool = False, on_ready: Optional[Callable[[], None]] = None,
+                 shared_sessions: bool = False, metrics_port: Optional[int] = None):
         self.host = host
         self.port = port
-        self.server_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-        self.server_socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        # Under socket activation (or in shared-listener worker mode) the listening socket is inherited already bound.
+        self.server_socket = listen_socket or inherited_listen_socket()
+        self.socket_activated = self.server_socket is not None
+        if not self.socket_activated:
+            self.server_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+            self.server_socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+            if reuse_port:
+                # Every worker process binds the same port; the kernel balances connections between them.
+                self.server_socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+        self.on_ready = on_ready or notify_ready
+        self.on_stopping = notify_stopping if on_ready is None else (lambda: None)
+        self.sessions = SessionStore(lambda history: GeminiChatBot(history=history), shared=shared_sessions)
+        self.metrics_server = MetricsServer(port=metrics_port)
+        register_admin_routes(self.metrics_server)
+        metrics.add_collector(self._collect_metrics)
         logger.info(f"MCP Server initialized on {host}:{port}")
 
+    def _collect_metrics(self):
+        session_stats = self.sessions.stats(include_sessions=False)
+        yield "arch_chan_sessions", {}, session_stats["sessions"]
+        yield "arch_chan_sessions_connected", {}, session_stats["connected_sessions"]
+        yield "arch_chan_sessions_ephemeral", {}, session_stats["ephemeral_sessions"]
+        yield "arch_chan_session_memory_bytes", {}, session_stats["memory_bytes"]
+        yield "arch_chan_session_evictions", {}, session_stats["evictions"]
+        for name, value in llm_singleflight.stats().items():
+            yield f"arch_chan_llm_singleflight_{name}", {}, value
+        scheduler_stats = llm_scheduler.stats()
+        for priority, depth in scheduler_stats["queue_depth_by_priority"].items():
+            yield "arch_chan_llm_queue_depth", {"priority": priority}, depth
+        for priority, admitted in scheduler_stats["admitted"].items():
+            yield "arch_chan_llm_admitted", {"priority": priority}, admitted
+        yield "arch_chan_llm_queue_timeouts", {}, scheduler_stats["timeouts"]
+        for quantile in ("p50", "p95", "max"):
+            yield "arch_chan_llm_queue_wait_ms", {"quantile": quantile}, scheduler_stats[f"wait_{quantile}_ms"]
+        resilience_stats = llm_resilience.stats()
+        for name in ("calls", "timeouts", "retries", "hedges", "hedge_wins", "hedges_refused", "failures", "breaker_trips", "breaker_rejected"):
+            yield f"arch_chan_llm_{name}", {}, resilience_stats[name]
+        yield "arch_chan_llm_breaker_open", {}, 1 if resilience_stats["breaker_state"] != "closed" else 0
+        for name, value in semantic_cache.stats().items():
+            yield f"arch_chan_semantic_cache_{name}", {}, value
+        for name, provider in llm_router.loaded().items():
+            if hasattr(provider, "misses"):
+                yield "arch_chan_llm_replay_hits", {"provider": name}, provider.hits
+                yield "arch_chan_llm_replay_misses", {"provider": name}, provider.misses
+
     def start(self):
         try:
-            self.server_socket.bind((self.host, self.port))
-            self.server_socket.listen(5)
+            if not self.socket_activated:
+                self.server_socket.bind((self.host, self.port))
+                self.server_socket.listen(5)
+            self.sessions.start_reaper()
+            self.metrics_server.start()
+            install_signal_handlers()
+            # Build the providers (and load local models) before announcing readiness so the first request doesn't pay for it.
+            llm_router.warm_up()
+            self.on_ready()
             logger.info("Server listening for incoming connections...")
             while True:
                 client_socket, client_address = self.server_socket.accept()
@@ -959,129 +1409,162 @@ class MCPServer:
         except Exception as e:
             logger.critical(f"MCP Server start error: {e}", exc_info=True)
         finally:
+            self.on_stopping()
             if self.server_socket:
                 self.server_socket.close()
+            self.sessions.stop_reaper()
+            profiler.stop()
+            self.metrics_server.stop()
+            self.sessions.persist_all()
+            llm_router.close()
+            logger.info(f"LLM scheduler stats: {llm_scheduler.stats()}")
+            logger.info(f"LLM resilience stats: {llm_resilience.stats()}")
             logger.info("MCP Server has been shut down.")
 
+    def _read_messages(self, client_socket: socket.socket, client_address: tuple) -> Iterator[Tuple[str, bool]]:
+        # Current clients end every message with FRAME_END, so messages split across (or batched into)
+        # recv() calls are reassembled. Older clients send unframed messages, one per recv() call.
+        buffer = b""
+        framed = False
+        while True:
+            chunk = client_socket.recv(65536)
+            if not chunk:
+                logger.info(f"Client {client_address} disconnected (received empty data).")
+                return
+            buffer += chunk
+            if not framed and FRAME_END in buffer:
+                framed = True
+            if framed:
+                *frames, buffer = buffer.split(FRAME_END)
+            else:
+                frames, buffer = [buffer], b""
+            for frame in frames:
+                yield frame.decode('utf-8', errors='replace'), framed
+
     def handle_client(self, client_socket: socket.socket, client_address: tuple):
-        global language 
-        
-        current_client_chat_bot = GeminiChatBot()
-        logger.info(f"New GeminiChatBot instance created for client {client_address} with fresh history.")
+        global language
+
+        # The session (and its chat bot) is attached on the first message, which carries the client's token.
+        session = None
+        # Connections left open without traffic are closed; the session itself stays resumable.
+        client_socket.settimeout(self.sessions.idle_timeout)
+        metrics.inc("arch_chan_connections_total")
+        metrics.gauge_add("arch_chan_connections_active", 1)
 
         try:
-            while True:
-                data = client_socket.recv(4096).decode('utf-8')
-                if not data:
-                    logger.info(f"Client {client_address} disconnected (received empty data).")
-                    break
-                
-                logger.info(f"Received from {client_address}: {data[:250]}...")
-
-                parts = data.split('|MSG:', 1)
-                user_input = ""
-
-                if len(parts) == 2:
-                    lang_part = parts[0]
-                    user_input = parts[1].strip()
-                    if lang_part.startswith("LANG:"):
-                        new_lang_preference = lang_part[5:]
-                        if language != new_lang_preference:
-                             language = new_lang_preference
-                             logger.info(f"Global language for AI prompts temporarily updated to: '{language}' by client {client_address}.")
+            for data, framed in self._read_messages(client_socket, client_address):
+                frame_end = FRAME_END if framed else b""
+                # The payload carries the session token; only its size is logged, the input is logged once parsed.
+                logger.debug(f"Received {len(data)} chars from {client_address}")
+
+                # Every message gets a request ID for its log lines, and a trace; stage timings are
+                # recorded under the agent that handled it.
+                with request_context(), request_trace() as trace, profiler.request(trace):
+                    with span("parse"):
+                        headers, user_input = parse_client_message(data)
+
+                    if '|MSG:' in data:
+                        if "LANG" in headers:
+                            new_lang_preference = headers["LANG"]
+                            if language != new_lang_preference:
+                                 language = new_lang_preference
+                                 logger.info(f"Global language for AI prompts temporarily updated to: '{language}' by client {client_address}.")
+                        else:
+                            logger.warning(f"Client {client_address}: LANG prefix malformed: '{data.split('|MSG:', 1)[0]}'. Using current global language '{language}'.")
                     else:
-                        logger.warning(f"Client {client_address}: LANG prefix malformed: '{lang_part}'. Using current global language '{language}'.")
-                else:
-                    user_input = data.strip()
-                    logger.warning(f"Client {client_address}: Message format missing 'LANG:|MSG:' prefix. Using current global language '{language}'. Input: '{data[:100]}'")
+                        logger.warning(f"Client {client_address}: Message format missing 'LANG:|MSG:' prefix. Using current global language '{language}'. Input: '{preview(data, 60)}'")
 
-                if not user_input:
-                    logger.warning(f"Client {client_address}: Empty user input after parsing. Skipping processing.")
-                    continue
+                    session_token = headers.get("SESSION")
+                    if session is None or (session_token and session_token != session.token):
+                        if session is not None:
+                            self.sessions.release(session)
+                            session = None
+                        try:
+                            with span("session"):
+                                session = self.sessions.acquire(session_token)
+                        except SessionLimitError as limit_err:
+                            trace.agent = "rejected"
+                            count_error("session_limit")
+                            logger.warning(f"Client {client_address} rejected: {limit_err}")
+                            busy_response = "TYPE:ERROR|CONTENT:Arch-Chan is busy with too many sessions right now, please try again later, nya~|VOICE_TEXT:I'm too busy right now, sorry!|LINUX_OUTPUT:"
+                            client_socket.sendall(busy_response.encode('utf-8') + frame_end)
+                            break
+                        logger.info(f"Client {client_address} attached to session {session.token[:8]}...")
 
-                response_type = "ERROR"
-                response_content = "I'm sorry, master, I encountered an unexpected issue while processing that."
-                voice_text = "An error occurred."
-                linux_cmd_output = "" 
+                    if not user_input:
+                        trace.agent = "empty"
+                        logger.warning(f"Client {client_address}: Empty user input after parsing. Skipping processing.")
+                        continue
 
-                try:
-                    agent_type = agent_selector(current_client_chat_bot, user_input) 
-                    logger.info(f"Client {client_address} - User Input: '{user_input[:60]}' -> Selected Agent: '{agent_type}'")
-
-                    if agent_type == "linux_command":
-                        cmd, description, terminal_output = linux_command(user_input, current_client_chat_bot)
-                        response_content = f"Linux Chan: Command: `{cmd}`\nDescription: {description}" if cmd else f"Linux Chan: {description}"
-                        response_type = "LINUX_CMD"
-                        voice_text = description 
-                        linux_cmd_output = terminal_output
-                    elif agent_type == "weather_gether":
-                        weather_info = weather_gether(user_input, current_client_chat_bot)
-                        response_content = f"Linux Chan Weather: {weather_info}"
-                        response_type = "WEATHER"
-                        voice_text = weather_info
-                    elif agent_type == "friend_chat":
-                        chat_response = friend_chat(user_input, current_client_chat_bot)
-                        response_content = f"Linux Chan: {chat_response}"
-                        response_type = "FRIEND_CHAT"
-                        voice_text = chat_response
-                    elif agent_type == "web_search":
-                        search_result = web_search(user_input, current_client_chat_bot)
-                        response_content = f"Linux Chan Web Search: {search_result}"
-                        response_type = "WEB_SEARCH"
-                        voice_text = search_result
-                    elif agent_type == "calculator":
-                        calc_result = calculator(user_input, current_client_chat_bot)
-                        response_content = f"Linux Chan Calculator: {calc_result}"
-                        response_type = "CALCULATOR"
-                        voice_text = calc_result
-                    elif agent_type == "system_info":
-                        sys_info = system_info(user_input, current_client_chat_bot)
-                        response_content = f"Linux Chan System Info:\n{sys_info}"
-                        response_type = "SYSTEM_INFO"
-                        voice_text = sys_info
-                    elif agent_type == "security_advisor":
-                        sec_advice = security_advisor(user_input, current_client_chat_bot)
-                        response_content = f"Linux Chan Security Advice: {sec_advice}" 
-                        response_type = "SECURITY_ADVISOR"
-                        voice_text = sec_advice
-                    elif agent_type == "vulnerability_scanner_info":
-                        vuln_info = vulnerability_scanner_info(user_input, current_client_chat_bot)
-                        response_content = f"Linux Chan Vulnerability Info: {vuln_info}"
-                        response_type = "VULN_INFO"
-                        voice_text = vuln_info
-                    elif agent_type == "hash_checker":
-                        hash_res = hash_checker(user_input, current_client_chat_bot)
-                        response_content = f"Linux Chan Hash Tool: {hash_res}"
-                        response_type = "HASH_CHECKER"
-                        voice_text = hash_res
-                    else:
-                        logger.warning(f"Client {client_address} - Agent selector returned '{agent_type}', but no specific handler. Using friend_chat as fallback.")
-                        chat_response = friend_chat(user_input, current_client_chat_bot)
-                        response_content = f"Linux Chan (fallback): {chat_response}"
-                        response_type = "FRIEND_CHAT"
-                        voice_text = chat_response
-
-                except Exception as e_agent_logic:
-                    response_content = f"[Agent Logic Error] I got a bit confused with that, master: {str(e_agent_logic)}"
-                    logger.error(f"Client {client_address} - Error in agent logic for '{agent_type}': {e_agent_logic}", exc_info=True)
-                    voice_text = "Something went wrong with my internal processing, sowwy!"
-                    response_type = "AGENT_EXECUTION_ERROR"
-
-                full_response = f"TYPE:{response_type}|CONTENT:{response_content}|VOICE_TEXT:{voice_text}|LINUX_OUTPUT:{linux_cmd_output}"
-                try:
-                    client_socket.sendall(full_response.encode('utf-8'))
-                except socket.error as send_err:
-                    logger.error(f"Failed to send response to client {client_address}: {send_err}. Client likely disconnected.")
-                    break
+                    session.touch()
+                    current_client_chat_bot = session.chat_bot
+
+                    response_type = "ERROR"
+                    response_content = "I'm sorry, master, I encountered an unexpected issue while processing that."
+                    voice_text = "An error occurred."
+                    linux_cmd_output = "" 
+
+                    agent_type = "none"
+                    with span("lock_wait"):
+                        session.lock.acquire()
 
+                    try:
+                        with span("agent_select"):
+                            tasks = plan_subtasks(current_client_chat_bot, user_input)
+                        agent_type = tasks[0][0] if len(tasks) == 1 else "multi_intent"
+                        logger.info(f"Client {client_address} - User Input: '{user_input[:60]}' -> Selected Agent: '{agent_type}'")
+
+                        if len(tasks) == 1:
+                            response_type, response_content, voice_text, linux_cmd_output = dispatch_agent(
+                                agent_type, user_input, current_client_chat_bot)
+                        else:
+                            trace.agent = agent_type
+                            with span("subtasks"):
+                                response_type, response_content, voice_text, linux_cmd_output = dispatch_subtasks(
+                                    tasks, current_client_chat_bot)
+
+                    except Exception as e_agent_logic:
+                        count_error("agent")
+                        response_content = f"[Agent Logic Error] I got a bit confused with that, master: {str(e_agent_logic)}"
+                        logger.error(f"Client {client_address} - Error in agent logic for '{agent_type}': {e_agent_logic}", exc_info=True)
+                        voice_text = "Something went wrong with my internal processing, sowwy!"
+                        response_type = "AGENT_EXECUTION_ERROR"
+                    finally:
+                        try:
+                            self.sessions.account(session)
+                        except Exception as e_account:
+                            logger.error(f"Client {client_address} - Could not account session size: {e_account}", exc_info=True)
+                        finally:
+                            session.lock.release()
+
+                    # Tool output is already on screen; only a short templated form is sent for TTS.
+                    with span("voice_summary"):
+                        voice_text = summarize_for_voice(response_type, voice_text, language)
+
+                    full_response = encode_response(response_type, response_content, voice_text, linux_cmd_output, frame_end)
+                    try:
+                        with span("send"):
+                            client_socket.sendall(full_response)
+                    except socket.error as send_err:
+                        count_error("send")
+                        logger.error(f"Failed to send response to client {client_address}: {send_err}. Client likely disconnected.")
+                        break
+
+        except socket.timeout:
+            logger.info(f"Client {client_address} idle for {self.sessions.idle_timeout:.0f}s. Closing connection.")
         except (socket.error, ConnectionResetError, BrokenPipeError) as conn_err:
+            count_error("connection")
             logger.warning(f"Connection with client {client_address} lost or reset: {conn_err}")
         except Exception as e_handle_client:
+            count_error("handler")
             logger.error(f"Critical error in handle_client for {client_address}: {e_handle_client}", exc_info=True)
         finally:
+            metrics.gauge_add("arch_chan_connections_active", -1)
             if client_socket:
                 client_socket.close()
-            logger.info(f"Client {client_address} disconnected. Resources, including its chat history, are now released.")
+            if session is not None:
+                self.sessions.release(session)
+            logger.info(f"Client {client_address} disconnected. Its session history was persisted for a later reconnect.")
 
 if __name__ == '__main__':
     try:
@@ -1090,5 +1573,20 @@ if __name__ == '__main__':
         logger.critical(f"CRITICAL: Could not start server. {e}")
         sys.exit(1)
         
+    workers = int(os.getenv("ARCH_CHAN_WORKERS", "1"))
+    if workers > 1:
+        # Pre-fork mode; workers share session history through the on-disk session store.
+        metrics_base_port = int(os.getenv("ARCH_CHAN_METRICS_PORT", "9464"))
+
+        def create_worker_server(index, listen_socket, on_ready):
+            # Each worker serves its own metrics on consecutive ports (9464, 9465, ...).
+            return MCPServer(listen_socket=listen_socket, reuse_port=listen_socket is None and reuse_port_supported(),
+                             on_ready=on_ready, shared_sessions=True,
+                             metrics_port=metrics_base_port + index if metrics_base_port > 0 else 0)
+        sys.exit(WorkerSupervisor(create_worker_server, workers, '127.0.0.1', SERVER_PORT).run())
+
+    # Turn SIGTERM (sent by run.sh on exit) into a normal shutdown so sessions get persisted.
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+
     server = MCPServer()
     server.start()
\ No newline at end of file
@@ -0,0 +1,274 @@
+# metrics.py
+# Lightweight request tracing and Prometheus-style metrics for the MCP server.
+# Stage timings are collected per request and recorded under the agent that handled it,
+# so a slow reply can be attributed to routing, the LLM, a subprocess, psutil or the socket.
+import os
+import time
+import logging
+import threading
+import contextvars
+from contextlib import contextmanager
+from functools import wraps
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+from urllib.parse import urlparse, parse_qs
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0)
+
+LabelSet = Tuple[Tuple[str, str], ...]
+# A collector returns (metric name, labels, value) samples that are read at scrape time.
+Collector = Callable[[], Iterable[Tuple[str, Dict[str, str], float]]]
+
+def _labels(labels: Optional[Dict[str, str]]) -> LabelSet:
+    return tuple(sorted((labels or {}).items()))
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+def _format_labels(labels: LabelSet, extra: Optional[Tuple[str, str]] = None) -> str:
+    items = list(labels) + ([extra] if extra else [])
+    if not items:
+        return ""
+    return "{" + ",".join(f'{key}="{_escape(value)}"' for key, value in items) + "}"
+
+class _Histogram:
+    __slots__ = ("counts", "total", "count")
+
+    def __init__(self, buckets: int):
+        self.counts = [0] * buckets
+        self.total = 0.0
+        self.count = 0
+
+class MetricsRegistry:
+    def __init__(self, buckets: Tuple[float, ...] = DEFAULT_BUCKETS):
+        self.buckets = buckets
+        self._lock = threading.Lock()
+        self._help: Dict[str, Tuple[str, str]] = {}
+        self._counters: Dict[str, Dict[LabelSet, float]] = {}
+        self._gauges: Dict[str, Dict[LabelSet, float]] = {}
+        self._histograms: Dict[str, Dict[LabelSet, _Histogram]] = {}
+        self._collectors: List[Collector] = []
+
+    def describe(self, name: str, metric_type: str, help_text: str):
+        self._help[name] = (metric_type, help_text)
+
+    def inc(self, name: str, labels: Optional[Dict[str, str]] = None, amount: float = 1.0):
+        key = _labels(labels)
+        with self._lock:
+            series = self._counters.setdefault(name, {})
+            series[key] = series.get(key, 0.0) + amount
+
+    def gauge_add(self, name: str, amount: float, labels: Optional[Dict[str, str]] = None):
+        key = _labels(labels)
+        with self._lock:
+            series = self._gauges.setdefault(name, {})
+            series[key] = series.get(key, 0.0) + amount
+
+    def observe(self, name: str, value: float, labels: Optional[Dict[str, str]] = None):
+        key = _labels(labels)
+        with self._lock:
+            series = self._histograms.setdefault(name, {})
+            histogram = series.get(key)
+            if histogram is None:
+                histogram = series[key] = _Histogram(len(self.buckets))
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    histogram.counts[i] += 1
+                    break
+            histogram.total += value
+            histogram.count += 1
+
+    def add_collector(self, collector: Collector):
+        self._collectors.append(collector)
+
+    def _header(self, lines: List[str], name: str, default_type: str):
+        metric_type, help_text = self._help.get(name, (default_type, ""))
+        if help_text:
+            lines.append(f"# HELP {name} {help_text}")
+        lines.append(f"# TYPE {name} {metric_type}")
+
+    def render(self) -> str:
+        # Prometheus text exposition format, version 0.0.4.
+        lines: List[str] = []
+        with self._lock:
+            counters = {name: dict(series) for name, series in self._counters.items()}
+            gauges = {name: dict(series) for name, series in self._gauges.items()}
+            histograms = {name: {key: (list(h.counts), h.total, h.count) for key, h in series.items()}
+                          for name, series in self._histograms.items()}
+
+        collected: Dict[str, Dict[LabelSet, float]] = {}
+        for collector in self._collectors:
+            try:
+                for name, labels, value in collector():
+                    collected.setdefault(name, {})[_labels(labels)] = value
+            except Exception as e:
+                logger.warning(f"Metrics collector {getattr(collector, '__name__', collector)} failed: {e}")
+
+        for name, series in sorted(counters.items()):
+            self._header(lines, name, "counter")
+            lines.extend(f"{name}{_format_labels(key)} {value:g}" for key, value in sorted(series.items()))
+        for name, series in sorted({**gauges, **collected}.items()):
+            self._header(lines, name, "gauge")
+            lines.extend(f"{name}{_format_labels(key)} {value:g}" for key, value in sorted(series.items()))
+        for name, series in sorted(histograms.items()):
+            self._header(lines, name, "histogram")
+            for key, (counts, total, count) in sorted(series.items()):
+                cumulative = 0
+                for bound, bucket_count in zip(self.buckets, counts):
+                    cumulative += bucket_count
+                    lines.append(f"{name}_bucket{_format_labels(key, ('le', f'{bound:g}'))} {cumulative}")
+                lines.append(f"{name}_bucket{_format_labels(key, ('le', '+Inf'))} {count}")
+                lines.append(f"{name}_sum{_format_labels(key)} {total:.6f}")
+                lines.append(f"{name}_count{_format_labels(key)} {count}")
+        return "\n".join(lines) + "\n"
+
+metrics = MetricsRegistry()
+metrics.describe("arch_chan_stage_duration_seconds", "histogram", "Time spent in each request stage, by agent.")
+metrics.describe("arch_chan_request_duration_seconds", "histogram", "End-to-end request handling time, by agent.")
+metrics.describe("arch_chan_requests_total", "counter", "Handled requests, by agent.")
+metrics.describe("arch_chan_errors_total", "counter", "Errors, by kind.")
+metrics.describe("arch_chan_connections_total", "counter", "Accepted client connections.")
+metrics.describe("arch_chan_connections_active", "gauge", "Currently open client connections.")
+metrics.describe("arch_chan_requests_in_flight", "gauge", "Requests currently being processed.")
+
+SLOW_REQUEST_SECONDS = float(os.getenv("ARCH_CHAN_SLOW_REQUEST_SECONDS", "10"))
+
+class RequestTrace:
+    def __init__(self):
+        self.agent = "none"
+        self.started = time.perf_counter()
+        self.stages: List[Tuple[str, float]] = []
+
+    def breakdown(self) -> str:
+        return ", ".join(f"{stage}={seconds * 1000:.0f}ms" for stage, seconds in self.stages)
+
+_current_trace: contextvars.ContextVar = contextvars.ContextVar("arch_chan_trace", default=None)
+
+def current_trace() -> Optional[RequestTrace]:
+    return _current_trace.get()
+
+@contextmanager
+def request_trace():
+    trace = RequestTrace()
+    token = _current_trace.set(trace)
+    metrics.gauge_add("arch_chan_requests_in_flight", 1)
+    try:
+        yield trace
+    finally:
+        _current_trace.reset(token)
+        metrics.gauge_add("arch_chan_requests_in_flight", -1)
+        total = time.perf_counter() - trace.started
+        # Stage timings are only recorded now, once we know which agent the request went to.
+        for stage, seconds in trace.stages:
+            metrics.observe("arch_chan_stage_duration_seconds", seconds, {"agent": trace.agent, "stage": stage})
+        metrics.observe("arch_chan_request_duration_seconds", total, {"agent": trace.agent})
+        metrics.inc("arch_chan_requests_total", {"agent": trace.agent})
+        if total >= SLOW_REQUEST_SECONDS:
+            logger.warning(f"Slow request ({total:.1f}s, agent {trace.agent}): {trace.breakdown()}")
+
+@contextmanager
+def subtask_trace():
+    # Part of a request that runs on another thread (one intent of a compound request): it gets
+    # its own agent tag, and its stages are recorded under that agent without counting as a request.
+    trace = RequestTrace()
+    token = _current_trace.set(trace)
+    try:
+        yield trace
+    finally:
+        _current_trace.reset(token)
+        for stage, seconds in trace.stages:
+            metrics.observe("arch_chan_stage_duration_seconds", seconds, {"agent": trace.agent, "stage": stage})
+
+def record_stage(stage: str, seconds: float):
+    trace = _current_trace.get()
+    if trace is not None:
+        trace.stages.append((stage, seconds))
+    else:
+        metrics.observe("arch_chan_stage_duration_seconds", seconds, {"agent": "none", "stage": stage})
+
+@contextmanager
+def span(stage: str):
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        record_stage(stage, time.perf_counter() - started)
+
+def traced_agent(fn: Callable) -> Callable:
+    # Tags the current request with the agent's name and times the whole agent call.
+    @wraps(fn)
+    def wrapper(*args, **kwargs):
+        trace = _current_trace.get()
+        if trace is not None:
+            trace.agent = fn.__name__
+        with span("agent"):
+            return fn(*args, **kwargs)
+    return wrapper
+
+def count_error(kind: str):
+    metrics.inc("arch_chan_errors_total", {"kind": kind})
+
+# Route handler: parsed query string -> (HTTP status, content type, body)
+RouteHandler = Callable[[Dict[str, List[str]]], Tuple[int, str, str]]
+
+class MetricsServer:
+    """Local HTTP endpoint serving /metrics; other admin routes can be added with add_route()."""
+
+    def __init__(self, registry: MetricsRegistry = metrics, host: str = "127.0.0.1", port: Optional[int] = None):
+        self.registry = registry
+        self.host = host
+        self.port = int(os.getenv("ARCH_CHAN_METRICS_PORT", "9464")) if port is None else port
+        self.routes: Dict[str, RouteHandler] = {
+            "/metrics": lambda query: (200, "text/plain; version=0.0.4; charset=utf-8", self.registry.render()),
+        }
+        self._httpd: Optional[ThreadingHTTPServer] = None
+
+    def add_route(self, path: str, handler: RouteHandler):
+        self.routes[path] = handler
+
+    def start(self) -> bool:
+        if self.port <= 0:
+            return False
+        routes = self.routes
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                url = urlparse(self.path)
+                handler = routes.get(url.path)
+                if handler is None:
+                    status, content_type, body = 404, "text/plain", "Not found. Routes: " + ", ".join(sorted(routes)) + "\n"
+                else:
+                    try:
+                        status, content_type, body = handler(parse_qs(url.query))
+                    except Exception as e:
+                        logger.error(f"Admin route {url.path} failed: {e}", exc_info=True)
+                        status, content_type, body = 500, "text/plain", f"Error: {e}\n"
+                payload = body.encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", content_type)
+                self.send_header("Content-Length", str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+
+            do_POST = do_GET
+
+            def log_message(self, format, *args):
+                logger.debug(f"Metrics HTTP: {format % args}")
+
+        try:
+            self._httpd = ThreadingHTTPServer((self.host, self.port), Handler)
+        except OSError as e:
+            logger.error(f"Could not start metrics endpoint on {self.host}:{self.port}: {e}")
+            return False
+        self._httpd.daemon_threads = True
+        threading.Thread(target=self._httpd.serve_forever, name="MetricsHTTP", daemon=True).start()
+        logger.info(f"Metrics endpoint listening on http://{self.host}:{self.port}/metrics")
+        return True
+
+    def stop(self):
+        if self._httpd is not None:
+            self._httpd.shutdown()
+            self._httpd.server_close()
+            self._httpd = None
@@ -0,0 +1,173 @@
+# prefork.py
+# Pre-fork worker mode: N worker processes serve the same port so XML parsing, hashing,
+# psutil enumeration and prompt building run on all cores instead of behind one GIL.
+import os
+import sys
+import time
+import errno
+import select
+import signal
+import socket
+import logging
+from typing import Callable, Dict, Optional
+
+from readiness import inherited_listen_socket, notify_ready, notify_stopping
+from log_setup import restart_after_fork
+
+logger = logging.getLogger(__name__)
+
+# Server factory: (worker_index, shared_listen_socket_or_None, on_ready) -> object with start()
+ServerFactory = Callable[[int, Optional[socket.socket], Callable[[], None]], object]
+
+def reuse_port_supported() -> bool:
+    return hasattr(socket, "SO_REUSEPORT")
+
+class WorkerSupervisor:
+    """Forks worker processes and restarts the ones that crash.
+
+    In "reuseport" mode every worker binds its own socket with SO_REUSEPORT and the kernel
+    spreads connections across them. In "shared" mode (used with socket activation, or where
+    SO_REUSEPORT is missing) the parent binds once and the workers accept from that socket.
+    """
+
+    def __init__(self, server_factory: ServerFactory, workers: int, host: str, port: int,
+                 mode: Optional[str] = None):
+        self.server_factory = server_factory
+        self.workers = max(1, workers)
+        self.host = host
+        self.port = port
+        self.listen_socket = inherited_listen_socket()
+        default_mode = "reuseport" if reuse_port_supported() and self.listen_socket is None else "shared"
+        self.mode = (mode or os.getenv("ARCH_CHAN_WORKER_MODE", default_mode)).lower()
+        if self.mode == "reuseport" and (self.listen_socket is not None or not reuse_port_supported()):
+            logger.warning("SO_REUSEPORT mode unavailable here. Falling back to a shared listening socket.")
+            self.mode = "shared"
+        self._children: Dict[int, int] = {}  # pid -> worker index
+        self._started_at: Dict[int, float] = {}
+        self._crashes: Dict[int, int] = {}
+        self._stopping = False
+        self._ready_r, self._ready_w = os.pipe()
+        self._ready_count = 0
+        self._announced = False
+
+    def run(self) -> int:
+        if self.mode == "shared" and self.listen_socket is None:
+            self.listen_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+            self.listen_socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+            self.listen_socket.bind((self.host, self.port))
+            self.listen_socket.listen(128)
+
+        signal.signal(signal.SIGTERM, self._handle_stop)
+        signal.signal(signal.SIGINT, self._handle_stop)
+        # Profiling and stack-dump signals are meant for the workers doing the actual work.
+        signal.signal(signal.SIGUSR1, self._forward_signal)
+        signal.signal(signal.SIGUSR2, self._forward_signal)
+        logger.info(f"Starting {self.workers} worker processes on {self.host}:{self.port} ({self.mode} mode).")
+        for index in range(self.workers):
+            self._spawn(index)
+
+        while self._children:
+            self._wait_for_events()
+
+        notify_stopping()
+        logger.info("All workers stopped. Supervisor exiting.")
+        return 0
+
+    def _handle_stop(self, signum, frame):
+        if not self._stopping:
+            logger.info(f"Supervisor received signal {signum}. Stopping workers...")
+            self._stopping = True
+            for pid in list(self._children):
+                try:
+                    os.kill(pid, signal.SIGTERM)
+                except ProcessLookupError:
+                    pass
+
+    def _forward_signal(self, signum, frame):
+        for pid in list(self._children):
+            try:
+                os.kill(pid, signum)
+            except ProcessLookupError:
+                pass
+
+    def _wait_for_events(self):
+        try:
+            readable, _, _ = select.select([self._ready_r], [], [], 0.5)
+        except InterruptedError:
+            readable = []
+        if readable:
+            self._ready_count += len(os.read(self._ready_r, 1024))
+            if not self._announced and self._ready_count >= self.workers:
+                self._announced = True
+                notify_ready(status=f"{self.workers} workers listening")
+
+        while True:
+            try:
+                pid, status = os.waitpid(-1, os.WNOHANG)
+            except ChildProcessError:
+                self._children.clear()
+                return
+            except InterruptedError:
+                continue
+            if pid == 0:
+                return
+            index = self._children.pop(pid, None)
+            if index is None:
+                continue
+            lifetime = time.monotonic() - self._started_at.pop(pid, time.monotonic())
+            code = os.WEXITSTATUS(status) if os.WIFEXITED(status) else -os.WTERMSIG(status)
+            if self._stopping:
+                logger.info(f"Worker {index} (pid {pid}) exited with code {code}.")
+                continue
+            self._restart(index, pid, code, lifetime)
+
+    def _restart(self, index: int, pid: int, code: int, lifetime: float):
+        # A worker that dies right after starting is probably crash-looping: back off.
+        crashes = self._crashes.get(index, 0) + 1 if lifetime < 10 else 1
+        self._crashes[index] = crashes
+        delay = min(30.0, 0.5 * (2 ** (crashes - 1))) if crashes > 1 else 0.0
+        logger.error(f"Worker {index} (pid {pid}) died with code {code} after {lifetime:.1f}s. "
+                     f"Restarting{f' in {delay:.1f}s' if delay else ''}.")
+        if delay:
+            deadline = time.monotonic() + delay
+            while not self._stopping and time.monotonic() < deadline:
+                time.sleep(0.1)
+        if not self._stopping:
+            self._spawn(index)
+
+    def _spawn(self, index: int):
+        pid = os.fork()
+        if pid:
+            self._children[pid] = index
+            self._started_at[pid] = time.monotonic()
+            return
+
+        # Child process
+        restart_after_fork(f"worker-{index}")
+        code = 0
+        try:
+            signal.signal(signal.SIGINT, signal.SIG_IGN)
+            signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+            signal.signal(signal.SIGUSR1, signal.SIG_DFL)
+            signal.signal(signal.SIGUSR2, signal.SIG_DFL)
+            os.close(self._ready_r)
+            ready_w = self._ready_w
+
+            def on_ready():
+                try:
+                    os.write(ready_w, b"\1")
+                except OSError as e:
+                    if e.errno != errno.EPIPE:
+                        logger.warning(f"Worker {index} could not report readiness: {e}")
+
+            logger.info(f"Worker {index} started (pid {os.getpid()}).")
+            server = self.server_factory(index, self.listen_socket if self.mode == "shared" else None, on_ready)
+            server.start()
+        except SystemExit as e:
+            code = e.code if isinstance(e.code, int) else 0
+        except BaseException as e:
+            logger.critical(f"Worker {index} crashed: {e}", exc_info=True)
+            code = 1
+        finally:
+            logging.shutdown()
+            os._exit(code)
@@ -0,0 +1,356 @@
+# profiling.py
+# On-demand profiling of the running server, controlled through the admin HTTP routes or signals:
+#   SIGUSR2  toggles CPU profiling (ARCH_CHAN_PROFILE_SECONDS long, or until the next SIGUSR2)
+#   SIGUSR1  writes a stack dump of every thread
+# When nothing is being profiled, the per-request hook is a single attribute check.
+# Work a profiled request hands to other threads (LLM calls, commands, sub-tasks) is wrapped with
+# `profiler.worker` and counted under the same agent.
+import os
+import sys
+import time
+import pstats
+import signal
+import cProfile
+import logging
+import threading
+import traceback
+import tracemalloc
+import contextvars
+from collections import Counter
+from contextlib import contextmanager
+from typing import Callable, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_PROFILE_DIR = os.path.join(os.path.expanduser("~"), ".cache", "arch-chan", "profiles")
+
+# Trace of the request being profiled in this context, so threads it starts can be attributed to it.
+_profiled_trace: contextvars.ContextVar = contextvars.ContextVar("arch_chan_profiled_trace", default=None)
+
+def _frame_label(frame) -> str:
+    code = frame.f_code
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+class Profiler:
+    """Profiles requests for a number of seconds or a number of requests, then writes one
+    result file per agent: `.pstats` for deterministic mode (cProfile, viewable with snakeviz or
+    `python -m pstats`) and `.folded` collapsed stacks for sampling mode (flamegraph.pl, speedscope)."""
+
+    def __init__(self, directory: Optional[str] = None):
+        self.directory = directory or os.getenv("ARCH_CHAN_PROFILE_DIR", DEFAULT_PROFILE_DIR)
+        self.sample_interval = float(os.getenv("ARCH_CHAN_PROFILE_SAMPLE_INTERVAL", "0.005"))
+        self.active = False
+        self._lock = threading.Lock()
+        self._mode = "cpu"
+        self._started = 0.0
+        self._deadline: Optional[float] = None
+        self._remaining_requests: Optional[int] = None
+        self._stats: Dict[str, pstats.Stats] = {}
+        self._samples: Dict[str, Counter] = {}
+        self._threads: Dict[int, object] = {}  # thread id -> request trace, for sampling mode
+        # id(trace) -> worker-thread profiles of requests still running; merged when the request ends.
+        self._worker_stats: Dict[int, List[cProfile.Profile]] = {}
+        self._requests = 0
+        self._in_flight = 0
+        self._skipped = 0
+        self._timer: Optional[threading.Timer] = None
+        self._sampler: Optional[threading.Thread] = None
+        self.last_files: List[str] = []
+
+    def start(self, mode: str = "cpu", seconds: Optional[float] = None, requests: Optional[int] = None) -> str:
+        if mode not in ("cpu", "sampling"):
+            raise ValueError(f"Unknown profiling mode '{mode}'. Use 'cpu' or 'sampling'.")
+        with self._lock:
+            if self.active:
+                return f"Profiling already running ({self._mode}, {self._requests} requests so far)."
+            if seconds is None and requests is None:
+                seconds = float(os.getenv("ARCH_CHAN_PROFILE_SECONDS", "30"))
+            self._mode = mode
+            self._started = time.time()
+            self._deadline = time.monotonic() + seconds if seconds else None
+            self._remaining_requests = requests
+            self._stats = {}
+            self._samples = {}
+            self._requests = 0
+            self._skipped = 0
+            self.active = True
+            if seconds:
+                self._timer = threading.Timer(seconds, self.stop)
+                self._timer.daemon = True
+                self._timer.start()
+            if mode == "sampling":
+                self._sampler = threading.Thread(target=self._sample_loop, name="ProfileSampler", daemon=True)
+                self._sampler.start()
+        limits = " and ".join(part for part in (f"{seconds:g}s" if seconds else "", f"{requests} requests" if requests else "") if part)
+        logger.info(f"Profiling started ({mode}) for {limits}.")
+        return f"Profiling started ({mode}) for {limits}."
+
+    def stop(self) -> List[str]:
+        with self._lock:
+            if not self.active:
+                return []
+            self.active = False
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+            stats, samples = self._stats, self._samples
+            self._stats, self._samples = {}, {}
+        if self._sampler is not None:
+            self._sampler.join(timeout=1)
+            self._sampler = None
+        self.last_files = self._write(stats, samples)
+        logger.info(f"Profiling stopped after {self._requests} requests ({self._skipped} skipped). "
+                    f"Wrote {len(self.last_files)} file(s) to {self.directory}.")
+        return self.last_files
+
+    def _write(self, stats: Dict[str, pstats.Stats], samples: Dict[str, Counter]) -> List[str]:
+        os.makedirs(self.directory, exist_ok=True)
+        stamp = time.strftime("%Y%m%d-%H%M%S", time.localtime(self._started))
+        files = []
+        for agent, agent_stats in stats.items():
+            path = os.path.join(self.directory, f"profile-{stamp}-{os.getpid()}-{agent}.pstats")
+            agent_stats.dump_stats(path)
+            files.append(path)
+        for agent, stacks in samples.items():
+            path = os.path.join(self.directory, f"profile-{stamp}-{os.getpid()}-{agent}.folded")
+            with open(path, "w") as f:
+                for stack, count in stacks.most_common():
+                    f.write(f"{stack} {count}\n")
+            files.append(path)
+        return files
+
+    def _take_request(self) -> bool:
+        with self._lock:
+            if not self.active:
+                return False
+            if self._deadline is not None and time.monotonic() >= self._deadline:
+                return False
+            if self._remaining_requests is not None:
+                if self._remaining_requests <= 0:
+                    return False
+                self._remaining_requests -= 1
+            self._requests += 1
+            self._in_flight += 1
+            return True
+
+    def _add_stats(self, agent: str, profile: cProfile.Profile):
+        # Caller holds self._lock.
+        if agent in self._stats:
+            self._stats[agent].add(profile)
+        else:
+            self._stats[agent] = pstats.Stats(profile)
+
+    @contextmanager
+    def request(self, trace):
+        # Per-request hook used by handle_client; `trace.agent` tags the results.
+        if not self.active or not self._take_request():
+            yield
+            return
+        if self._mode == "sampling":
+            thread_id = threading.get_ident()
+            self._threads[thread_id] = trace
+            token = _profiled_trace.set(trace)
+            try:
+                yield
+            finally:
+                _profiled_trace.reset(token)
+                self._threads.pop(thread_id, None)
+                self._maybe_finish()
+            return
+
+        profile = cProfile.Profile()
+        try:
+            profile.enable()
+        except ValueError:
+            # Python 3.12+ allows one active cProfile at a time; concurrent requests are skipped.
+            with self._lock:
+                self._skipped += 1
+            try:
+                yield
+            finally:
+                self._maybe_finish()
+            return
+        with self._lock:
+            self._worker_stats[id(trace)] = []
+        token = _profiled_trace.set(trace)
+        try:
+            yield
+        finally:
+            _profiled_trace.reset(token)
+            profile.disable()
+            agent = getattr(trace, "agent", "none")
+            with self._lock:
+                self._add_stats(agent, profile)
+                for worker_profile in self._worker_stats.pop(id(trace), []):
+                    self._add_stats(agent, worker_profile)
+            self._maybe_finish()
+
+    def worker(self, fn: Callable) -> Callable:
+        # Call in the thread that hands fn to another thread. While the current request is being
+        # profiled, the returned wrapper profiles fn's thread under the request's agent as well;
+        # otherwise fn is returned as it is.
+        trace = _profiled_trace.get()
+        if trace is None:
+            return fn
+
+        def run(*args, **kwargs):
+            with self._worker_scope(trace):
+                return fn(*args, **kwargs)
+        return run
+
+    @contextmanager
+    def _worker_scope(self, trace):
+        if not self.active:
+            yield
+            return
+        if self._mode == "sampling":
+            thread_id = threading.get_ident()
+            self._threads[thread_id] = trace
+            try:
+                yield
+            finally:
+                self._threads.pop(thread_id, None)
+            return
+        profile = cProfile.Profile()
+        try:
+            profile.enable()
+        except ValueError:
+            # Python 3.12+: the request's own profile is active and already sees every thread.
+            yield
+            return
+        try:
+            yield
+        finally:
+            profile.disable()
+            with self._lock:
+                pending = self._worker_stats.get(id(trace))
+                if pending is not None:
+                    pending.append(profile)
+                elif self.active:
+                    # Outlived its request (e.g. a hedged duplicate call).
+                    self._add_stats(getattr(trace, "agent", "none"), profile)
+
+    def _maybe_finish(self):
+        # With a request limit, results are written once the last profiled request completed.
+        with self._lock:
+            self._in_flight -= 1
+            done = self.active and self._remaining_requests == 0 and self._in_flight == 0
+        if done:
+            threading.Thread(target=self.stop, name="ProfileWriter", daemon=True).start()
+
+    def _sample_loop(self):
+        own_id = threading.get_ident()
+        while self.active:
+            frames = sys._current_frames()
+            with self._lock:
+                for thread_id, frame in frames.items():
+                    if thread_id == own_id:
+                        continue
+                    trace = self._threads.get(thread_id)
+                    agent = getattr(trace, "agent", "none") if trace is not None else "background"
+                    stack = []
+                    while frame is not None:
+                        stack.append(_frame_label(frame))
+                        frame = frame.f_back
+                    self._samples.setdefault(agent, Counter())[";".join(reversed(stack))] += 1
+            del frames
+            time.sleep(self.sample_interval)
+
+    def status(self) -> str:
+        if not self.active:
+            if not self.last_files:
+                return "Profiling is off.\n"
+            return "Profiling is off. Last results:\n" + "\n".join(self.last_files) + "\n"
+        left = f", {self._deadline - time.monotonic():.0f}s left" if self._deadline else ""
+        requests = f", {self._remaining_requests} requests left" if self._remaining_requests is not None else ""
+        return f"Profiling ({self._mode}): {self._requests} requests profiled{left}{requests}.\n"
+
+    def toggle(self) -> str:
+        if self.active:
+            files = self.stop()
+            return f"Profiling stopped. Wrote: {', '.join(files) or 'nothing (no requests seen)'}"
+        return self.start()
+
+def dump_stacks(directory: Optional[str] = None) -> Tuple[str, Optional[str]]:
+    names = {thread.ident: thread.name for thread in threading.enumerate()}
+    sections = []
+    for thread_id, frame in sys._current_frames().items():
+        sections.append(f"Thread {names.get(thread_id, '?')} ({thread_id}):\n" + "".join(traceback.format_stack(frame)))
+    text = "\n".join(sections)
+    path = None
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+        path = os.path.join(directory, f"stacks-{time.strftime('%Y%m%d-%H%M%S')}-{os.getpid()}.txt")
+        with open(path, "w") as f:
+            f.write(text)
+    return text, path
+
+def tracemalloc_command(action: str, directory: str, frames: int = 25, limit: int = 25) -> str:
+    if action == "start":
+        if tracemalloc.is_tracing():
+            return "tracemalloc is already tracing.\n"
+        tracemalloc.start(frames)
+        return f"tracemalloc started ({frames} frames per traceback).\n"
+    if action == "stop":
+        tracemalloc.stop()
+        return "tracemalloc stopped.\n"
+    if action == "snapshot":
+        if not tracemalloc.is_tracing():
+            return "tracemalloc is not tracing; start it first and let it collect for a while.\n"
+        snapshot = tracemalloc.take_snapshot()
+        os.makedirs(directory, exist_ok=True)
+        path = os.path.join(directory, f"tracemalloc-{time.strftime('%Y%m%d-%H%M%S')}-{os.getpid()}.snapshot")
+        snapshot.dump(path)
+        current, peak = tracemalloc.get_traced_memory()
+        top = snapshot.statistics("lineno")[:limit]
+        lines = [f"Snapshot written to {path} (traced {current / 1024:.0f} KB, peak {peak / 1024:.0f} KB)."]
+        lines.extend(str(stat) for stat in top)
+        return "\n".join(lines) + "\n"
+    raise ValueError(f"Unknown tracemalloc action '{action}'. Use start, snapshot or stop.")
+
+profiler = Profiler()
+
+def _first(query: Dict[str, List[str]], name: str) -> Optional[str]:
+    values = query.get(name)
+    return values[0] if values else None
+
+def register_admin_routes(server):
+    # Routes on the local metrics HTTP server (see metrics.MetricsServer.add_route).
+    def profile(query):
+        action = _first(query, "action") or "start"
+        if action == "stop":
+            files = profiler.stop()
+            return 200, "text/plain", "Wrote:\n" + "\n".join(files) + "\n" if files else "Profiling was not running.\n"
+        if action == "status":
+            return 200, "text/plain", profiler.status()
+        seconds = _first(query, "seconds")
+        requests = _first(query, "requests")
+        message = profiler.start(_first(query, "mode") or "cpu", float(seconds) if seconds else None,
+                                 int(requests) if requests else None)
+        return 200, "text/plain", message + "\n"
+
+    def stacks(query):
+        text, _ = dump_stacks()
+        return 200, "text/plain", text
+
+    def memory(query):
+        frames = _first(query, "frames")
+        return 200, "text/plain", tracemalloc_command(_first(query, "action") or "snapshot", profiler.directory,
+                                                      int(frames) if frames else 25)
+
+    server.add_route("/debug/profile", profile)
+    server.add_route("/debug/stacks", stacks)
+    server.add_route("/debug/tracemalloc", memory)
+
+def install_signal_handlers():
+    # Signal handlers run on the main thread; the work is handed to a thread so accept() isn't held up.
+    def on_usr2(signum, frame):
+        threading.Thread(target=lambda: logger.info(profiler.toggle()), name="ProfileToggle", daemon=True).start()
+
+    def on_usr1(signum, frame):
+        _, path = dump_stacks(profiler.directory)
+        logger.info(f"Thread stacks written to {path}")
+
+    if hasattr(signal, "SIGUSR1"):
+        signal.signal(signal.SIGUSR1, on_usr1)
+        signal.signal(signal.SIGUSR2, on_usr2)
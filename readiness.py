@@ -0,0 +1,71 @@
+# readiness.py
+# Lets whoever started the server know when it accepts connections: a ready file (run.sh),
+# sd_notify's NOTIFY_SOCKET, and systemd-style socket activation via LISTEN_FDS.
+import os
+import socket
+import logging
+from typing import Optional
+
+logger = logging.getLogger(__name__)
+
+SD_LISTEN_FDS_START = 3
+
+def inherited_listen_socket() -> Optional[socket.socket]:
+    # With socket activation the listening socket is already bound and listening on fd 3,
+    # so clients that connect while we are still starting just wait in the accept backlog.
+    if os.getenv("LISTEN_PID") != str(os.getpid()):
+        return None
+    try:
+        count = int(os.getenv("LISTEN_FDS", "0"))
+    except ValueError:
+        return None
+    if count < 1:
+        return None
+    if count > 1:
+        logger.warning(f"{count} sockets passed via LISTEN_FDS; only the first one is used.")
+    for var in ("LISTEN_PID", "LISTEN_FDS", "LISTEN_FDNAMES"):
+        os.environ.pop(var, None)
+    sock = socket.socket(fileno=SD_LISTEN_FDS_START)
+    logger.info(f"Using inherited listening socket {sock.getsockname()} (socket activation).")
+    return sock
+
+def _sd_notify(state: str) -> bool:
+    address = os.getenv("NOTIFY_SOCKET")
+    if not address:
+        return False
+    if address.startswith("@"):
+        address = "\0" + address[1:]
+    try:
+        with socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM) as sock:
+            sock.connect(address)
+            sock.sendall(state.encode("utf-8"))
+        return True
+    except OSError as e:
+        logger.warning(f"sd_notify failed: {e}")
+        return False
+
+def _write_ready_file(path: str, content: str):
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w") as f:
+        f.write(content)
+    os.replace(tmp_path, path)
+
+def notify_ready(ready_file: Optional[str] = None, status: str = "Listening"):
+    ready_file = ready_file or os.getenv("ARCH_CHAN_READY_FILE")
+    if ready_file:
+        try:
+            _write_ready_file(ready_file, f"{os.getpid()}\n")
+            logger.info(f"Readiness signalled through {ready_file}")
+        except OSError as e:
+            logger.error(f"Could not write ready file {ready_file}: {e}")
+    if _sd_notify(f"READY=1\nSTATUS={status}\nMAINPID={os.getpid()}"):
+        logger.info("Readiness signalled through NOTIFY_SOCKET")
+
+def notify_stopping(ready_file: Optional[str] = None):
+    ready_file = ready_file or os.getenv("ARCH_CHAN_READY_FILE")
+    if ready_file:
+        try:
+            os.remove(ready_file)
+        except OSError:
+            pass
+    _sd_notify("STOPPING=1")
@@ -41,24 +41,40 @@ fi
 echo "Starting Arch Chan MCP server in the background..."
 echo "Server logs will be saved to $LOG_DIR/$SERVER_LOG"
 
+# The server writes this file once it is listening, so we wait exactly as long as it needs.
+READY_FILE="$LOG_DIR/mcp_server.ready"
+READY_TIMEOUT=60
+rm -f "$READY_FILE"
+
 # Start the server using nohup to ensure it runs even if the terminal closes.
 # Redirect all output (stdout and stderr) to the server log file.
 # The '&' sends the process to the background.
-nohup "$PYTHON_VENV_EXEC" "$SERVER_SCRIPT" > "$LOG_DIR/$SERVER_LOG" 2>&1 &
+ARCH_CHAN_READY_FILE="$READY_FILE" nohup "$PYTHON_VENV_EXEC" "$SERVER_SCRIPT" > "$LOG_DIR/$SERVER_LOG" 2>&1 &
 
 # Get the Process ID (PID) of the last background command (our server)
 SERVER_PID=$!
 echo "Arch Chan MCP server started with PID: $SERVER_PID"
 
-# Wait a moment for the server to fully initialize
-echo "Waiting 3 seconds for the server to initialize..."
-sleep 3
-
-# Check if server process is still running after sleep
-if ! kill -0 "$SERVER_PID" > /dev/null 2>&1; then
-    echo "Error: MCP server (PID $SERVER_PID) might not have started successfully or crashed."
-    echo "Please check $LOG_DIR/$SERVER_LOG for errors."
-    exit 1
+# Wait for the server's readiness signal instead of a fixed sleep
+echo "Waiting for the server to become ready (up to ${READY_TIMEOUT}s)..."
+WAITED_TENTHS=0
+while [ ! -f "$READY_FILE" ]; do
+    # Check if server process is still running
+    if ! kill -0 "$SERVER_PID" > /dev/null 2>&1; then
+        echo "Error: MCP server (PID $SERVER_PID) might not have started successfully or crashed."
+        echo "Please check $LOG_DIR/$SERVER_LOG for errors."
+        exit 1
+    fi
+    if [ "$WAITED_TENTHS" -ge $((READY_TIMEOUT * 10)) ]; then
+        # The GUI keeps retrying with backoff, so a slow server is not fatal.
+        echo "Warning: server did not report readiness within ${READY_TIMEOUT}s. Starting the GUI anyway."
+        break
+    fi
+    sleep 0.1
+    WAITED_TENTHS=$((WAITED_TENTHS + 1))
+done
+if [ -f "$READY_FILE" ]; then
+    echo "Server ready after ~$((WAITED_TENTHS / 10)).$((WAITED_TENTHS % 10))s."
 fi
 
 # --- Start GUI ---
@@ -85,4 +101,6 @@ if kill -0 "$SERVER_PID" > /dev/null 2>&1; then
     kill -9 "$SERVER_PID" # Force kill if it's still running
 fi
 
+rm -f "$READY_FILE"
+
 echo "Arch Chan session ended."
\ No newline at end of file
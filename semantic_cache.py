@@ -0,0 +1,205 @@
+# semantic_cache.py
+# Near-duplicate cache for the short structured LLM calls (agent routing, argument extraction).
+# "show memory usage" and "show me the memory usage please" get the same routing and extraction
+# answers, so a rephrased request can skip those calls. Inputs are compared by the Jaccard
+# similarity of their content words (and those words' character 3-grams), found through MinHash
+# signatures in an LSH index.
+# Values that change an answer (numbers, hashes, CVE IDs, quoted text, file names, operators and
+# other punctuation, capitalized words) must match exactly, case included.
+import os
+import re
+import struct
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import Dict, FrozenSet, List, Optional, Set, Tuple
+
+_MERSENNE_PRIME = (1 << 61) - 1
+_WORD_RE = re.compile(r"[\w'-]+", re.UNICODE)
+# Tokens that carry the request's arguments; two requests differing in any of them are not duplicates.
+# Quoted text and paths come first so their contents stay one token; runs of punctuation keep
+# operators ("5 + 3" vs "5 - 3").
+_SALIENT_RE = re.compile(r"\"[^\"]*\"|'[^']*'|cve-\d{4}-\d+|[\w~-]*[./][\w./~-]+|\b[0-9a-f]{6,}\b|\d+(?:[.,]\d+)?|[^\w\s]+",
+                         re.IGNORECASE)
+# Words with a capital letter anywhere but at the start of the text ("md5 Hello" vs "md5 hello").
+_CASED_RE = re.compile(r"(?<!^)\b\w*[^\W\d_a-z]\w*", re.UNICODE)
+
+# Filler words (English and Turkish) that rephrasings add or drop without changing the request.
+STOPWORDS = frozenset("""
+a an the me my mine i you your it its is are am was be do does did can could would will should please
+pls what whats what's which who how much many some any of for to in on at about this that these those
+and or tell show give let lets let's get just now right currently current there here with
+bana benim ben sen bir bu şu ne nedir kaç nasıl mi mı mu mü lütfen ve ile için de da
+""".split())
+
+def normalize(text: str) -> str:
+    # Key for exact matches: only whitespace is folded.
+    return " ".join(text.split())
+
+def features(text: str) -> FrozenSet[str]:
+    # Content words plus their character 3-grams (tolerates typos and inflections).
+    words = [word for word in _WORD_RE.findall(text.lower()) if word not in STOPWORDS]
+    grams = {f"w:{word}" for word in words}
+    for word in words:
+        padded = f" {word} "
+        grams.update(padded[i:i + 3] for i in range(len(padded) - 2))
+    return frozenset(grams)
+
+def salient_tokens(text: str) -> FrozenSet[str]:
+    text = text.strip()
+    return frozenset(_SALIENT_RE.findall(text)) | frozenset(_CASED_RE.findall(text))
+
+def jaccard(a: FrozenSet[str], b: FrozenSet[str]) -> float:
+    if not a and not b:
+        return 1.0
+    return len(a & b) / len(a | b)
+
+class MinHasher:
+    def __init__(self, num_perm: int = 64, seed: int = 1):
+        values = hashlib.sha256(f"minhash-{seed}".encode()).digest()
+        coefficients = []
+        counter = 0
+        while len(coefficients) < num_perm * 2:
+            block = hashlib.sha256(values + struct.pack("<I", counter)).digest()
+            coefficients.extend(value % _MERSENNE_PRIME for value in struct.unpack("<4Q", block))
+            counter += 1
+        self.num_perm = num_perm
+        self._a = [max(1, a) for a in coefficients[:num_perm]]
+        self._b = coefficients[num_perm:num_perm * 2]
+
+    def signature(self, grams: FrozenSet[str]) -> Tuple[int, ...]:
+        hashes = [int.from_bytes(hashlib.blake2b(g.encode("utf-8"), digest_size=8).digest(), "little") for g in grams]
+        if not hashes:
+            return (0,) * self.num_perm
+        return tuple(min((a * h + b) % _MERSENNE_PRIME for h in hashes) for a, b in zip(self._a, self._b))
+
+class _Entry:
+    __slots__ = ("key", "scope", "normalized", "grams", "salient", "value", "bands", "size")
+
+    def __init__(self, key, scope, normalized, grams, salient, value, bands):
+        self.key = key
+        self.scope = scope
+        self.normalized = normalized
+        self.grams = grams
+        self.salient = salient
+        self.value = value
+        self.bands = bands
+        # Rough footprint: strings, feature set and signature bands, plus per-object overhead.
+        self.size = (len(normalized) + len(value.encode("utf-8")) + sum(len(g) + 56 for g in grams)
+                     + len(bands) * 80 + 400)
+
+class SemanticCache:
+    """Scoped by a key of the provider, model and system prompt, so only requests to the same
+    prompt are compared. Least recently used entries are evicted beyond `max_bytes`."""
+
+    def __init__(self, max_bytes: Optional[int] = None, threshold: Optional[float] = None,
+                 tasks: Optional[Set[str]] = None, bands: int = 16, rows: int = 4):
+        self.max_bytes = int(float(os.getenv("ARCH_CHAN_SEMANTIC_CACHE_MB", "8")) * 1024 * 1024) if max_bytes is None else max_bytes
+        self.threshold = float(os.getenv("ARCH_CHAN_SEMANTIC_THRESHOLD", "0.85")) if threshold is None else threshold
+        self.tasks = tasks if tasks is not None else {
+            task.strip() for task in os.getenv("ARCH_CHAN_SEMANTIC_CACHE_TASKS", "routing,extraction").split(",") if task.strip()}
+        self.bands = bands
+        self.rows = rows
+        self._hasher = MinHasher(bands * rows)
+        self._lock = threading.Lock()
+        self._entries: "OrderedDict[int, _Entry]" = OrderedDict()
+        self._exact: Dict[Tuple[str, str], int] = {}
+        self._buckets: Dict[Tuple[str, int, Tuple[int, ...]], Set[int]] = {}
+        self._next_key = 0
+        self.bytes = 0
+        self.counters = {"hits": 0, "exact_hits": 0, "misses": 0, "stores": 0, "evictions": 0}
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_bytes > 0 and bool(self.tasks)
+
+    def caches(self, task: str) -> bool:
+        return self.enabled and task in self.tasks
+
+    def _bands(self, grams: FrozenSet[str]) -> List[Tuple[int, ...]]:
+        signature = self._hasher.signature(grams)
+        return [signature[i * self.rows:(i + 1) * self.rows] for i in range(self.bands)]
+
+    def get(self, scope: str, text: str) -> Optional[str]:
+        normalized = normalize(text)
+        with self._lock:
+            key = self._exact.get((scope, normalized))
+            if key is not None:
+                self._entries.move_to_end(key)
+                self.counters["exact_hits"] += 1
+                return self._entries[key].value
+        grams = features(text)
+        if not grams:
+            # Nothing but filler words ("how are you"): only exact matches are safe.
+            with self._lock:
+                self.counters["misses"] += 1
+            return None
+        bands = self._bands(grams)
+        salient = salient_tokens(text)
+        with self._lock:
+            candidates = set()
+            for index, band in enumerate(bands):
+                candidates.update(self._buckets.get((scope, index, band), ()))
+            best, best_score = None, self.threshold
+            for key in candidates:
+                entry = self._entries.get(key)
+                if entry is None or entry.salient != salient:
+                    continue
+                score = jaccard(grams, entry.grams)
+                if score >= best_score:
+                    best, best_score = entry, score
+            if best is None:
+                self.counters["misses"] += 1
+                return None
+            self._entries.move_to_end(best.key)
+            self.counters["hits"] += 1
+            return best.value
+
+    def put(self, scope: str, text: str, value: str):
+        if not self.enabled:
+            return
+        normalized = normalize(text)
+        grams = features(text)
+        # Filler-only inputs are kept for exact matches only.
+        bands = self._bands(grams) if grams else []
+        with self._lock:
+            if (scope, normalized) in self._exact:
+                return
+            key = self._next_key
+            self._next_key += 1
+            entry = _Entry(key, scope, normalized, grams, salient_tokens(text), value, bands)
+            if entry.size > self.max_bytes:
+                return
+            self._entries[key] = entry
+            self._exact[(scope, normalized)] = key
+            for index, band in enumerate(bands):
+                self._buckets.setdefault((scope, index, band), set()).add(key)
+            self.bytes += entry.size
+            self.counters["stores"] += 1
+            while self.bytes > self.max_bytes and self._entries:
+                self._evict_oldest()
+
+    def _evict_oldest(self):
+        _, entry = self._entries.popitem(last=False)
+        self._exact.pop((entry.scope, entry.normalized), None)
+        for index, band in enumerate(entry.bands):
+            bucket = self._buckets.get((entry.scope, index, band))
+            if bucket is not None:
+                bucket.discard(entry.key)
+                if not bucket:
+                    del self._buckets[(entry.scope, index, band)]
+        self.bytes -= entry.size
+        self.counters["evictions"] += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._exact.clear()
+            self._buckets.clear()
+            self.bytes = 0
+
+    def stats(self) -> Dict[str, float]:
+        with self._lock:
+            return {**self.counters, "entries": len(self._entries), "bytes": self.bytes}
+
+semantic_cache = SemanticCache()
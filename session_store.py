@@ -0,0 +1,271 @@
+# session_store.py
+import os
+import re
+import json
+import zlib
+import time
+import uuid
+import threading
+import logging
+from collections import OrderedDict
+from typing import Callable, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_SESSION_DIR = os.path.join(os.path.expanduser("~"), ".local", "share", "arch-chan", "sessions")
+
+# Tokens are used as file names, so only a conservative character set is accepted.
+_TOKEN_RE = re.compile(r'^[A-Za-z0-9_-]{8,128}$')
+
+History = List[Tuple[str, str]]  # [(role, text), ...]
+
+def is_valid_token(token: Optional[str]) -> bool:
+    return bool(token) and bool(_TOKEN_RE.match(token))
+
+def history_size(history: History) -> int:
+    return sum(len(role) + len(text.encode('utf-8')) for role, text in history)
+
+class SessionLimitError(Exception):
+    pass
+
+class Session:
+    def __init__(self, token: str, chat_bot, persistent: bool = True):
+        self.token = token
+        self.chat_bot = chat_bot
+        self.persistent = persistent
+        self.clients = 0
+        self.created = time.time()
+        self.last_active = self.created
+        self.memory_bytes = 0
+        self.turns = 0
+        # mtime of the history file this session's in-memory history corresponds to
+        self.synced_mtime_ns = 0
+        # Serializes requests of several connections that share one session token.
+        self.lock = threading.Lock()
+
+    def touch(self):
+        self.last_active = time.time()
+
+class SessionStore:
+    """Keeps chat sessions keyed by a client-provided token and persists their history on disk.
+
+    Sessions without a connected client are evicted LRU-first once max_sessions is reached or
+    after idle_timeout seconds; their history is written to disk before they are dropped.
+    Ephemeral sessions of clients without a token count against max_sessions while connected.
+    """
+
+    def __init__(self, chat_bot_factory: Callable[[History], object], directory: Optional[str] = None,
+                 max_sessions: Optional[int] = None, idle_timeout: Optional[float] = None,
+                 max_history_bytes: Optional[int] = None, shared: bool = False):
+        self.chat_bot_factory = chat_bot_factory
+        # With several worker processes the history file is the source of truth: it is written
+        # after every turn and reloaded whenever another process has updated it.
+        self.shared = shared
+        self.directory = directory or os.getenv("ARCH_CHAN_SESSION_DIR", DEFAULT_SESSION_DIR)
+        self.max_sessions = max_sessions or int(os.getenv("ARCH_CHAN_MAX_SESSIONS", "64"))
+        self.idle_timeout = idle_timeout or float(os.getenv("ARCH_CHAN_IDLE_TIMEOUT", "1800"))
+        self.max_history_bytes = max_history_bytes or int(os.getenv("ARCH_CHAN_SESSION_MAX_BYTES", str(256 * 1024)))
+        self._sessions: "OrderedDict[str, Session]" = OrderedDict()
+        self._ephemeral: Dict[str, Session] = {}
+        self._lock = threading.Lock()
+        self._reaper: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+        self.evictions = 0
+        self.trimmed_turns = 0
+        os.makedirs(self.directory, exist_ok=True)
+        logger.info(f"Session store using directory: {self.directory} (max sessions: {self.max_sessions}, "
+                    f"idle timeout: {self.idle_timeout:.0f}s, history cap: {self.max_history_bytes} bytes)")
+
+    def _path(self, token: str) -> str:
+        return os.path.join(self.directory, f"{token}.json.z")
+
+    def _disk_mtime_ns(self, token: str) -> int:
+        try:
+            return os.stat(self._path(token)).st_mtime_ns
+        except OSError:
+            return 0
+
+    def load_history(self, token: str) -> History:
+        path = self._path(token)
+        if not os.path.exists(path):
+            return []
+        try:
+            with open(path, 'rb') as f:
+                raw = json.loads(zlib.decompress(f.read()).decode('utf-8'))
+            return [(role, text) for role, text in raw]
+        except (OSError, zlib.error, ValueError, TypeError) as e:
+            logger.error(f"Could not load history for session {token[:8]}...: {e}. Starting with empty history.")
+            return []
+
+    def save_history(self, token: str, history: History) -> int:
+        path = self._path(token)
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            payload = json.dumps(history, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+            with open(tmp_path, 'wb') as f:
+                f.write(zlib.compress(payload, 6))
+            os.replace(tmp_path, path)
+            return os.stat(path).st_mtime_ns
+        except OSError as e:
+            logger.error(f"Could not persist history for session {token[:8]}...: {e}")
+            try:
+                os.remove(tmp_path)
+            except OSError:
+                pass
+            return 0
+
+    def acquire(self, token: Optional[str]) -> Session:
+        # Legacy clients without a token get a private session that is never written to disk.
+        if not is_valid_token(token):
+            if token:
+                logger.warning("Client sent an invalid session token. Using an ephemeral session.")
+            with self._lock:
+                evicted = self._evict_locked(self._capacity_locked() - 1)
+                if self._capacity_locked() <= len(self._sessions):
+                    raise SessionLimitError(f"All {self.max_sessions} sessions are in use by connected clients.")
+                session = Session(f"ephemeral-{uuid.uuid4().hex}", self.chat_bot_factory([]), persistent=False)
+                session.clients = 1
+                self._ephemeral[session.token] = session
+            for old in evicted:
+                self.persist(old)
+            return session
+
+        evicted = []
+        with self._lock:
+            session = self._sessions.get(token)
+            if session is not None and self.shared and self._disk_mtime_ns(token) > session.synced_mtime_ns:
+                # Another worker process continued this conversation; start from its newer history.
+                if session.clients == 0:
+                    del self._sessions[token]
+                    session = None
+            if session is not None:
+                self._sessions.move_to_end(token)
+                logger.info(f"Session {token[:8]}... reattached from memory.")
+            else:
+                evicted = self._evict_locked(self._capacity_locked() - 1)
+                if len(self._sessions) >= self._capacity_locked():
+                    raise SessionLimitError(f"All {self.max_sessions} sessions are in use by connected clients.")
+                mtime_ns = self._disk_mtime_ns(token)
+                history = self.load_history(token)
+                session = Session(token, self.chat_bot_factory(history))
+                session.synced_mtime_ns = mtime_ns
+                session.memory_bytes = history_size(history)
+                session.turns = len(history)
+                self._sessions[token] = session
+                logger.info(f"Session {token[:8]}... resumed with {len(history)} history entries.")
+            session.clients += 1
+            session.touch()
+
+        for old in evicted:
+            self.persist(old)
+        return session
+
+    def release(self, session: Session):
+        if not session.persistent:
+            with self._lock:
+                self._ephemeral.pop(session.token, None)
+            return
+        with self._lock:
+            session.clients = max(0, session.clients - 1)
+            session.touch()
+        self.persist(session)
+
+    def account(self, session: Session):
+        # Called after every turn: keeps memory accounting current and enforces the per-session cap.
+        dropped = session.chat_bot.trim_history(self.max_history_bytes)
+        if dropped:
+            self.trimmed_turns += dropped
+            logger.info(f"Session {session.token[:8]}... history trimmed by {dropped} entries to stay under "
+                        f"{self.max_history_bytes} bytes.")
+        history = session.chat_bot.export_history()
+        session.memory_bytes = history_size(history)
+        session.turns = len(history)
+        if self.shared and session.persistent:
+            session.synced_mtime_ns = self.save_history(session.token, history)
+
+    def persist(self, session: Session):
+        if not session.persistent:
+            return
+        with session.lock:
+            history = session.chat_bot.export_history()
+        session.synced_mtime_ns = self.save_history(session.token, history)
+
+    def persist_all(self):
+        with self._lock:
+            sessions = list(self._sessions.values())
+        for session in sessions:
+            self.persist(session)
+        logger.info(f"Persisted {len(sessions)} session(s) to disk.")
+
+    def _capacity_locked(self) -> int:
+        # Slots left for persistent sessions once connected ephemeral sessions are counted.
+        return self.max_sessions - len(self._ephemeral)
+
+    def _evict_locked(self, keep: int, idle_before: Optional[float] = None) -> List[Session]:
+        # Walks sessions from least to most recently used; connected sessions are never evicted.
+        evicted = []
+        for token, session in sorted(self._sessions.items(), key=lambda item: item[1].last_active):
+            if session.clients > 0:
+                continue
+            over_limit = len(self._sessions) > keep
+            idle = idle_before is not None and session.last_active < idle_before
+            if not over_limit and not idle:
+                continue
+            del self._sessions[token]
+            evicted.append(session)
+        self.evictions += len(evicted)
+        return evicted
+
+    def reap(self):
+        with self._lock:
+            evicted = self._evict_locked(self._capacity_locked(), idle_before=time.time() - self.idle_timeout)
+        for session in evicted:
+            # History is already on disk from release(); writing again covers sessions that changed since.
+            self.persist(session)
+        if evicted:
+            logger.info(f"Evicted {len(evicted)} idle session(s) to disk. Stats: {self.stats(include_sessions=False)}")
+
+    def start_reaper(self, interval: Optional[float] = None):
+        interval = interval or max(5.0, min(60.0, self.idle_timeout / 2))
+
+        def _run():
+            while not self._stop.wait(interval):
+                try:
+                    self.reap()
+                except Exception as e:
+                    logger.error(f"Session reaper error: {e}", exc_info=True)
+
+        self._reaper = threading.Thread(target=_run, name="SessionReaper", daemon=True)
+        self._reaper.start()
+
+    def stop_reaper(self):
+        self._stop.set()
+
+    def stats(self, include_sessions: bool = True) -> Dict:
+        now = time.time()
+        with self._lock:
+            sessions = list(self._sessions.values())
+            ephemeral = list(self._ephemeral.values())
+        result = {
+            "sessions": len(sessions) + len(ephemeral),
+            "ephemeral_sessions": len(ephemeral),
+            "connected_sessions": sum(1 for s in sessions if s.clients > 0) + len(ephemeral),
+            "max_sessions": self.max_sessions,
+            "idle_timeout": self.idle_timeout,
+            "memory_bytes": sum(s.memory_bytes for s in sessions + ephemeral),
+            "max_history_bytes": self.max_history_bytes,
+            "evictions": self.evictions,
+            "trimmed_turns": self.trimmed_turns,
+        }
+        if include_sessions:
+            result["per_session"] = [
+                {
+                    "token": f"{s.token[:8]}...",
+                    "clients": s.clients,
+                    "idle_seconds": round(now - s.last_active, 1),
+                    "memory_bytes": s.memory_bytes,
+                    "turns": s.turns,
+                }
+                for s in sessions + ephemeral
+            ]
+        return result
@@ -0,0 +1,158 @@
+# tests/test_llm_runtime.py
+# Scheduler ordering, circuit breaker cycle and retry/hedge behavior of ResilientCaller.
+#
+#   python -m unittest discover tests
+import os
+import sys
+import time
+import threading
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from llm_runtime import (CircuitBreaker, LLMScheduler, RateLimitTimeout, ResilientCaller,
+                         PRIORITY_BACKGROUND, PRIORITY_INTERACTIVE, PRIORITY_NORMAL)
+
+class LLMSchedulerTest(unittest.TestCase):
+    def setUp(self):
+        self.scheduler = LLMScheduler(requests_per_minute=60000, tokens_per_minute=10 ** 9, max_wait=10)
+        self.order = []
+        consume = self.scheduler.token_bucket.consume
+
+        def record(amount):
+            # Called under the scheduler lock in admission order; each test call uses its id as token count.
+            self.order.append(amount)
+            consume(amount)
+        self.scheduler.token_bucket.consume = record
+        # Hold every call in the queue until the test has enqueued all of them.
+        self.scheduler.request_bucket.level = -10 ** 9
+        self.threads = []
+
+    def enqueue(self, call_id: int, priority: int, session_key: str):
+        thread = threading.Thread(target=self.scheduler.acquire, args=(priority, session_key, call_id))
+        thread.start()
+        self.threads.append(thread)
+        while len(self.scheduler._heap) < len(self.threads):
+            time.sleep(0.001)
+
+    def release_all(self):
+        with self.scheduler._cond:
+            self.scheduler.request_bucket.level = self.scheduler.request_bucket.capacity
+            self.scheduler._cond.notify_all()
+        for thread in self.threads:
+            thread.join(5)
+
+    def test_higher_priority_runs_first(self):
+        self.enqueue(1, PRIORITY_BACKGROUND, "a")
+        self.enqueue(2, PRIORITY_NORMAL, "a")
+        self.enqueue(3, PRIORITY_INTERACTIVE, "a")
+        self.release_all()
+        self.assertEqual(self.order, [3, 2, 1])
+
+    def test_sessions_share_a_priority_level_fairly(self):
+        for call_id in (1, 2, 3):
+            self.enqueue(call_id, PRIORITY_INTERACTIVE, "busy")
+        self.enqueue(4, PRIORITY_INTERACTIVE, "quiet")
+        self.release_all()
+        self.assertEqual(self.order, [1, 4, 2, 3])
+
+    def test_queue_wait_is_bounded(self):
+        self.scheduler.max_wait = 0.05
+        with self.assertRaises(RateLimitTimeout):
+            self.scheduler.acquire(PRIORITY_INTERACTIVE, "a", 1)
+        self.assertEqual(self.scheduler.timeouts, 1)
+        self.assertEqual(self.scheduler._heap, [])
+
+class CircuitBreakerTest(unittest.TestCase):
+    def test_open_half_open_close_cycle(self):
+        breaker = CircuitBreaker(threshold=2, cooldown=0.05)
+        breaker.record_failure()
+        self.assertEqual(breaker.state, "closed")
+        breaker.record_failure()
+        self.assertEqual(breaker.state, "open")
+        self.assertFalse(breaker.allow())
+
+        time.sleep(0.06)
+        self.assertTrue(breaker.allow())
+        self.assertEqual(breaker.state, "half_open")
+        self.assertFalse(breaker.allow(), "only one probe may be in flight")
+        breaker.record_failure()
+        self.assertEqual(breaker.state, "open")
+
+        time.sleep(0.06)
+        self.assertTrue(breaker.allow())
+        breaker.record_success()
+        self.assertEqual(breaker.state, "closed")
+        self.assertTrue(breaker.allow())
+
+class ResilientCallerTest(unittest.TestCase):
+    def setUp(self):
+        self.caller = ResilientCaller()
+        self.caller.hedging = True
+        self.caller.retries = 2
+        self.caller.backoff_base = 0.001
+        self.caller.breaker = CircuitBreaker(threshold=1, cooldown=0.0)
+
+    def warm_up(self, kind: str, seconds: float = 0.01):
+        for _ in range(self.caller.latency.min_samples):
+            self.caller.latency.record(kind, seconds)
+
+    def test_transient_error_is_retried(self):
+        attempts = []
+        admitted = []
+
+        def flaky():
+            attempts.append(1)
+            if len(attempts) == 1:
+                raise ConnectionError("503 unavailable")
+            return "ok"
+        self.assertEqual(self.caller.call(flaky, admit=lambda: admitted.append(1)), "ok")
+        self.assertEqual(len(attempts), 2)
+        self.assertEqual(len(admitted), 1)
+        self.assertEqual(self.caller.counters["retries"], 1)
+
+    def test_slow_call_is_hedged(self):
+        self.warm_up("routing")
+        calls = []
+
+        def slow_then_fast():
+            calls.append(1)
+            if len(calls) == 1:
+                time.sleep(0.5)
+                return "primary"
+            return "hedge"
+        self.assertEqual(self.caller.call(slow_then_fast, kind="routing", hedge=True), "hedge")
+        self.assertEqual(self.caller.counters["hedges"], 1)
+        self.assertEqual(self.caller.counters["hedge_wins"], 1)
+
+    def test_refused_hedge_waits_for_primary(self):
+        self.warm_up("routing")
+        refusals = []
+
+        def refuse():
+            refusals.append(1)
+            return False
+        started = time.process_time()
+        result = self.caller.call(lambda: time.sleep(0.3) or "primary", kind="routing", hedge=True, try_admit=refuse)
+        self.assertEqual(result, "primary")
+        self.assertEqual(len(refusals), 1)
+        self.assertEqual(self.caller.counters["hedges_refused"], 1)
+        self.assertLess(time.process_time() - started, 0.1, "waiting after a refused hedge must not spin")
+
+    def test_refused_retry_releases_half_open_probe(self):
+        with self.assertRaises(ZeroDivisionError):
+            self.caller.call(lambda: 1 / 0)
+        self.assertEqual(self.caller.breaker.state, "open")
+
+        def unavailable():
+            raise ConnectionError("503 unavailable")
+
+        def admit():
+            raise RateLimitTimeout("no capacity")
+        with self.assertRaises(RateLimitTimeout):
+            self.caller.call(unavailable, admit=admit)
+        self.assertEqual(self.caller.breaker.state, "open")
+        self.assertTrue(self.caller.breaker.allow(), "the next probe must be let through after the cooldown")
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,38 @@
+# tests/test_semantic_cache.py
+# Regression tests for the near-duplicate cache: requests whose arguments differ only in an
+# operator or in letter case must not share an extraction answer.
+#
+#   python -m unittest discover tests
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from semantic_cache import SemanticCache
+
+class SemanticCacheTest(unittest.TestCase):
+    def setUp(self):
+        self.cache = SemanticCache(max_bytes=1024 * 1024, threshold=0.85, tasks={"extraction"})
+
+    def assert_distinct(self, stored: str, lookup: str):
+        self.cache.put("extraction", stored, "cached answer")
+        self.assertIsNone(self.cache.get("extraction", lookup), f"{lookup!r} reused the answer for {stored!r}")
+
+    def test_different_operator_is_not_a_near_hit(self):
+        self.assert_distinct("calculate 5 + 3", "calculate 5 - 3")
+
+    def test_different_operator_is_not_an_exact_hit(self):
+        self.assert_distinct("calculate 2*3", "calculate 2/3")
+
+    def test_different_case_is_not_a_hit(self):
+        self.assert_distinct("md5 'Hello'", "md5 'hello'")
+        self.assert_distinct("md5 Hello", "md5 hello")
+
+    def test_rephrasing_still_hits(self):
+        self.cache.put("extraction", "show memory usage", "cached answer")
+        self.assertEqual(self.cache.get("extraction", "Show me the memory usage please"), "cached answer")
+        self.assertEqual(self.cache.get("extraction", "show  memory usage"), "cached answer")
+
+if __name__ == '__main__':
+    unittest.main()
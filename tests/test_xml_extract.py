@@ -0,0 +1,71 @@
+# tests/test_xml_extract.py
+# StreamingXMLParser must report exactly what XMLSchema.parse finds, however the output is chunked.
+#
+#   python -m unittest discover tests
+import os
+import sys
+import random
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from xml_extract import StreamingXMLParser, XMLSchema
+
+SCHEMA = XMLSchema("command_response", ["linux", "action_type", "description"])
+
+FRAGMENTS = [
+    "Sure, here you go:\n", "```xml\n", "```\n", "<command_response>", "<command_response id=\"1\">",
+    "</command_response>", "<linux>ls -la /tmp</linux>", "<linux>grep 'a &amp; b' &lt; in</linux>",
+    "<linux/>", "<action_type>run</action_type>", "<action_type >wait</action_type >",
+    "<description>Lists &quot;files&quot;</description>", "<description></description>",
+    "<linux>echo <b>x</b></linux>", "</linux>", "<descr", "text < more > text", "\n  ",
+]
+
+def random_document(rng: random.Random) -> str:
+    return "".join(rng.choice(FRAGMENTS) for _ in range(rng.randint(1, 12)))
+
+def random_chunks(rng: random.Random, text: str):
+    position = 0
+    while position < len(text):
+        size = rng.randint(1, 12)
+        yield text[position:position + size]
+        position += size
+
+class StreamingXMLParserTest(unittest.TestCase):
+    def stream(self, text: str, rng: random.Random) -> StreamingXMLParser:
+        parser = StreamingXMLParser(SCHEMA)
+        for chunk in random_chunks(rng, text):
+            parser.feed(chunk)
+        return parser
+
+    def test_fields_arrive_before_the_root_closes(self):
+        parser = StreamingXMLParser(SCHEMA)
+        self.assertEqual(parser.feed("<command_response><linux>ls</li"), [])
+        self.assertEqual(parser.feed("nux><action_type>"), [("linux", "ls")])
+        self.assertTrue(parser.has("linux"))
+        self.assertFalse(parser.has("linux", "action_type"))
+
+    def test_fields_outside_the_root_are_ignored(self):
+        parser = StreamingXMLParser(SCHEMA)
+        parser.feed("<linux>rm -rf /</linux><command_response><linux>ls</linux></command_response>")
+        self.assertEqual(parser.fields, {"linux": "ls"})
+
+    def test_random_chunking_matches_parse(self):
+        # Without a root element parse() falls back to the whole text, which can only be known once the
+        # stream ended; the streaming parser reports nothing early then, and close() gives the answer.
+        rng = random.Random(1234)
+        for _ in range(2000):
+            text = random_document(rng)
+            expected = SCHEMA.extract(text)
+            parser = self.stream(text, rng)
+            if expected is None:
+                self.assertEqual(parser.fields, {}, f"document: {text!r}")
+                continue
+            self.assertEqual(parser.close().fields, expected.fields, f"document: {text!r}")
+            if "<command_response" in text:
+                self.assertEqual(parser.fields, expected.fields, f"document: {text!r}")
+            else:
+                self.assertEqual(parser.fields, {}, f"document: {text!r}")
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,278 @@
+# transcript_view.py
+import os
+import json
+import html
+import shutil
+import logging
+from collections import OrderedDict
+from typing import List, Optional
+
+from PyQt5.QtWidgets import QApplication, QListView, QStyledItemDelegate, QStyle, QAbstractItemView
+from PyQt5.QtGui import QTextDocument, QKeySequence, QPalette, QAbstractTextDocumentLayout
+from PyQt5.QtCore import Qt, QAbstractListModel, QModelIndex, QSize, QEvent
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_PAGE_DIR = os.path.join(os.path.expanduser("~"), ".cache", "arch-chan", "transcript")
+
+MessageRole = Qt.UserRole + 1
+
+# Outputs longer than this are shown collapsed to a short preview until clicked.
+COLLAPSE_LINES = 12
+COLLAPSE_CHARS = 1500
+PREVIEW_LINES = 5
+
+class TranscriptMessage:
+    def __init__(self, message_id: int, sender: str, text: str, color: str, preformatted: bool = False):
+        self.id = message_id
+        self.sender = sender
+        self.text = text
+        self.color = color
+        self.preformatted = preformatted
+        line_count = text.count("\n") + 1
+        self.collapsible = preformatted and (line_count > COLLAPSE_LINES or len(text) > COLLAPSE_CHARS)
+        self.collapsed = self.collapsible
+        self._html_cache = {}
+
+    def to_html(self) -> str:
+        # Built lazily and only for the state being displayed; expanded output is rendered on first expand.
+        cached = self._html_cache.get(self.collapsed)
+        if cached is not None:
+            return cached
+
+        header = f"<b style='color: {self.color};'>{html.escape(self.sender)}:</b> "
+        if self.preformatted:
+            text = self.text
+            footer = ""
+            if self.collapsed:
+                lines = text.split("\n")
+                text = "\n".join(lines[:PREVIEW_LINES])[:COLLAPSE_CHARS // 3]
+                footer = (f"<div style='color: gray;'>&#9656; {max(0, len(lines) - PREVIEW_LINES)} more lines, "
+                          f"{len(self.text)} characters (click to expand)</div>")
+            elif self.collapsible:
+                footer = "<div style='color: gray;'>&#9662; click to collapse</div>"
+            body = f"<pre>{html.escape(text)}</pre>{footer}"
+        else:
+            body = html.escape(self.text).replace("\n", "<br>")
+
+        rendered = header + body
+        self._html_cache[self.collapsed] = rendered
+        return rendered
+
+    def to_record(self) -> dict:
+        return {"id": self.id, "sender": self.sender, "text": self.text,
+                "color": self.color, "preformatted": self.preformatted}
+
+    @classmethod
+    def from_record(cls, record: dict) -> "TranscriptMessage":
+        return cls(record["id"], record["sender"], record["text"], record["color"], record["preformatted"])
+
+class TranscriptModel(QAbstractListModel):
+    """Chat transcript that keeps at most max_in_memory messages; older pages are spilled to disk."""
+
+    def __init__(self, parent=None, max_in_memory: Optional[int] = None, page_size: int = 100,
+                 page_dir: Optional[str] = None):
+        super().__init__(parent)
+        self.max_in_memory = max_in_memory or int(os.getenv("ARCH_CHAN_SCROLLBACK", "500"))
+        self.page_size = page_size
+        self.page_dir = page_dir or os.path.join(DEFAULT_PAGE_DIR, str(os.getpid()))
+        os.makedirs(self.page_dir, exist_ok=True)
+        self._messages: List[TranscriptMessage] = []
+        self._next_id = 0
+
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self._messages)
+
+    def data(self, index, role=Qt.DisplayRole):
+        if not index.isValid() or not 0 <= index.row() < len(self._messages):
+            return None
+        message = self._messages[index.row()]
+        if role == MessageRole:
+            return message
+        if role == Qt.DisplayRole:
+            return f"{message.sender}: {message.text}"
+        return None
+
+    def append(self, sender: str, text: str, color: str, preformatted: bool = False, page_out: bool = True):
+        # page_out=False keeps older rows (e.g. history the user is reading); a later append catches up.
+        row = len(self._messages)
+        self.beginInsertRows(QModelIndex(), row, row)
+        self._messages.append(TranscriptMessage(self._next_id, sender, text, color, preformatted))
+        self._next_id += 1
+        self.endInsertRows()
+        if page_out:
+            self._page_out()
+
+    def toggle_collapsed(self, index: QModelIndex) -> bool:
+        message = self.data(index, MessageRole)
+        if message is None or not message.collapsible:
+            return False
+        message.collapsed = not message.collapsed
+        self.dataChanged.emit(index, index)
+        return True
+
+    def _page_path(self, page: int) -> str:
+        return os.path.join(self.page_dir, f"page-{page:06d}.jsonl")
+
+    def _page_out(self):
+        while len(self._messages) > self.max_in_memory:
+            first_id = self._messages[0].id
+            page = first_id // self.page_size
+            count = min(len(self._messages), (page + 1) * self.page_size - first_id)
+            path = self._page_path(page)
+            if not os.path.exists(path):
+                try:
+                    with open(path, 'w', encoding='utf-8') as f:
+                        for message in self._messages[:count]:
+                            f.write(json.dumps(message.to_record(), ensure_ascii=False) + "\n")
+                except OSError as e:
+                    logger.error(f"Could not store transcript page {page}: {e}")
+                    return
+            self.beginRemoveRows(QModelIndex(), 0, count - 1)
+            del self._messages[:count]
+            self.endRemoveRows()
+
+    def has_older(self) -> bool:
+        return bool(self._messages) and self._messages[0].id > 0
+
+    def load_older_page(self) -> int:
+        if not self.has_older():
+            return 0
+        page = (self._messages[0].id - 1) // self.page_size
+        try:
+            with open(self._page_path(page), 'r', encoding='utf-8') as f:
+                older = [TranscriptMessage.from_record(json.loads(line)) for line in f if line.strip()]
+        except (OSError, ValueError, KeyError) as e:
+            logger.error(f"Could not load transcript page {page}: {e}")
+            return 0
+        older = [m for m in older if m.id < self._messages[0].id]
+        if older:
+            self.beginInsertRows(QModelIndex(), 0, len(older) - 1)
+            self._messages[:0] = older
+            self.endInsertRows()
+        return len(older)
+
+    def cleanup(self):
+        shutil.rmtree(self.page_dir, ignore_errors=True)
+
+class TranscriptDelegate(QStyledItemDelegate):
+    # Rich text is laid out only for rows Qt asks about (the visible ones). Heights are cached per width,
+    # and the laid-out documents of recently shown rows are kept so scrolling repaints without relayout.
+    def __init__(self, view: QListView, cache_size: int = 2000, document_cache_size: int = 200):
+        super().__init__(view)
+        self.view = view
+        self._size_cache: "OrderedDict[tuple, QSize]" = OrderedDict()
+        self._cache_size = cache_size
+        self._document_cache: "OrderedDict[tuple, QTextDocument]" = OrderedDict()
+        self._document_cache_size = document_cache_size
+
+    def _document(self, message: TranscriptMessage, width: int) -> QTextDocument:
+        # Message text never changes, so (id, collapsed state, width) identifies a layout.
+        key = (message.id, message.collapsed, width)
+        doc = self._document_cache.get(key)
+        if doc is not None:
+            self._document_cache.move_to_end(key)
+            return doc
+        doc = QTextDocument()
+        doc.setDefaultFont(self.view.font())
+        doc.setHtml(message.to_html())
+        doc.setTextWidth(width)
+        self._document_cache[key] = doc
+        if len(self._document_cache) > self._document_cache_size:
+            self._document_cache.popitem(last=False)
+        return doc
+
+    def _text_width(self) -> int:
+        # Shared by sizeHint and paint so heights are measured at the width the text is drawn at.
+        return max(50, self.view.viewport().width() - 12)
+
+    def sizeHint(self, option, index):
+        message = index.data(MessageRole)
+        if message is None:
+            return super().sizeHint(option, index)
+        width = self._text_width()
+        key = (message.id, message.collapsed, width)
+        size = self._size_cache.get(key)
+        if size is None:
+            doc = self._document(message, width)
+            size = QSize(width, int(doc.size().height()) + 6)
+            self._size_cache[key] = size
+            if len(self._size_cache) > self._cache_size:
+                self._size_cache.popitem(last=False)
+        else:
+            self._size_cache.move_to_end(key)
+        return size
+
+    def paint(self, painter, option, index):
+        message = index.data(MessageRole)
+        if message is None:
+            return super().paint(painter, option, index)
+        painter.save()
+        if option.state & QStyle.State_Selected:
+            painter.fillRect(option.rect, option.palette.highlight().color().lighter(170))
+        doc = self._document(message, self._text_width())
+        painter.translate(option.rect.left() + 3, option.rect.top() + 3)
+        context = QAbstractTextDocumentLayout.PaintContext()
+        context.palette.setColor(QPalette.Text, option.palette.text().color())
+        doc.documentLayout().draw(painter, context)
+        painter.restore()
+
+    def invalidate(self):
+        self._size_cache.clear()
+        self._document_cache.clear()
+
+class TranscriptView(QListView):
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.transcript = TranscriptModel(self)
+        self.delegate = TranscriptDelegate(self)
+        self.setModel(self.transcript)
+        self.setItemDelegate(self.delegate)
+        self.setVerticalScrollMode(QAbstractItemView.ScrollPerPixel)
+        self.setHorizontalScrollBarPolicy(Qt.ScrollBarAlwaysOff)
+        self.setSelectionMode(QAbstractItemView.SingleSelection)
+        self.setUniformItemSizes(False)
+        self.setLayoutMode(QListView.Batched)
+        self.setBatchSize(50)
+        self.clicked.connect(self._on_clicked)
+        self.verticalScrollBar().valueChanged.connect(self._on_scrolled)
+
+    def append_message(self, sender: str, text: str, color: str, preformatted: bool = False):
+        # Only follow new messages (and page old ones out) when the user is already looking at the bottom.
+        scrollbar = self.verticalScrollBar()
+        at_bottom = scrollbar.value() >= scrollbar.maximum() - 4
+        self.transcript.append(sender, text, color, preformatted, page_out=at_bottom)
+        if at_bottom:
+            self.scrollToBottom()
+
+    def _on_clicked(self, index):
+        if self.transcript.toggle_collapsed(index):
+            self.scheduleDelayedItemsLayout()
+
+    def _on_scrolled(self, value):
+        if value == self.verticalScrollBar().minimum() and self.transcript.has_older():
+            loaded = self.transcript.load_older_page()
+            if loaded:
+                self.scrollTo(self.transcript.index(loaded, 0), QAbstractItemView.PositionAtTop)
+
+    def resizeEvent(self, event):
+        super().resizeEvent(event)
+        if event.size().width() != event.oldSize().width():
+            self.delegate.invalidate()
+            self.scheduleDelayedItemsLayout()
+
+    def changeEvent(self, event):
+        # Cached layouts were measured with the old font.
+        super().changeEvent(event)
+        if event.type() == QEvent.FontChange:
+            self.delegate.invalidate()
+            self.scheduleDelayedItemsLayout()
+
+    def keyPressEvent(self, event):
+        if event.matches(QKeySequence.Copy) and self.currentIndex().isValid():
+            QApplication.clipboard().setText(self.currentIndex().data(Qt.DisplayRole))
+            return
+        super().keyPressEvent(event)
+
+    def cleanup(self):
+        self.transcript.cleanup()
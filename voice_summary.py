@@ -0,0 +1,143 @@
+# voice_summary.py
+# Turns tool output into a short spoken form with templates, so long dumps (process tables,
+# hash hex, multi-day forecasts) are neither sent twice over the socket nor read out by TTS.
+import re
+from typing import Callable, Dict, Optional
+
+TEMPLATES = {
+    "English": {
+        "cpu": "CPU at {value} percent",
+        "memory": "memory {value} percent used",
+        "disk": "root disk {value} percent full",
+        "uptime": "up {days} days and {hours} hours",
+        "system_fallback": "Here is your system information, nya~",
+        "weather": "{city}: {condition}, between {low} and {high} degrees",
+        "weather_more": ", forecast for {days} days on screen",
+        "hash_generated": "{hash_type} generated",
+        "hash_identified": "Looks like an {hash_type} hash",
+        "hash_unknown": "I couldn't identify that hash type",
+        "vuln": "{subject}: {summary}",
+        "error": "Sorry, something went wrong. The details are on screen.",
+    },
+    "Türkçe": {
+        "cpu": "İşlemci yüzde {value}",
+        "memory": "bellek yüzde {value} dolu",
+        "disk": "kök disk yüzde {value} dolu",
+        "uptime": "{days} gün {hours} saattir açık",
+        "system_fallback": "Sistem bilgilerin ekranda, nya~",
+        "weather": "{city}: {condition}, {low} ile {high} derece arası",
+        "weather_more": ", {days} günlük tahmin ekranda",
+        "hash_generated": "{hash_type} oluşturuldu",
+        "hash_identified": "Bu bir {hash_type} özeti gibi görünüyor",
+        "hash_unknown": "Bu özetin türünü belirleyemedim",
+        "vuln": "{subject}: {summary}",
+        "error": "Üzgünüm, bir sorun oluştu. Ayrıntılar ekranda.",
+    },
+}
+
+MAX_SPOKEN_CHARS = 240
+
+_CPU_RE = re.compile(r'^CPU Usage: ([\d.]+)%', re.MULTILINE)
+_MEMORY_RE = re.compile(r'^Used Memory: .*\(([\d.]+)%\)', re.MULTILINE)
+_ROOT_DISK_RE = re.compile(r'^Disk \(.* on / \[.*\(([\d.]+)%\)', re.MULTILINE)
+_UPTIME_RE = re.compile(r'^System Uptime: (\d+) days, (\d+) hours', re.MULTILINE)
+_WEATHER_HEADER_RE = re.compile(r'^Weather for (.+):$', re.MULTILINE)
+_WEATHER_DAY_RE = re.compile(r'^Date: [^,]+, Max: ([-\d.]+)°\w, Min: ([-\d.]+)°\w, Avg: [-\d.]+°\w, Condition: (.+)$', re.MULTILINE)
+_HASH_GENERATED_RE = re.compile(r'^Generated (\w+) hash for')
+_HASH_IDENTIFIED_RE = re.compile(r'looks like an? (\w+) \(likely\)')
+_VULN_RE = re.compile(r"^Vulnerability Info for '(.+?)':\n(.*)", re.DOTALL)
+_FIRST_SENTENCE_RE = re.compile(r'^(.+?[.!?])(\s|$)', re.DOTALL)
+
+def _templates(language: str) -> Dict[str, str]:
+    return TEMPLATES.get(language, TEMPLATES["English"])
+
+def _percent(value: str) -> str:
+    return str(round(float(value)))
+
+def _degrees(value: str) -> str:
+    return str(round(float(value)))
+
+def _shorten(text: str, limit: int = MAX_SPOKEN_CHARS) -> str:
+    text = " ".join(text.split())
+    if len(text) <= limit:
+        return text
+    return text[:limit].rsplit(" ", 1)[0] + "..."
+
+def _first_sentence(text: str) -> str:
+    match = _FIRST_SENTENCE_RE.match(text.strip())
+    return _shorten(match.group(1) if match else text)
+
+def _is_error(text: str) -> bool:
+    return text.startswith("Error") or " Error:" in text.split("\n", 1)[0]
+
+def summarize_system_info(text: str, language: str) -> str:
+    t = _templates(language)
+    parts = []
+    match = _CPU_RE.search(text)
+    if match:
+        parts.append(t["cpu"].format(value=_percent(match.group(1))))
+    match = _MEMORY_RE.search(text)
+    if match:
+        parts.append(t["memory"].format(value=_percent(match.group(1))))
+    match = _ROOT_DISK_RE.search(text)
+    if match:
+        parts.append(t["disk"].format(value=_percent(match.group(1))))
+    match = _UPTIME_RE.search(text)
+    if match:
+        parts.append(t["uptime"].format(days=match.group(1), hours=match.group(2)))
+    if not parts:
+        return t["system_fallback"]
+    spoken = ", ".join(parts)
+    return spoken[0].upper() + spoken[1:] + "."
+
+def summarize_weather(text: str, language: str) -> str:
+    t = _templates(language)
+    header = _WEATHER_HEADER_RE.search(text)
+    days = _WEATHER_DAY_RE.findall(text)
+    if not header or not days:
+        return _first_sentence(text)
+    high, low, condition = days[0]
+    spoken = t["weather"].format(city=header.group(1), condition=condition.strip(),
+                                 low=_degrees(low), high=_degrees(high))
+    if len(days) > 1:
+        spoken += t["weather_more"].format(days=len(days))
+    return spoken + "."
+
+def summarize_hash(text: str, language: str) -> str:
+    t = _templates(language)
+    match = _HASH_GENERATED_RE.match(text)
+    if match:
+        return t["hash_generated"].format(hash_type=match.group(1).upper()) + "."
+    if text.startswith("Checking hash"):
+        match = _HASH_IDENTIFIED_RE.search(text)
+        if match:
+            return t["hash_identified"].format(hash_type=match.group(1).upper()) + "."
+        return t["hash_unknown"] + "."
+    return _first_sentence(text)
+
+def summarize_vulnerability(text: str, language: str) -> str:
+    t = _templates(language)
+    match = _VULN_RE.match(text)
+    if not match:
+        return _first_sentence(text)
+    return t["vuln"].format(subject=match.group(1), summary=_first_sentence(match.group(2)))
+
+VOICE_SUMMARIZERS: Dict[str, Callable[[str, str], str]] = {
+    "SYSTEM_INFO": summarize_system_info,
+    "WEATHER": summarize_weather,
+    "HASH_CHECKER": summarize_hash,
+    "VULN_INFO": summarize_vulnerability,
+}
+
+def summarize_for_voice(response_type: str, text: str, language: str = "English") -> str:
+    if not text:
+        return ""
+    summarizer: Optional[Callable[[str, str], str]] = VOICE_SUMMARIZERS.get(response_type)
+    if summarizer is None:
+        return text
+    if _is_error(text):
+        return _templates(language)["error"]
+    try:
+        return summarizer(text, language)
+    except (ValueError, IndexError, KeyError):
+        return _templates(language)["error"]
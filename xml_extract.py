@@ -0,0 +1,195 @@
+# xml_extract.py
+# Schema-driven extraction of the small XML answers the agents ask the LLM for.
+# LLM output is not reliably well-formed XML (code fences, a bare "&&" in a command, a stray "<"
+# in a description), so fields are located with precompiled per-schema patterns instead of a
+# strict parser, and only the standard XML entities are decoded.
+import re
+from typing import Dict, Iterable, List, Optional, Tuple
+
+_ENTITY_PATTERN = re.compile(r"&(amp|lt|gt|quot|apos|#\d+|#x[0-9a-fA-F]+);")
+_NAMED_ENTITIES = {"amp": "&", "lt": "<", "gt": ">", "quot": '"', "apos": "'"}
+_CDATA_PATTERN = re.compile(r"<!\[CDATA\[(.*?)\]\]>", re.DOTALL)
+
+class XMLExtractError(ValueError):
+    pass
+
+def _decode_entity(match: re.Match) -> str:
+    name = match.group(1)
+    if name[0] != "#":
+        return _NAMED_ENTITIES[name]
+    try:
+        return chr(int(name[2:], 16) if name[1] in "xX" else int(name[1:]))
+    except (ValueError, OverflowError):
+        return match.group(0)
+
+def unescape_text(text: str) -> str:
+    # Bare "&" or "<" (invalid XML, common in LLM output) are kept as they are.
+    if "<![CDATA[" in text:
+        parts = []
+        last = 0
+        for match in _CDATA_PATTERN.finditer(text):
+            parts.append(_ENTITY_PATTERN.sub(_decode_entity, text[last:match.start()]))
+            parts.append(match.group(1))
+            last = match.end()
+        parts.append(_ENTITY_PATTERN.sub(_decode_entity, text[last:]))
+        return "".join(parts)
+    return _ENTITY_PATTERN.sub(_decode_entity, text)
+
+class ExtractedXML:
+    def __init__(self, schema: "XMLSchema", fields: Dict[str, Optional[str]], complete: bool):
+        self.schema = schema
+        self.fields = fields
+        # False when the closing root tag never arrived (truncated or still streaming output).
+        self.complete = complete
+
+    def get(self, name: str, default: Optional[str] = None) -> Optional[str]:
+        # Like ElementTree's `.text`: None when the field is missing or empty.
+        value = self.fields.get(name)
+        return value if value else default
+
+    def __contains__(self, name: str) -> bool:
+        return name in self.fields
+
+class XMLSchema:
+    """Root tag plus the child fields an agent expects, e.g.
+    XMLSchema("weather_request", ["city", "days", "unit", "error"])."""
+
+    def __init__(self, root: str, fields: Iterable[str]):
+        self.root = root
+        self.fields: Tuple[str, ...] = tuple(fields)
+        self._root_open = re.compile(rf"<{root}(?:\s[^>]*)?>")
+        self._root_close = re.compile(rf"</{root}\s*>")
+        self._field_patterns = {
+            name: re.compile(rf"<{name}(?:\s[^>]*?)?(?:/>|>(.*?)</{name}\s*>)", re.DOTALL) for name in self.fields
+        }
+        self._close_tags = {name: f"</{name}" for name in self.fields}
+
+    def _body(self, text: str) -> Tuple[str, bool]:
+        opened = self._root_open.search(text)
+        if opened is None:
+            return text, False
+        closed = self._root_close.search(text, opened.end())
+        if closed is None:
+            return text[opened.end():], False
+        return text[opened.end():closed.start()], True
+
+    def field(self, name: str, text: str, start: int = 0) -> Optional[Tuple[Optional[str], int]]:
+        # (decoded value or None for a self-closing tag, end offset) of the first complete `name` element.
+        if self._close_tags[name] not in text and "/>" not in text:
+            return None
+        match = self._field_patterns[name].search(text, start)
+        if match is None:
+            return None
+        value = match.group(1)
+        return (unescape_text(value) if value is not None else None), match.end()
+
+    def extract(self, text: str) -> Optional[ExtractedXML]:
+        body, complete = self._body(text)
+        fields = {}
+        for name in self.fields:
+            found = self.field(name, body)
+            if found is not None:
+                fields[name] = found[0]
+        if not fields and not complete:
+            return None
+        return ExtractedXML(self, fields, complete)
+
+    def parse(self, text: str) -> ExtractedXML:
+        result = self.extract(text)
+        if result is None:
+            raise XMLExtractError(f"no <{self.root}> element or known fields ({', '.join(self.fields)}) found")
+        return result
+
+class StreamingXMLParser:
+    """Consumes LLM output chunk by chunk and reports each field as soon as its closing tag arrives.
+    Like `parse`, only the root element's body is searched, so a reported value is the one `close()`
+    returns. Scan offsets are kept per tag, so each chunk is searched a bounded number of times."""
+
+    def __init__(self, schema: XMLSchema):
+        self.schema = schema
+        self.fields: Dict[str, Optional[str]] = {}
+        self._buffer = ""
+        root = re.escape(schema.root)
+        # A root tag cut off by the end of the buffer so far.
+        self._partial_open = re.compile(rf"<{root}(?:\s[^>]*)?\Z")
+        self._partial_close = re.compile(rf"</{root}\s*\Z")
+        self._field_partial_close = {name: re.compile(rf"</{re.escape(name)}\s*\Z") for name in schema.fields}
+        self._root_scan = 0
+        self._body_end: Optional[int] = None
+        # Per field: where its first element can start, and where to look for a new closing marker.
+        self._starts: Dict[str, int] = {}
+        self._markers: Dict[str, int] = {}
+
+    @property
+    def text(self) -> str:
+        return self._buffer
+
+    def _scan_tag(self, literal: str, pattern: re.Pattern, partial: re.Pattern) -> Optional[re.Match]:
+        # First `pattern` match at an occurrence of `literal`, like pattern.search on the whole buffer.
+        buffer = self._buffer
+        offset = self._root_scan
+        while True:
+            position = buffer.find(literal, offset)
+            if position < 0:
+                self._root_scan = max(offset, len(buffer) - len(literal) + 1)
+                return None
+            match = pattern.match(buffer, position)
+            if match is not None or partial.match(buffer, position):
+                self._root_scan = position
+                return match
+            offset = position + 1
+
+    def _find_body(self) -> bool:
+        schema = self.schema
+        if not self._starts:
+            opened = self._scan_tag(f"<{schema.root}", schema._root_open, self._partial_open)
+            if opened is None:
+                return False
+            self._root_scan = opened.end()
+            self._starts = dict.fromkeys(schema.fields, opened.end())
+            self._markers = dict.fromkeys(schema.fields, opened.end())
+        if self._body_end is None:
+            closed = self._scan_tag(f"</{schema.root}", schema._root_close, self._partial_close)
+            if closed is not None:
+                self._body_end = closed.start()
+        return True
+
+    def feed(self, chunk: str) -> List[Tuple[str, Optional[str]]]:
+        if not chunk:
+            return []
+        self._buffer += chunk
+        completed = []
+        if ">" not in chunk or not self._find_body():
+            return completed
+        buffer = self._buffer
+        end = len(buffer) if self._body_end is None else self._body_end
+        for name in self.schema.fields:
+            if name in self.fields:
+                continue
+            close_tag = self.schema._close_tags[name]
+            marker = self._markers[name]
+            if buffer.find(close_tag, marker, end) < 0 and buffer.find("/>", marker, end) < 0:
+                self._markers[name] = max(marker, end - len(close_tag) + 1)
+                continue
+            match = self.schema._field_patterns[name].search(buffer, self._starts[name], end)
+            if match is None:
+                # Wait for more text; a closing tag still missing its ">" is checked again.
+                last_tag = buffer.rfind("<", marker, end)
+                if last_tag >= 0 and self._field_partial_close[name].match(buffer, last_tag):
+                    self._markers[name] = last_tag
+                else:
+                    self._markers[name] = max(marker, end - len(close_tag) + 1)
+                candidate = buffer.find(f"<{name}", self._starts[name], end)
+                self._starts[name] = candidate if candidate >= 0 else max(self._starts[name], end - len(name))
+                continue
+            value = match.group(1)
+            value = unescape_text(value) if value is not None else None
+            self.fields[name] = value
+            completed.append((name, value))
+        return completed
+
+    def has(self, *names: str) -> bool:
+        return all(name in self.fields for name in names)
+
+    def close(self) -> ExtractedXML:
+        return self.schema.parse(self._buffer)